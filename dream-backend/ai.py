@@ -1,8 +1,11 @@
 import os
-import httpx
+import asyncio
 import base64
 from dotenv import load_dotenv
 
+import http_client
+import cache
+
 load_dotenv()
 
 # API configuration
@@ -17,16 +20,9 @@ OPENAI_IMAGE_URL = "https://api.openai.com/v1/images/generations"
 # Free Stable Diffusion via Hugging Face
 HUGGINGFACE_IMAGE_URL = "https://api-inference.huggingface.co/models/stabilityai/stable-diffusion-xl-base-1.0"
 
-
-async def analyze_dream(raw_text: str):
-    """
-    Call Groq to interpret dream.
-    Returns poetic_narrative, meaning, symbols, emotions, image_prompt
-    """
-    if not GROQ_API_KEY or GROQ_API_KEY == "your_groq_api_key_here":
-        raise ValueError("GROQ_API_KEY not configured. Please set GROQ_API_KEY in .env file.")
-
-    system_prompt = """
+# Bump whenever ANALYSIS_SYSTEM_PROMPT changes so cached analyses are not reused
+ANALYSIS_PROMPT_VERSION = "1"
+ANALYSIS_SYSTEM_PROMPT = """
 You are a friendly, poetic dream interpreter.
 Given a dream description, respond in JSON with keys:
 - poetic_narrative: a short, beautiful retelling (3-6 sentences)
@@ -37,6 +33,27 @@ Given a dream description, respond in JSON with keys:
 Reply ONLY with JSON.
 """
 
+
+async def analyze_dream(raw_text: str, bypass_cache: bool = False):
+    """
+    Call Groq to interpret dream.
+    Returns poetic_narrative, meaning, symbols, emotions, image_prompt
+    Identical text is served from the analysis cache unless bypass_cache is set
+    (the fresh result still refreshes the cache).
+    """
+    if not GROQ_API_KEY or GROQ_API_KEY == "your_groq_api_key_here":
+        raise ValueError("GROQ_API_KEY not configured. Please set GROQ_API_KEY in .env file.")
+
+    cache_key = cache.analysis_key(raw_text, GROQ_MODEL, ANALYSIS_PROMPT_VERSION)
+    if not bypass_cache:
+        try:
+            cached = await asyncio.to_thread(cache.get_analysis, cache_key)
+        except Exception as e:
+            print(f"⚠️ Analysis cache lookup failed (non-critical): {e}")
+            cached = None
+        if cached is not None:
+            return cached
+
     headers = {
         "Authorization": f"Bearer {GROQ_API_KEY}",
         "Content-Type": "application/json",
@@ -45,15 +62,15 @@ Reply ONLY with JSON.
     payload = {
         "model": GROQ_MODEL,
         "messages": [
-            {"role": "system", "content": system_prompt},
+            {"role": "system", "content": ANALYSIS_SYSTEM_PROMPT},
             {"role": "user", "content": raw_text},
         ],
         "temperature": 0.8,
         "response_format": {"type": "json_object"},
     }
 
-    async with httpx.AsyncClient() as client:
-        resp = await client.post(GROQ_URL, headers=headers, json=payload, timeout=60)
+    async with http_client.client("groq") as client:
+        resp = await client.post(GROQ_URL, headers=headers, json=payload)
         
         if resp.status_code != 200:
             error_data = resp.json() if resp.content else {}
@@ -64,13 +81,18 @@ Reply ONLY with JSON.
     
     import json
     result = json.loads(content)
-    return {
+    analysis = {
         "poetic_narrative": result.get("poetic_narrative", ""),
         "meaning": result.get("meaning", ""),
         "symbols": result.get("symbols", ""),
         "emotions": result.get("emotions", ""),
         "image_prompt": result.get("image_prompt", ""),
     }
+    try:
+        await asyncio.to_thread(cache.put_analysis, cache_key, analysis)
+    except Exception as e:
+        print(f"⚠️ Analysis cache store failed (non-critical): {e}")
+    return analysis
 
 
 async def generate_dream_image(image_prompt: str, dream_text: str = "", use_free: bool = False):
@@ -136,7 +158,7 @@ async def _generate_image_paid(image_prompt: str, dream_text: str = ""):
     if len(enhanced_prompt) > 1000:
         enhanced_prompt = enhanced_prompt[:1000] + "..."
     
-    async with httpx.AsyncClient() as client:
+    async with http_client.client("openai") as client:
         resp = await client.post(
             OPENAI_IMAGE_URL,
             headers={
@@ -149,7 +171,6 @@ async def _generate_image_paid(image_prompt: str, dream_text: str = ""):
                 "size": "1024x1024",
                 "quality": "standard",
             },
-            timeout=90,
         )
         
         if resp.status_code != 200:
@@ -162,12 +183,8 @@ async def _generate_image_paid(image_prompt: str, dream_text: str = ""):
     return image_url
 
 
-async def rewrite_dream(raw_text: str, style: str):
-    """
-    Rewrite a dream in a specific narrative style.
-    Uses Groq for free text generation.
-    Returns the rewritten narrative.
-    """
+def _rewrite_request(raw_text: str, style: str):
+    """Build the Groq headers and payload for a style rewrite"""
     if not GROQ_API_KEY or GROQ_API_KEY == "your_groq_api_key_here":
         raise ValueError("GROQ_API_KEY not configured. Please set GROQ_API_KEY in .env file.")
     
@@ -205,9 +222,19 @@ Make it 3-5 sentences, vivid and engaging.
         ],
         "temperature": 0.9,
     }
+    return headers, payload
+
+
+async def rewrite_dream(raw_text: str, style: str):
+    """
+    Rewrite a dream in a specific narrative style.
+    Uses Groq for free text generation.
+    Returns the rewritten narrative.
+    """
+    headers, payload = _rewrite_request(raw_text, style)
 
-    async with httpx.AsyncClient() as client:
-        resp = await client.post(GROQ_URL, headers=headers, json=payload, timeout=60)
+    async with http_client.client("groq") as client:
+        resp = await client.post(GROQ_URL, headers=headers, json=payload)
         
         if resp.status_code != 200:
             error_data = resp.json() if resp.content else {}
@@ -218,10 +245,68 @@ Make it 3-5 sentences, vivid and engaging.
     return content.strip()
 
 
+async def stream_rewrite_dream(raw_text: str, style: str):
+    """
+    Same as rewrite_dream, but yields text fragments as Groq streams them
+    (OpenAI-compatible `stream: true` server-sent events).
+    """
+    headers, payload = _rewrite_request(raw_text, style)
+    payload["stream"] = True
+
+    import json
+    async with http_client.client("groq") as client:
+        async with client.stream("POST", GROQ_URL, headers=headers, json=payload) as resp:
+            if resp.status_code != 200:
+                body = await resp.aread()
+                error_data = json.loads(body) if body else {}
+                raise Exception(f"Groq API error: {error_data.get('error', {}).get('message', 'Unknown error')}")
+
+            async for line in resp.aiter_lines():
+                if not line.startswith("data:"):
+                    continue
+                data = line[len("data:"):].strip()
+                if data == "[DONE]":
+                    break
+                chunk = json.loads(data)
+                choices = chunk.get("choices") or [{}]
+                delta = choices[0].get("delta", {}).get("content")
+                if delta:
+                    yield delta
+
+
 async def explain_symbol(symbol: str):
     """
     Provide a detailed explanation of what a dream symbol might mean.
-    Uses Groq for free text generation.
+    Explanations don't depend on the user, so they are shared: in-memory LRU,
+    then the symbol_explanations table, then Groq. Concurrent first requests
+    for the same symbol share a single upstream call.
+    """
+    key = cache.normalize_symbol(symbol)
+    cached = cache.symbol_memory.get(key)
+    if cached is not None:
+        cache.symbol_stats.hits += 1
+        return cached
+
+    async def load():
+        stored = await asyncio.to_thread(cache.get_symbol, key)
+        if stored is not None:
+            cache.symbol_stats.hits += 1
+        else:
+            cache.symbol_stats.misses += 1
+            stored = await _fetch_symbol_explanation(key)
+            try:
+                await asyncio.to_thread(cache.put_symbol, key, stored)
+            except Exception as e:
+                print(f"⚠️ Symbol cache store failed (non-critical): {e}")
+        cache.symbol_memory.set(key, stored)
+        return stored
+
+    return await cache.symbol_loads.do(key, load)
+
+
+async def _fetch_symbol_explanation(symbol: str):
+    """
+    Ask Groq to explain a dream symbol.
     Returns a comprehensive explanation with cultural, psychological, and personal context.
     """
     if not GROQ_API_KEY or GROQ_API_KEY == "your_groq_api_key_here":
@@ -256,8 +341,8 @@ Be insightful, educational, and respectful of different interpretations.
         "response_format": {"type": "json_object"},
     }
 
-    async with httpx.AsyncClient() as client:
-        resp = await client.post(GROQ_URL, headers=headers, json=payload, timeout=60)
+    async with http_client.client("groq") as client:
+        resp = await client.post(GROQ_URL, headers=headers, json=payload)
         
         if resp.status_code != 200:
             error_data = resp.json() if resp.content else {}
@@ -270,11 +355,13 @@ Be insightful, educational, and respectful of different interpretations.
     return result
 
 
-async def analyze_dream_patterns(dreams_data: list):
+async def analyze_dream_patterns(dreams_data: list, previous_analysis: dict | None = None, previous_count: int = 0):
     """
     Analyze patterns across multiple dreams.
     Uses Groq for free text generation.
     dreams_data should be a list of dicts with: title, raw_text, symbols, emotions, created_at
+    When previous_analysis is given, dreams_data only holds the dreams added since
+    that analysis (which covered previous_count dreams) and the model updates it.
     Returns comprehensive pattern analysis.
     """
     if not GROQ_API_KEY or GROQ_API_KEY == "your_groq_api_key_here":
@@ -282,7 +369,7 @@ async def analyze_dream_patterns(dreams_data: list):
     
     # Prepare dream summaries for analysis
     dream_summaries = []
-    for dream in dreams_data[:10]:  # Last 10 dreams
+    for dream in dreams_data:  # Callers send bounded batches (see PATTERN_BATCH_SIZE in main.py)
         summary = f"Dream: {dream.get('title', 'Untitled')}\n"
         summary += f"Text: {dream.get('raw_text', '')[:200]}\n"
         # Check for symbols and emotions directly (from main.py structure)
@@ -293,6 +380,15 @@ async def analyze_dream_patterns(dreams_data: list):
         dream_summaries.append(summary)
     
     combined_dreams = "\n\n---\n\n".join(dream_summaries)
+    if previous_analysis:
+        import json
+        combined_dreams = (
+            f"Previous pattern analysis covering the dreamer's {previous_count} earlier dreams:\n"
+            f"{json.dumps(previous_analysis)}\n\n"
+            f"New dreams since that analysis (oldest first):\n\n{combined_dreams}\n\n"
+            "Update the previous analysis so it reflects the whole dream history, "
+            "keeping earlier insights that still hold."
+        )
     
     system_prompt = """
 You are a dream pattern analyst specializing in pattern recognition across multiple dreams.
@@ -331,7 +427,7 @@ Be insightful, supportive, and focus on patterns that could help the dreamer und
         "response_format": {"type": "json_object"},
     }
 
-    async with httpx.AsyncClient() as client:
+    async with http_client.client("groq") as client:
         resp = await client.post(GROQ_URL, headers=headers, json=payload, timeout=90)
         
         if resp.status_code != 200:
@@ -1,23 +1,38 @@
 from datetime import datetime, timedelta
+from concurrent.futures import ProcessPoolExecutor
 from jose import JWTError, jwt
+import asyncio
 import bcrypt
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, HTTPException, Query, status
 from fastapi.security import OAuth2PasswordBearer
-from sqlalchemy.orm import Session
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, make_transient_to_detached
 import os
 from dotenv import load_dotenv
 
-from database import get_db
+from database import get_async_db, get_db
+import cache
 import models
 
 load_dotenv()
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/login")
+oauth2_scheme_optional = OAuth2PasswordBearer(tokenUrl="auth/login", auto_error=False)
 
 SECRET_KEY = os.getenv("SECRET_KEY", "change_me")
 ALGORITHM = os.getenv("ALGORITHM", "HS256")
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "60"))
 
+# bcrypt runs in a dedicated process pool so hashing bursts don't tie up
+# uvicorn's threadpool; beyond HASH_MAX_PENDING queued calls we answer 429.
+HASH_WORKERS = int(os.getenv("HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+HASH_MAX_PENDING = int(os.getenv("HASH_MAX_PENDING", str(HASH_WORKERS * 8)))
+
+_hash_executor: ProcessPoolExecutor | None = None
+_hash_pending = 0
+_hash_rejected = 0
+
 
 def hash_password(password: str):
     # Generate a salt and hash the password
@@ -31,6 +46,55 @@ def verify_password(plain: str, hashed: str):
     return bcrypt.checkpw(plain.encode('utf-8'), hashed.encode('utf-8'))
 
 
+def _hash_pool() -> ProcessPoolExecutor:
+    global _hash_executor
+    if _hash_executor is None:
+        _hash_executor = ProcessPoolExecutor(max_workers=HASH_WORKERS)
+    return _hash_executor
+
+
+async def _run_hashing(fn, *args):
+    global _hash_pending, _hash_rejected
+    if _hash_pending >= HASH_MAX_PENDING:
+        _hash_rejected += 1
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Too many requests right now. Please try again in a moment.",
+            headers={"Retry-After": "1"},
+        )
+    _hash_pending += 1
+    try:
+        return await asyncio.get_running_loop().run_in_executor(_hash_pool(), fn, *args)
+    finally:
+        _hash_pending -= 1
+
+
+async def hash_password_async(password: str):
+    """hash_password on the hashing pool (use from async endpoints)"""
+    return await _run_hashing(hash_password, password)
+
+
+async def verify_password_async(plain: str, hashed: str):
+    """verify_password on the hashing pool (use from async endpoints)"""
+    return await _run_hashing(verify_password, plain, hashed)
+
+
+def hashing_stats() -> dict:
+    return {
+        "workers": HASH_WORKERS,
+        "pending": _hash_pending,
+        "max_pending": HASH_MAX_PENDING,
+        "rejected": _hash_rejected,
+    }
+
+
+def shutdown_hashing() -> None:
+    global _hash_executor
+    if _hash_executor is not None:
+        _hash_executor.shutdown(wait=False, cancel_futures=True)
+        _hash_executor = None
+
+
 def create_access_token(data: dict, expires_delta: timedelta | None = None):
     to_encode = data.copy()
     expire = datetime.utcnow() + (expires_delta or timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES))
@@ -39,28 +103,149 @@ def create_access_token(data: dict, expires_delta: timedelta | None = None):
 
 
 def get_user_by_email(db: Session, email: str):
-    return db.query(models.User).filter(models.User.email == email).first()
+    """Case-insensitive lookup served by the lower(email) index; an exact match wins ties"""
+    return (
+        db.query(models.User)
+        .filter(func.lower(models.User.email) == email.strip().lower())
+        .order_by((models.User.email == email).desc(), models.User.id)
+        .first()
+    )
+
+
+# Credentials never go into the cache; routes that need them use load_user_fresh
+_UNCACHED_USER_FIELDS = {"hashed_password", "reset_token", "reset_token_expires", "otp_code", "otp_expires"}
+
+
+def _cache_user(user: models.User) -> None:
+    """
+    Snapshot a user for user_from_token. invalidate_user only clears this
+    worker's cache: other workers keep serving their snapshot for up to
+    USER_CACHE_TTL_SECONDS after a change.
+    """
+    cache.users.set(user.id, {
+        c.key: getattr(user, c.key)
+        for c in models.User.__table__.columns
+        if c.key not in _UNCACHED_USER_FIELDS
+    })
+
+
+def load_user_fresh(db: Session, user_id: int) -> models.User | None:
+    """Primary-key read that bypasses the cache (for password checks and other credential use)"""
+    return db.get(models.User, user_id, populate_existing=True)
+
+
+def _attach_cached_user(db: Session, values: dict) -> models.User:
+    """Rebuild a cached user as a persistent instance of `db` without querying"""
+    user = models.User(**values)
+    make_transient_to_detached(user)
+    return db.merge(user, load=False)
+
+
+def invalidate_user(user_id: int) -> None:
+    """Drop a user from the auth cache (call after password/account changes)"""
+    cache.users.pop(user_id)
 
 
 def get_current_user(
     token: str = Depends(oauth2_scheme),
     db: Session = Depends(get_db),
 ):
-    credentials_exception = HTTPException(
+    return user_from_token(token, db)
+
+
+def get_stream_user(
+    header_token: str | None = Depends(oauth2_scheme_optional),
+    token: str | None = Query(None),
+    db: Session = Depends(get_db),
+):
+    """Like get_current_user, but also accepts ?token= (EventSource can't send headers)"""
+    if not (header_token or token):
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Not authenticated")
+    return user_from_token(header_token or token, db)
+
+
+def _credentials_exception() -> HTTPException:
+    return HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials"
     )
+
+
+def _token_claims(token: str) -> tuple[str, int | None]:
+    """(email, user id) from a valid access token; the id is None for older tokens"""
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        email: str | None = payload.get("sub")
-        if email is None:
-            raise credentials_exception
     except JWTError:
-        raise credentials_exception
+        raise _credentials_exception()
+    email: str | None = payload.get("sub")
+    if email is None:
+        raise _credentials_exception()
+    return email, payload.get("uid")
+
+
+def _cached_user_values(email: str, user_id: int | None) -> dict | None:
+    if user_id is None:
+        return None
+    values = cache.users.get(user_id)
+    if values is not None and values["email"] == email:
+        cache.user_stats.hits += 1
+        return values
+    cache.user_stats.misses += 1
+    return None
+
+
+def user_from_token(token: str, db: Session) -> models.User:
+    """
+    Resolve an access token to a user (raises 401 otherwise).
+    Tokens carry the user id (`uid`), so a cache hit costs no DB round trip
+    and a miss is a primary-key lookup; older email-only tokens still work.
+    """
+    email, user_id = _token_claims(token)
+    values = _cached_user_values(email, user_id)
+    if values is not None:
+        return _attach_cached_user(db, values)
+
+    if user_id is not None:
+        user = db.get(models.User, user_id)
+        if user is not None and user.email != email:
+            user = None
+    else:
+        user = get_user_by_email(db, email=email)
+
+    if user is None:
+        raise _credentials_exception()
+    _cache_user(user)
+    return user
+
+
+async def get_current_user_async(
+    token: str = Depends(oauth2_scheme),
+    db: AsyncSession = Depends(get_async_db),
+) -> models.User:
+    """get_current_user for async endpoints on the async engine (no threadpool hop)"""
+    email, user_id = _token_claims(token)
+    values = _cached_user_values(email, user_id)
+    if values is not None:
+        user = models.User(**values)
+        make_transient_to_detached(user)
+        return await db.merge(user, load=False)
+
+    if user_id is not None:
+        user = await db.get(models.User, user_id)
+        if user is not None and user.email != email:
+            user = None
+    else:
+        result = await db.execute(
+            select(models.User)
+            .where(func.lower(models.User.email) == email.strip().lower())
+            .order_by((models.User.email == email).desc(), models.User.id)
+            .limit(1)
+        )
+        user = result.scalars().first()
 
-    user = get_user_by_email(db, email=email)
     if user is None:
-        raise credentials_exception
+        raise _credentials_exception()
+    _cache_user(user)
     return user
 
 
@@ -0,0 +1,191 @@
+"""
+Load test: async endpoints keep scaling past the threadpool limit.
+Runs the app under uvicorn in a child process against a scratch SQLite
+database where every statement is made to take --db-latency-ms (a stand-in
+for a networked Postgres round trip), then drives increasing numbers of
+concurrent clients at two routes doing the same one-row read:
+
+  async  GET /dreams/{id}                       (AsyncSession, no threadpool)
+  sync   GET /analytics/symbols/{symbol}/dreams (def route, one of Starlette's 40 threads)
+
+The sync route flattens out at about 40 / latency requests per second once
+concurrency passes the 40 threads; the async one keeps climbing until the
+connection pool (sized to the highest concurrency here) or the CPU runs
+out. The server's CPU use is printed per level: client and server share
+the machine, so on one or two cores the async column is CPU-bound early.
+
+Usage: python bench_async_throughput.py [--levels 20,40,80,160] [--db-latency-ms 1000] [--seconds 10]
+"""
+import argparse
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+from contextlib import AsyncExitStack
+
+import httpx
+
+THREADPOOL_LIMIT = 40  # anyio's default thread limiter, used by Starlette for def routes
+
+
+def cpu_seconds(pid: int) -> float:
+    with open(f"/proc/{pid}/stat") as f:
+        fields = f.read().rsplit(")", 1)[1].split()
+    return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def serve(port: int, latency: float) -> None:
+    """Child process: seed the scratch database, add per-statement latency, run the app"""
+    from sqlalchemy import event
+    import uvicorn
+
+    import dream_tags
+    import main
+    import models
+    from database import SessionLocal, async_engine, engine
+
+    main.Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    user = models.User(email="bench@example.com", username="bench", hashed_password="x", email_verified="True")
+    db.add(user)
+    db.flush()
+    dream = models.Dream(user_id=user.id, title="Bench", raw_text="Flying over water")
+    db.add(dream)
+    db.flush()
+    db.add(models.DreamInterpretation(dream_id=dream.id, meaning="m", symbols="water", emotions="calm"))
+    dream_tags.replace_tags(db, dream.id, user.id, "water", "calm")
+    db.commit()
+    db.close()
+
+    def slow_statement(statement):
+        if not statement.startswith("PRAGMA"):  # Connection setup isn't a per-request cost
+            time.sleep(latency)
+
+    # sqlite3 calls the trace callback on the thread running the statement: a
+    # threadpool thread for the sync engine, aiosqlite's own thread for the async one
+    @event.listens_for(engine, "connect")
+    def _slow_sync(dbapi_connection, connection_record):
+        dbapi_connection.set_trace_callback(slow_statement)
+
+    @event.listens_for(async_engine.sync_engine, "connect")
+    def _slow_async(dbapi_connection, connection_record):
+        dbapi_connection.await_(dbapi_connection._connection.set_trace_callback(slow_statement))
+
+    engine.dispose()
+    uvicorn.run(main.app, host="127.0.0.1", port=port, log_level="warning")
+
+
+async def drive(clients: list[httpx.AsyncClient], url: str, seconds: float) -> tuple[float, Counter]:
+    """Closed-loop clients hammering `url`; returns (requests/second, errors by kind)"""
+    completed = 0
+    errors: Counter = Counter()
+    deadline = time.perf_counter() + seconds
+
+    async def worker(client: httpx.AsyncClient):
+        nonlocal completed, errors
+        while time.perf_counter() < deadline:
+            try:
+                response = await client.get(url)
+            except httpx.TransportError as e:
+                errors[type(e).__name__] += 1
+                continue
+            if response.status_code == 200:
+                completed += 1
+            else:
+                errors[f"HTTP {response.status_code}"] += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker(client) for client in clients))
+    return completed / (time.perf_counter() - start), errors
+
+
+async def run(server_pid: int, port: int, levels: list[int], seconds: float, latency_ms: float) -> None:
+    import auth
+    token = auth.create_access_token({"sub": "bench@example.com", "uid": 1})
+    base = f"http://127.0.0.1:{port}"
+    routes = {"async": f"{base}/dreams/1", "sync": f"{base}/analytics/symbols/water/dreams"}
+
+    # One single-connection client per simulated user: a shared httpx pool
+    # with hundreds of connections costs the load generator more CPU than the server
+    async with AsyncExitStack() as stack:
+        clients = [
+            await stack.enter_async_context(httpx.AsyncClient(
+                limits=httpx.Limits(max_connections=1),
+                timeout=60,
+                headers={"Authorization": f"Bearer {token}"},
+            ))
+            for _ in range(max(levels))
+        ]
+        client = clients[0]
+        for _ in range(100):
+            try:
+                await client.get(f"{base}/health")
+                break
+            except httpx.TransportError:
+                await asyncio.sleep(0.1)
+        for url in routes.values():
+            (await client.get(url)).raise_for_status()  # Warm the user cache and both pools
+
+        print(f"Per-statement DB latency {latency_ms:g} ms, {seconds:g}s per level, threadpool limit {THREADPOOL_LIMIT}")
+        print(f"{'clients':>8} {'async req/s':>12} {'server CPU':>11} {'sync req/s':>12} {'server CPU':>11}")
+        for concurrency in levels:
+            row = f"{concurrency:>8}"
+            errors: Counter = Counter()
+            for url in routes.values():
+                await drive(clients[:concurrency], url, 1)  # Grow the pools to this level first
+                cpu_before, start = cpu_seconds(server_pid), time.perf_counter()
+                rate, failed = await drive(clients[:concurrency], url, seconds)
+                busy = (cpu_seconds(server_pid) - cpu_before) / (time.perf_counter() - start)
+                row += f" {rate:>12.0f} {busy:>10.0%}"
+                errors += failed
+            print(row + (f"  errors: {dict(errors)}" if errors else ""), flush=True)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--levels", default="20,40,80,160")
+    parser.add_argument("--db-latency-ms", type=float, default=1000)
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--serve", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.serve, args.db_latency_ms / 1000)
+        return 0
+
+    levels = [int(level) for level in args.levels.split(",")]
+    scratch_dir = tempfile.mkdtemp(prefix="dream-bench-async-")
+    env = {**os.environ, "DATABASE_URL": f"sqlite:///{os.path.join(scratch_dir, 'bench.db')}"}
+    env.pop("ASYNC_DATABASE_URL", None)
+    # Size each engine's pool for the top level so the pool isn't what caps the async route
+    env.setdefault("DB_POOL_SIZE", str(max(levels)))
+    env.setdefault("DB_MAX_OVERFLOW", "0")
+    os.environ.update(env)
+    port = free_port()
+    server = subprocess.Popen(
+        [sys.executable, os.path.abspath(__file__), "--serve", str(port), "--db-latency-ms", str(args.db_latency_ms)],
+        env=env,
+    )
+    try:
+        asyncio.run(run(server.pid, port, levels, args.seconds, args.db_latency_ms))
+    finally:
+        server.terminate()
+        try:
+            server.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            server.kill()  # Graceful shutdown drains the job workers through the slowed-down engine
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,105 @@
+"""
+Microbenchmark: email template renders per second.
+Times the registry path (email_service.render on templates compiled at
+registration) against compiling a string.Template on every render, the way
+templates used to be built, and times turning a 1,000-recipient bulk batch
+into MIME messages with and without the per-batch _RenderCache.
+
+Usage: python bench_email_render.py [--seconds 1.0] [--min-renders-per-sec N]
+Exits non-zero if the registry path falls below --min-renders-per-sec.
+"""
+import argparse
+import sys
+import textwrap
+import time
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+from html import escape as html_escape
+from string import Template
+
+import email_service
+
+BULK_RECIPIENTS = 1000
+
+
+def rate(fn, seconds: float) -> float:
+    """Calls per second of fn over roughly `seconds`"""
+    calls = 0
+    batch = 1
+    start = time.perf_counter()
+    while True:
+        for _ in range(batch):
+            fn()
+        calls += batch
+        elapsed = time.perf_counter() - start
+        if elapsed >= seconds:
+            return calls / elapsed
+        batch = min(batch * 2, 10_000)
+
+
+def source(compiled) -> str:
+    """A compiled template's $placeholder source, for the uncompiled baseline"""
+    out = [compiled._literals[0]]
+    for field, literal in zip(compiled._fields, compiled._literals[1:]):
+        out += ["$" + field, literal]
+    return "".join(out)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--seconds", type=float, default=1.0)
+    parser.add_argument("--min-renders-per-sec", type=float, default=0)
+    args = parser.parse_args()
+
+    params = {"otp_code": "123456"}
+    otp = email_service.TEMPLATES["otp"]
+    raw = (source(otp.subject), source(otp.text), source(otp.html))
+
+    def uncompiled():
+        escaped = {key: html_escape(str(value)) for key, value in params.items()}
+        return (
+            Template(textwrap.dedent(raw[0])).substitute(params),
+            Template(textwrap.dedent(raw[1])).substitute(params),
+            Template(textwrap.dedent(raw[2])).substitute(escaped),
+        )
+
+    assert uncompiled() == tuple(email_service.render("otp", params))
+    registry = rate(lambda: email_service.render("otp", params), args.seconds)
+    baseline = rate(uncompiled, args.seconds)
+    print(f"render('otp'):           {registry:>12,.0f} renders/s")
+    print(f"compile + render:        {baseline:>12,.0f} renders/s  ({registry / baseline:.1f}x slower)")
+
+    batch = [
+        {"id": i, "to_email": f"user{i}@example.com", "template": "otp", "params": params}
+        for i in range(BULK_RECIPIENTS)
+    ]
+
+    def cached_batch():
+        renders = email_service._RenderCache()
+        return [email_service._mime_message(message, renders) for message in batch]
+
+    def uncached_batch():
+        messages = []
+        for message in batch:
+            rendered = email_service.render(message["template"], message["params"])
+            msg = MIMEMultipart("alternative")
+            msg["Subject"] = rendered.subject
+            msg["To"] = message["to_email"]
+            msg.attach(MIMEText(rendered.text, "plain"))
+            msg.attach(MIMEText(rendered.html, "html"))
+            messages.append(msg)
+        return messages
+
+    cached = rate(cached_batch, args.seconds) * BULK_RECIPIENTS
+    uncached = rate(uncached_batch, args.seconds) * BULK_RECIPIENTS
+    print(f"bulk MIME, render cache: {cached:>12,.0f} messages/s")
+    print(f"bulk MIME, per message:  {uncached:>12,.0f} messages/s  ({cached / uncached:.1f}x slower)")
+
+    if registry < args.min_renders_per_sec:
+        print(f"❌ render('otp') below {args.min_renders_per_sec:,.0f} renders/s")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
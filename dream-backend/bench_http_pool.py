@@ -0,0 +1,167 @@
+"""
+Benchmark: pooled provider clients vs a new client per call.
+Starts a local TLS stub server (self-signed certificate, HTTP/1.1 keep-alive)
+and times the same sequence of requests through http_client's shared client
+and through a fresh httpx.AsyncClient per request, which is what the provider
+calls did before pooling. The stub counts accepted connections, i.e. TCP+TLS
+handshakes, for each mode.
+
+Usage: python bench_http_pool.py [--requests N] [--rtt-ms MS]
+--rtt-ms adds a delay before each new connection is served, to approximate
+a real network round trip on top of loopback.
+"""
+import argparse
+import asyncio
+import datetime
+import os
+import ssl
+import statistics
+import sys
+import tempfile
+import time
+
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+from cryptography.x509.oid import NameOID
+
+_cert_dir = tempfile.mkdtemp(prefix="dream-bench-http-")
+CERT_FILE = os.path.join(_cert_dir, "cert.pem")
+KEY_FILE = os.path.join(_cert_dir, "key.pem")
+# httpx reads SSL_CERT_FILE when it builds a client's SSL context, so both modes trust the stub
+os.environ["SSL_CERT_FILE"] = CERT_FILE
+
+import httpx  # noqa: E402
+
+import http_client  # noqa: E402
+
+BODY = b'{"choices": [{"message": {"content": "ok"}}]}'
+
+
+def write_certificate() -> None:
+    key = ec.generate_private_key(ec.SECP256R1())
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "localhost")])
+    now = datetime.datetime.now(datetime.timezone.utc)
+    cert = (
+        x509.CertificateBuilder()
+        .subject_name(name)
+        .issuer_name(name)
+        .public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now - datetime.timedelta(minutes=5))
+        .not_valid_after(now + datetime.timedelta(days=1))
+        .add_extension(x509.SubjectAlternativeName([x509.DNSName("localhost")]), critical=False)
+        .add_extension(x509.BasicConstraints(ca=True, path_length=None), critical=True)
+        .sign(key, hashes.SHA256())
+    )
+    with open(CERT_FILE, "wb") as f:
+        f.write(cert.public_bytes(serialization.Encoding.PEM))
+    with open(KEY_FILE, "wb") as f:
+        f.write(key.private_bytes(
+            serialization.Encoding.PEM,
+            serialization.PrivateFormat.PKCS8,
+            serialization.NoEncryption(),
+        ))
+
+
+class StubServer:
+    """Minimal keep-alive HTTPS server that answers every request with BODY"""
+    def __init__(self, rtt: float) -> None:
+        self.rtt = rtt
+        self.connections = 0
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self.connections += 1
+        if self.rtt:
+            await asyncio.sleep(self.rtt)
+        try:
+            while True:
+                head = await reader.readuntil(b"\r\n\r\n")
+                length = 0
+                for line in head.split(b"\r\n"):
+                    if line.lower().startswith(b"content-length:"):
+                        length = int(line.split(b":", 1)[1])
+                if length:
+                    await reader.readexactly(length)
+                writer.write(
+                    b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n"
+                    b"Content-Length: " + str(len(BODY)).encode() + b"\r\n\r\n" + BODY
+                )
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def start(self) -> tuple[asyncio.AbstractServer, int]:
+        context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+        context.load_cert_chain(CERT_FILE, KEY_FILE)
+        context.set_alpn_protocols(["http/1.1"])
+        server = await asyncio.start_server(self.handle, "127.0.0.1", 0, ssl=context)
+        return server, server.sockets[0].getsockname()[1]
+
+
+async def time_requests(url: str, requests: int, pooled: bool) -> list[float]:
+    timings = []
+    for _ in range(requests):
+        start = time.perf_counter()
+        if pooled:
+            async with http_client.client("groq") as client:
+                response = await client.post(url, json={"prompt": "hi"})
+        else:
+            async with httpx.AsyncClient() as client:
+                response = await client.post(url, json={"prompt": "hi"})
+        response.raise_for_status()
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def report(label: str, timings: list[float], connections: int) -> None:
+    timings = sorted(timings)
+    p99 = timings[min(len(timings) - 1, int(len(timings) * 0.99))]
+    print(
+        f"{label:<10} mean {statistics.mean(timings):7.2f} ms  p50 {statistics.median(timings):7.2f} ms"
+        f"  p99 {p99:7.2f} ms  new handshakes {connections}"
+    )
+
+
+async def run(requests: int, rtt_ms: float) -> None:
+    write_certificate()
+    stub = StubServer(rtt_ms / 1000)
+    server, port = await stub.start()
+    url = f"https://localhost:{port}/openai/v1/chat/completions"
+    await http_client.startup()
+    try:
+        # One warm-up call each so imports and certificate loading don't skew the first sample
+        await time_requests(url, 1, pooled=True)
+        await time_requests(url, 1, pooled=False)
+
+        stub.connections = 0
+        per_call = await time_requests(url, requests, pooled=False)
+        per_call_connections = stub.connections
+
+        stub.connections = 0
+        pooled = await time_requests(url, requests, pooled=True)
+        pooled_connections = stub.connections
+    finally:
+        await http_client.shutdown()
+        server.close()
+        await server.wait_closed()
+
+    print(f"{requests} sequential POSTs to a local TLS stub (added RTT {rtt_ms:g} ms per new connection)")
+    report("per-call", per_call, per_call_connections)
+    report("pooled", pooled, pooled_connections)
+    print(f"Pooled is {statistics.mean(per_call) / statistics.mean(pooled):.1f}x faster per request")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--rtt-ms", type=float, default=0)
+    args = parser.parse_args()
+    asyncio.run(run(args.requests, args.rtt_ms))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,176 @@
+"""
+Benchmark: server memory while the image proxy streams many large images.
+Runs the app under uvicorn in a child process (scratch SQLite database) and a
+local upstream stub that serves 1-2 MB images slowly, in chunks. Fires
+CONCURRENCY simultaneous /api/images/proxy requests and samples the server's
+RSS throughout. Streaming keeps the peak close to the baseline; buffering
+whole bodies would add roughly CONCURRENCY x 1.5 MB. Exits non-zero if the
+peak grows by more than --max-growth-mb.
+
+Usage: python bench_image_proxy_rss.py [--concurrency 200] [--max-growth-mb 100]
+"""
+import argparse
+import asyncio
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+UPSTREAM_CHUNK = 64 * 1024
+UPSTREAM_SECONDS = 2.0  # Spread each body over this long so all requests overlap
+
+
+def rss_mb(pid: int) -> float:
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def serve(port: int) -> None:
+    """Child process: the app, with the local stub host allowed as an image source"""
+    import uvicorn
+
+    import main
+    import models
+    from database import SessionLocal
+
+    main.Base.metadata.create_all(bind=main.engine)
+    db = SessionLocal()
+    db.add(models.User(email="bench@example.com", username="bench", hashed_password="x", email_verified="True"))
+    db.commit()
+    db.close()
+    main.IMAGE_PROXY_ALLOWED_DOMAINS += ("localhost",)
+    uvicorn.run(main.app, host="127.0.0.1", port=port, log_level="warning")
+
+
+async def upstream(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+    """Answer one GET with a random 1-2 MB body, trickled out in chunks"""
+    try:
+        await reader.readuntil(b"\r\n\r\n")
+        size = random.randint(1024 * 1024, 2 * 1024 * 1024)
+        writer.write(
+            b"HTTP/1.1 200 OK\r\nContent-Type: image/png\r\nConnection: close\r\n"
+            b"Content-Length: " + str(size).encode() + b"\r\n\r\n"
+        )
+        chunks = -(-size // UPSTREAM_CHUNK)
+        for i in range(chunks):
+            writer.write(b"\0" * min(UPSTREAM_CHUNK, size - i * UPSTREAM_CHUNK))
+            await writer.drain()
+            await asyncio.sleep(UPSTREAM_SECONDS / chunks)
+    except (asyncio.IncompleteReadError, ConnectionError, asyncio.CancelledError):
+        pass  # Client went away, or the benchmark is shutting down
+    finally:
+        writer.close()
+
+
+async def fetch(client: httpx.AsyncClient, url: str) -> int:
+    received = 0
+    async with client.stream("GET", url) as response:
+        response.raise_for_status()
+        async for chunk in response.aiter_raw():
+            received += len(chunk)
+    return received
+
+
+async def run(server_pid: int, port: int, concurrency: int, max_growth_mb: float) -> bool:
+    upstream_server = await asyncio.start_server(upstream, "127.0.0.1", 0)
+    upstream_port = upstream_server.sockets[0].getsockname()[1]
+    token = auth_token()
+    base = f"http://127.0.0.1:{port}"
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(limits=limits, timeout=60, headers={"Authorization": f"Bearer {token}"}) as client:
+        for _ in range(100):
+            try:
+                await client.get(f"{base}/health")
+                break
+            except httpx.TransportError:
+                await asyncio.sleep(0.1)
+        urls = [
+            f"{base}/api/images/proxy?url=http://localhost:{upstream_port}/image-{i}.png"
+            for i in range(concurrency)
+        ]
+        # Warm up once so lazily imported code and pools are already counted in the baseline
+        await fetch(client, urls[0])
+        baseline = rss_mb(server_pid)
+
+        samples = []
+        done = asyncio.Event()
+
+        async def sample():
+            while not done.is_set():
+                samples.append(rss_mb(server_pid))
+                await asyncio.sleep(0.05)
+
+        sampler = asyncio.create_task(sample())
+        start = time.perf_counter()
+        try:
+            sizes = await asyncio.gather(*(fetch(client, url) for url in urls))
+        finally:
+            done.set()
+            await sampler
+        elapsed = time.perf_counter() - start
+
+    upstream_server.close()
+    await upstream_server.wait_closed()
+
+    peak = max(samples + [rss_mb(server_pid)])
+    total_mb = sum(sizes) / (1024 * 1024)
+    growth = peak - baseline
+    print(f"{concurrency} concurrent proxy fetches, {total_mb:.0f} MB total in {elapsed:.1f}s")
+    print(f"Server RSS: baseline {baseline:.1f} MB, peak {peak:.1f} MB (+{growth:.1f} MB), after {rss_mb(server_pid):.1f} MB")
+    print(f"Buffering every body would have added about {total_mb:.0f} MB")
+    if growth > max_growth_mb:
+        print(f"❌ RSS grew by more than {max_growth_mb:g} MB")
+        return False
+    print(f"✅ RSS stayed within +{max_growth_mb:g} MB")
+    return True
+
+
+def auth_token() -> str:
+    import auth
+    return auth.create_access_token({"sub": "bench@example.com", "uid": 1})
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--max-growth-mb", type=float, default=100)
+    parser.add_argument("--serve", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.serve)
+        return 0
+
+    scratch_dir = tempfile.mkdtemp(prefix="dream-bench-proxy-")
+    env = {**os.environ, "DATABASE_URL": f"sqlite:///{os.path.join(scratch_dir, 'bench.db')}"}
+    env.pop("ASYNC_DATABASE_URL", None)
+    # Let every request hold its own upstream connection instead of queueing on the pool
+    env.setdefault("HTTP_MAX_CONNECTIONS", str(args.concurrency))
+    os.environ.update(env)
+    port = free_port()
+    server = subprocess.Popen([sys.executable, os.path.abspath(__file__), "--serve", str(port)], env=env)
+    try:
+        ok = asyncio.run(run(server.pid, port, args.concurrency, args.max_growth_mb))
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
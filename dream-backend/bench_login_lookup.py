@@ -0,0 +1,105 @@
+"""
+Benchmark: login lookup latency as the users table grows.
+Seeds throwaway SQLite databases with 1k, 100k and 1M users and times
+auth.get_user_by_email (the case-insensitive lookup /login runs) with and
+without the lower(email) index, so a regression to a full table scan shows
+up as latency that grows with the table.
+
+Usage: python bench_login_lookup.py [--sizes 1000,100000,1000000] [--lookups N]
+Seeding 1M users takes a little while and about 150 MB of disk.
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+# Keep the app's engines off the real database
+_scratch_dir = tempfile.mkdtemp(prefix="dream-bench-login-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_scratch_dir, 'app.db')}"
+
+from sqlalchemy import create_engine, insert, text  # noqa: E402
+from sqlalchemy.orm import sessionmaker  # noqa: E402
+
+from database import Base  # noqa: E402
+import auth  # noqa: E402
+import models  # noqa: E402
+
+SEED_BATCH = 50_000
+
+
+def seed(size: int):
+    """Create a database with `size` users; returns its engine"""
+    engine = create_engine(f"sqlite:///{os.path.join(_scratch_dir, f'users-{size}.db')}")
+    Base.metadata.create_all(bind=engine, tables=[models.User.__table__])
+    with engine.begin() as conn:
+        for start in range(0, size, SEED_BATCH):
+            conn.execute(insert(models.User), [
+                {
+                    "email": f"User{i}@Example.com",
+                    "username": f"user{i}",
+                    "hashed_password": "x",
+                    "email_verified": "True",
+                }
+                for i in range(start, min(start + SEED_BATCH, size))
+            ])
+        conn.execute(text("ANALYZE"))
+    return engine
+
+
+def time_lookups(engine, size: int, lookups: int) -> list[float]:
+    Session = sessionmaker(bind=engine)
+    rng = random.Random(size)
+    timings = []
+    with Session() as db:
+        for _ in range(lookups):
+            # Users type their address in any case; the lookup must still hit
+            email = f"user{rng.randrange(size)}@example.com"
+            start = time.perf_counter()
+            user = auth.get_user_by_email(db, email)
+            timings.append((time.perf_counter() - start) * 1000)
+            assert user is not None, email
+            db.expunge_all()
+    return timings
+
+
+def query_plan(engine) -> str:
+    with engine.connect() as conn:
+        rows = conn.execute(text(
+            "EXPLAIN QUERY PLAN SELECT id FROM users WHERE lower(email) = 'user1@example.com'"
+        )).all()
+    return "; ".join(row[-1] for row in rows)
+
+
+def report(label: str, timings: list[float]) -> None:
+    timings = sorted(timings)
+    p99 = timings[min(len(timings) - 1, int(len(timings) * 0.99))]
+    print(f"  {label:<14} p50 {statistics.median(timings):8.3f} ms  p99 {p99:8.3f} ms")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", default="1000,100000,1000000")
+    parser.add_argument("--lookups", type=int, default=500)
+    args = parser.parse_args()
+
+    for size in (int(s) for s in args.sizes.split(",")):
+        start = time.perf_counter()
+        engine = seed(size)
+        print(f"{size:,} users (seeded in {time.perf_counter() - start:.1f}s)")
+        print(f"  plan: {query_plan(engine)}")
+        report("indexed", time_lookups(engine, size, args.lookups))
+        with engine.begin() as conn:
+            conn.execute(text("DROP INDEX ix_users_email_lower"))
+        engine.dispose()  # Pooled connections keep statements prepared against the old schema
+        print(f"  plan: {query_plan(engine)}")
+        # Scans are slow on big tables; fewer samples still show the trend
+        report("no index", time_lookups(engine, size, max(10, args.lookups // 50)))
+        engine.dispose()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,222 @@
+"""
+Caches for AI results that don't need to hit the network twice.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import re
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+from sqlalchemy.exc import IntegrityError
+
+from database import SessionLocal
+import models
+
+ANALYSIS_CACHE_TTL_HOURS = float(os.getenv("ANALYSIS_CACHE_TTL_HOURS", str(24 * 30)))
+ANALYSIS_CACHE_MAX_ENTRIES = int(os.getenv("ANALYSIS_CACHE_MAX_ENTRIES", "10000"))
+SYMBOL_MEMORY_CACHE_SIZE = int(os.getenv("SYMBOL_MEMORY_CACHE_SIZE", "2048"))
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "10000"))
+USER_CACHE_TTL_SECONDS = float(os.getenv("USER_CACHE_TTL_SECONDS", "30"))
+
+
+class CacheStats:
+    """Hit/miss/eviction counters for one cache (process-local)"""
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.coalesced = 0  # Callers that waited on another caller's in-flight load
+
+    def as_dict(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "coalesced": self.coalesced,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+class LRUCache:
+    """Small in-memory LRU map with an optional per-entry TTL"""
+    def __init__(self, max_size: int, ttl_seconds: float | None = None, stats: CacheStats | None = None) -> None:
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.stats = stats
+        self._data: OrderedDict = OrderedDict()
+
+    def get(self, key):
+        item = self._data.get(key)
+        if item is None:
+            return None
+        value, expires = item
+        if expires is not None and expires < datetime.utcnow():
+            self._data.pop(key, None)
+            return None
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key, value) -> None:
+        expires = None
+        if self.ttl_seconds is not None:
+            expires = datetime.utcnow() + timedelta(seconds=self.ttl_seconds)
+        self._data[key] = (value, expires)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_size:
+            self._data.popitem(last=False)
+            if self.stats is not None:
+                self.stats.evictions += 1
+
+    def pop(self, key) -> None:
+        self._data.pop(key, None)
+
+    def clear(self) -> None:
+        self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class SingleFlight:
+    """
+    Coalesce concurrent async loads of the same key into one call.
+    Later callers await the first caller's task instead of starting their own.
+    """
+    def __init__(self, stats: CacheStats | None = None) -> None:
+        self.stats = stats
+        self._calls: dict[str, asyncio.Task] = {}
+
+    async def do(self, key: str, load):
+        task = self._calls.get(key)
+        if task is None:
+            task = asyncio.ensure_future(load())
+            self._calls[key] = task
+            task.add_done_callback(lambda _: self._calls.pop(key, None))
+        elif self.stats is not None:
+            self.stats.coalesced += 1
+        # Shield so one cancelled caller doesn't cancel the load for the others
+        return await asyncio.shield(task)
+
+
+analysis_stats = CacheStats("analysis")
+symbol_stats = CacheStats("symbols")
+user_stats = CacheStats("users")
+
+symbol_memory = LRUCache(SYMBOL_MEMORY_CACHE_SIZE, stats=symbol_stats)
+symbol_loads = SingleFlight(stats=symbol_stats)
+
+# Column snapshots of authenticated users by id (see auth.get_current_user)
+users = LRUCache(USER_CACHE_SIZE, ttl_seconds=USER_CACHE_TTL_SECONDS, stats=user_stats)
+
+
+def all_stats() -> dict:
+    stats = {s.name: s.as_dict() for s in (analysis_stats, symbol_stats, user_stats)}
+    stats["symbols"]["memory_entries"] = len(symbol_memory)
+    stats["users"]["entries"] = len(users)
+    return stats
+
+
+# ---------- Dream analysis cache ----------
+def analysis_key(raw_text: str, model: str, prompt_version: str) -> str:
+    """Content address for an analysis: whitespace/case-normalized text + model + prompt version"""
+    normalized = " ".join(raw_text.split()).casefold()
+    digest = hashlib.sha256(f"{model}\n{prompt_version}\n{normalized}".encode("utf-8"))
+    return digest.hexdigest()
+
+
+def get_analysis(key: str) -> dict | None:
+    db = SessionLocal()
+    try:
+        now = datetime.utcnow()
+        entry = db.get(models.AnalysisCache, key)
+        if entry is None or entry.expires_at < now:
+            analysis_stats.misses += 1
+            return None
+        entry.last_accessed = now
+        db.commit()
+        analysis_stats.hits += 1
+        return json.loads(entry.result)
+    finally:
+        db.close()
+
+
+def put_analysis(key: str, result: dict) -> None:
+    db = SessionLocal()
+    try:
+        now = datetime.utcnow()
+        entry = db.get(models.AnalysisCache, key)
+        if entry is None:
+            entry = models.AnalysisCache(key=key)
+            db.add(entry)
+        entry.result = json.dumps(result)
+        entry.created_at = now
+        entry.last_accessed = now
+        entry.expires_at = now + timedelta(hours=ANALYSIS_CACHE_TTL_HOURS)
+        try:
+            db.commit()
+        except IntegrityError:
+            # Same text was cached concurrently; either copy is fine
+            db.rollback()
+            return
+        _evict_analysis(db, now)
+    finally:
+        db.close()
+
+
+def _evict_analysis(db, now: datetime) -> None:
+    """Drop expired entries, then least-recently-used ones above the size limit"""
+    expired = (
+        db.query(models.AnalysisCache)
+        .filter(models.AnalysisCache.expires_at < now)
+        .delete(synchronize_session=False)
+    )
+    overflow = db.query(models.AnalysisCache).count() - ANALYSIS_CACHE_MAX_ENTRIES
+    lru = 0
+    if overflow > 0:
+        oldest = (
+            db.query(models.AnalysisCache.key)
+            .order_by(models.AnalysisCache.last_accessed.asc())
+            .limit(overflow)
+            .subquery()
+        )
+        lru = (
+            db.query(models.AnalysisCache)
+            .filter(models.AnalysisCache.key.in_(oldest.select()))
+            .delete(synchronize_session=False)
+        )
+    db.commit()
+    analysis_stats.evictions += expired + lru
+
+
+# ---------- Symbol explanation cache ----------
+def normalize_symbol(symbol: str) -> str:
+    return re.sub(r"\s+", " ", symbol).strip(" \t.,;:!?\"'").casefold()
+
+
+def get_symbol(key: str) -> dict | None:
+    db = SessionLocal()
+    try:
+        entry = db.get(models.SymbolExplanation, key)
+        return json.loads(entry.explanation) if entry else None
+    finally:
+        db.close()
+
+
+def put_symbol(key: str, explanation: dict) -> None:
+    db = SessionLocal()
+    try:
+        db.merge(models.SymbolExplanation(
+            symbol=key,
+            explanation=json.dumps(explanation),
+            created_at=datetime.utcnow(),
+        ))
+        try:
+            db.commit()
+        except IntegrityError:
+            db.rollback()  # Stored concurrently by another process
+    finally:
+        db.close()
@@ -0,0 +1,178 @@
+"""
+Concurrency stress check for the database engines (pool settings, SQLite pragmas).
+Many threads write and read through SessionLocal while coroutines read
+through AsyncSessionLocal, with more workers than the pool has connections
+so pool waits are exercised too. Exits non-zero on any error (e.g.
+"database is locked", pool timeouts, lost writes).
+
+Runs against a throwaway SQLite file, then against Postgres if a DSN is given
+(--postgres-url or POSTGRES_DSN); the Postgres run is skipped otherwise. The
+Postgres database should be a scratch one: tables are created in it and the
+rows written here are deleted afterwards.
+
+Usage: python check_db_concurrency.py [--threads 50] [--tasks 50] [--seconds 10] [--postgres-url URL]
+"""
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+
+
+def run_backend(threads: int, tasks: int, seconds: float) -> bool:
+    """Child process: DATABASE_URL already points at the backend under test"""
+    from sqlalchemy import func, select
+
+    import database
+    from database import AsyncSessionLocal, Base, SessionLocal, async_engine, engine
+    import models
+
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    user = models.User(
+        email=f"stress-{os.getpid()}@example.com",
+        username=f"stress-{os.getpid()}",
+        hashed_password="x",
+        email_verified="True",
+    )
+    db.add(user)
+    db.commit()
+    user_id = user.id
+    db.close()
+
+    errors: Counter = Counter()
+    writes = reads = async_reads = 0
+    latencies: list[float] = []
+    lock = threading.Lock()
+    deadline = time.perf_counter() + seconds
+
+    def writer(worker: int) -> None:
+        nonlocal writes, reads
+        n = 0
+        while time.perf_counter() < deadline:
+            n += 1
+            start = time.perf_counter()
+            session = SessionLocal()
+            try:
+                if n % 3:
+                    dream = models.Dream(user_id=user_id, title=f"stress {worker}-{n}", raw_text="x" * 200)
+                    session.add(dream)
+                    session.flush()
+                    session.add(models.DreamInterpretation(dream_id=dream.id, meaning="m", symbols="water"))
+                    session.commit()
+                    with lock:
+                        writes += 1
+                else:
+                    session.query(models.Dream).filter(models.Dream.user_id == user_id).order_by(
+                        models.Dream.id.desc()
+                    ).limit(20).all()
+                    with lock:
+                        reads += 1
+            except Exception as e:
+                session.rollback()
+                with lock:
+                    errors[f"{type(e).__name__}: {str(e).splitlines()[0][:100]}"] += 1
+            finally:
+                session.close()
+            with lock:
+                latencies.append(time.perf_counter() - start)
+
+    async def async_readers() -> None:
+        async def reader() -> None:
+            nonlocal async_reads
+            while time.perf_counter() < deadline:
+                try:
+                    async with AsyncSessionLocal() as session:
+                        await session.execute(
+                            select(func.count(models.Dream.id)).where(models.Dream.user_id == user_id)
+                        )
+                    async_reads += 1
+                except Exception as e:
+                    errors[f"async {type(e).__name__}: {str(e).splitlines()[0][:100]}"] += 1
+                await asyncio.sleep(0)
+
+        try:
+            await asyncio.gather(*(reader() for _ in range(tasks)))
+        finally:
+            await async_engine.dispose()
+
+    workers = [threading.Thread(target=writer, args=(i,)) for i in range(threads)]
+    start = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    asyncio.run(async_readers())
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - start
+
+    db = SessionLocal()
+    try:
+        stored = db.query(models.Dream).filter(models.Dream.user_id == user_id).count()
+        if stored != writes:
+            errors[f"lost writes: committed {writes}, found {stored}"] += 1
+        # Leave a shared (Postgres) database as we found it
+        dream_ids = db.query(models.Dream.id).filter(models.Dream.user_id == user_id)
+        db.query(models.DreamInterpretation).filter(
+            models.DreamInterpretation.dream_id.in_(dream_ids)
+        ).delete(synchronize_session=False)
+        db.query(models.Dream).filter(models.Dream.user_id == user_id).delete(synchronize_session=False)
+        db.query(models.User).filter(models.User.id == user_id).delete(synchronize_session=False)
+        db.commit()
+    finally:
+        db.close()
+
+    latencies.sort()
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000 if latencies else 0.0
+    print(f"  {threads} threads + {tasks} async tasks for {elapsed:.1f}s")
+    print(f"  sync: {writes} writes, {reads} reads ({(writes + reads) / elapsed:.0f} ops/s, p99 {p99:.0f} ms)")
+    print(f"  async: {async_reads} reads ({async_reads / elapsed:.0f} ops/s)")
+    for name, stats in database.pool_stats().items():
+        print(f"  {name} pool: {stats}")
+    for message, count in errors.most_common():
+        print(f"  ❌ {count} x {message}")
+    return not errors
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--threads", type=int, default=50)
+    parser.add_argument("--tasks", type=int, default=50)
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--postgres-url", default=os.getenv("POSTGRES_DSN"))
+    parser.add_argument("--run-backend", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_backend:
+        return 0 if run_backend(args.threads, args.tasks, args.seconds) else 1
+
+    scratch_dir = tempfile.mkdtemp(prefix="dream-db-stress-")
+    backends = {"SQLite": f"sqlite:///{os.path.join(scratch_dir, 'stress.db')}"}
+    if args.postgres_url:
+        backends["Postgres"] = args.postgres_url
+
+    ok = True
+    for name, url in backends.items():
+        print(f"{name}:", flush=True)
+        # Engines are built at import time, so each backend gets its own process
+        env = {**os.environ, "DATABASE_URL": url}
+        env.pop("ASYNC_DATABASE_URL", None)
+        child = subprocess.run([
+            sys.executable, os.path.abspath(__file__), "--run-backend",
+            "--threads", str(args.threads), "--tasks", str(args.tasks), "--seconds", str(args.seconds),
+        ], env=env)
+        if child.returncode == 0:
+            print(f"✅ {name}: no errors", flush=True)
+        else:
+            print(f"❌ {name}: failed", flush=True)
+            ok = False
+    if "Postgres" not in backends:
+        print("⏭️  Postgres skipped (set POSTGRES_DSN or pass --postgres-url)")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,97 @@
+"""
+Query-budget check for the dream endpoints (suitable for CI).
+Seeds a throwaway SQLite database with one user and 1,000 dreams (half of
+them interpreted), calls each endpoint through TestClient and exits non-zero
+if any of them runs more SQL statements than its budget. Catches N+1 lazy
+loads of Dream.interpretation creeping back in.
+
+Usage: python check_query_budget.py [--verbose]
+"""
+import asyncio
+import os
+import sys
+import tempfile
+
+# Point both engines at a scratch database before the app modules import them
+_scratch_dir = tempfile.mkdtemp(prefix="dream-query-budget-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_scratch_dir, 'budget.db')}"
+os.environ.pop("ASYNC_DATABASE_URL", None)
+
+from fastapi.testclient import TestClient  # noqa: E402
+
+from database import SessionLocal, count_queries  # noqa: E402
+import auth  # noqa: E402
+import main  # noqa: E402
+import models  # noqa: E402
+
+DREAM_COUNT = 1000
+QUERY_BUDGET = 2
+
+
+def seed() -> tuple[int, int]:
+    """Create the user and dreams; returns (user id, id of an interpreted dream)"""
+    db = SessionLocal()
+    try:
+        user = models.User(
+            email="budget@example.com",
+            username="budget",
+            hashed_password="x",
+            email_verified="True",
+        )
+        db.add(user)
+        db.flush()
+        dreams = [
+            models.Dream(user_id=user.id, title=f"Dream {i}", raw_text=f"Dream text {i}")
+            for i in range(DREAM_COUNT)
+        ]
+        db.add_all(dreams)
+        db.flush()
+        db.add_all(
+            models.DreamInterpretation(
+                dream_id=dream.id,
+                poetic_narrative="A narrative",
+                meaning="A meaning",
+                symbols="moon, water",
+                emotions="calm",
+            )
+            for dream in dreams[::2]
+        )
+        db.commit()
+        return user.id, dreams[0].id
+    finally:
+        db.close()
+
+
+def check(verbose: bool = False) -> bool:
+    """Run every endpoint once under count_queries; return False if any is over budget"""
+    main.Base.metadata.create_all(bind=main.engine)
+    user_id, dream_id = seed()
+    token = auth.create_access_token({"sub": "budget@example.com", "uid": user_id})
+    headers = {"Authorization": f"Bearer {token}"}
+    # No `with`: the lifespan's job workers and email sender would add their own queries
+    client = TestClient(main.app, raise_server_exceptions=False)
+    client.get("/user/info", headers=headers)  # Warm the user cache so auth costs no query
+
+    ok = True
+    for path in ("/dreams", "/dreams?view=summary", "/user/export", f"/dreams/{dream_id}"):
+        with count_queries() as queries:
+            response = client.get(path, headers=headers)
+        bad = response.status_code != 200 or queries.count > QUERY_BUDGET
+        print(f"{'❌' if bad else '✅'} GET {path}: {queries.count} queries (budget {QUERY_BUDGET}), HTTP {response.status_code}")
+        if bad:
+            ok = False
+        if bad or verbose:
+            for statement in queries.statements[:5]:
+                print(f"   {' '.join(statement.split())[:200]}")
+            if queries.count > 5:
+                print(f"   ... {queries.count - 5} more")
+    return ok
+
+
+if __name__ == "__main__":
+    try:
+        ok = check("--verbose" in sys.argv)
+    finally:
+        # Pooled aiosqlite connections run on their own threads and would keep the process alive
+        asyncio.run(main.async_engine.dispose())
+    sys.exit(0 if ok else 1)
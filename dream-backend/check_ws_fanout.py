@@ -0,0 +1,115 @@
+"""
+WebSocket fan-out check (re-runnable, no database needed).
+Connects thousands of fake sockets to the ConnectionManager, all watching the
+same dream, plus one stalled client whose sends never complete. Publishes a
+burst of status events and exits non-zero unless every healthy socket gets
+the final event within the latency budget while the stalled client is still
+hanging, and the stalled client is then dropped with close code 1013.
+
+Usage: python check_ws_fanout.py [--sockets N] [--events N] [--budget-ms MS]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+# Keep the stall short so the check finishes quickly; set before ws reads it
+os.environ.setdefault("WS_SEND_TIMEOUT", "2")
+os.environ["WS_BROKER"] = "local"
+
+import ws  # noqa: E402
+
+DREAM_ID = 1
+
+
+class FakeWebSocket:
+    """Just enough of starlette's WebSocket for ConnectionManager"""
+    def __init__(self, stalled: bool = False) -> None:
+        self.received = []
+        self.close_code = None
+        self.final_at = None
+        self._stalled = stalled
+
+    async def accept(self) -> None:
+        pass
+
+    async def send_json(self, message: dict) -> None:
+        if self._stalled:
+            await asyncio.Event().wait()  # A client that stopped reading
+        self.received.append(message)
+        if message.get("final"):
+            self.final_at = time.perf_counter()
+
+    async def close(self, code: int = 1000) -> None:
+        self.close_code = code
+
+
+async def run(sockets: int, events: int, budget_ms: float) -> bool:
+    manager = ws.ConnectionManager(ws.LocalBroker())
+    await manager.start()
+
+    healthy = [FakeWebSocket() for _ in range(sockets)]
+    stalled = FakeWebSocket(stalled=True)
+    for websocket in healthy + [stalled]:
+        conn = await manager.connect(websocket, user_id=1)
+        manager.subscribe(conn, DREAM_ID)
+    print(f"Connected {sockets} sockets + 1 stalled client: {manager.stats()}")
+
+    # Get the stalled client stuck inside a send before the burst
+    await manager.send_to(DREAM_ID, {"status": "queued"})
+    await asyncio.sleep(0.1)
+
+    start = time.perf_counter()
+    for i in range(events - 1):
+        await manager.send_to(DREAM_ID, {"status": "analyzing", "step": i})
+    await manager.send_to(DREAM_ID, {"status": "done", "final": True})
+    publish_ms = (time.perf_counter() - start) * 1000
+
+    deadline = start + budget_ms / 1000
+    while time.perf_counter() < deadline and any(w.final_at is None for w in healthy):
+        await asyncio.sleep(0.005)
+    missing = sum(1 for w in healthy if w.final_at is None)
+    latencies = sorted((w.final_at - start) * 1000 for w in healthy if w.final_at is not None)
+    stalled_open = stalled.close_code is None
+
+    ok = True
+    print(f"Published {events} events in {publish_ms:.1f} ms")
+    if latencies:
+        p50 = latencies[len(latencies) // 2]
+        p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+        print(f"Final event delivered: p50 {p50:.1f} ms, p99 {p99:.1f} ms, max {latencies[-1]:.1f} ms")
+    if missing:
+        print(f"❌ {missing} of {sockets} healthy sockets missed the final event within {budget_ms:.0f} ms")
+        ok = False
+    else:
+        print(f"✅ All {sockets} healthy sockets got the final event within {budget_ms:.0f} ms")
+    if not stalled_open:
+        print("⚠️ Stalled client was dropped before the healthy sockets finished; raise WS_SEND_TIMEOUT for a stricter check")
+
+    # The stalled client must be cut off once its send times out
+    await asyncio.sleep(ws.WS_SEND_TIMEOUT + 0.5)
+    if stalled.close_code == 1013:
+        print(f"✅ Stalled client closed with 1013 after WS_SEND_TIMEOUT={ws.WS_SEND_TIMEOUT:g}s")
+    else:
+        print(f"❌ Stalled client not closed with 1013 (close code {stalled.close_code})")
+        ok = False
+
+    for websocket in healthy:
+        manager.disconnect(websocket)
+    await asyncio.sleep(0)
+    await manager.stop()
+    return ok
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sockets", type=int, default=5000)
+    parser.add_argument("--events", type=int, default=20)
+    parser.add_argument("--budget-ms", type=float, default=1000)
+    args = parser.parse_args()
+    return 0 if asyncio.run(run(args.sockets, args.events, args.budget_ms)) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,5 +1,10 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event, func
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 from sqlalchemy.orm import sessionmaker, declarative_base
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from zoneinfo import ZoneInfo
 import os
 
 # Support both SQLite (local) and PostgreSQL (production)
@@ -9,17 +14,186 @@ DATABASE_URL = os.getenv("DATABASE_URL") or os.getenv("SQLALCHEMY_DATABASE_URL",
 if DATABASE_URL.startswith("postgres://"):
     DATABASE_URL = DATABASE_URL.replace("postgres://", "postgresql://", 1)
 
-if DATABASE_URL.startswith("sqlite"):
+IS_SQLITE = DATABASE_URL.startswith("sqlite")
+IS_SQLITE_MEMORY = IS_SQLITE and (DATABASE_URL.rstrip("/").endswith(("sqlite:", ":memory:")) or "mode=memory" in DATABASE_URL)
+
+# Connection pool (per engine; the sync and async engines each get one)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))  # Postgres only; stay under server/proxy idle timeouts
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
+
+# SQLite: WAL lets readers run alongside the writer; busy_timeout makes a
+# second writer wait for the lock instead of failing with "database is locked"
+SQLITE_JOURNAL_MODE = os.getenv("SQLITE_JOURNAL_MODE", "WAL")
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+
+
+def _pool_options() -> dict:
+    if IS_SQLITE_MEMORY:
+        return {}  # SQLAlchemy keeps in-memory databases on a single connection
+    options = {
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+    }
+    if not IS_SQLITE:
+        options["pool_pre_ping"] = DB_POOL_PRE_PING
+        options["pool_recycle"] = DB_POOL_RECYCLE
+    return options
+
+
+if IS_SQLITE:
     engine = create_engine(
-        DATABASE_URL, connect_args={"check_same_thread": False}
+        DATABASE_URL, connect_args={"check_same_thread": False}, **_pool_options()
     )
 else:
-    engine = create_engine(DATABASE_URL)
+    engine = create_engine(DATABASE_URL, **_pool_options())
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+
+def _async_url(url: str) -> str:
+    """Same database through an asyncio driver (aiosqlite / asyncpg)"""
+    scheme, rest = url.split("://", 1)
+    if scheme.startswith("sqlite"):
+        return f"sqlite+aiosqlite://{rest}"
+    if scheme.startswith("postgresql"):
+        return f"postgresql+asyncpg://{rest}"
+    return url
+
+
+# Async engine for read-heavy endpoints, so they don't each hold a threadpool slot
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL") or _async_url(DATABASE_URL)
+if IS_SQLITE and not IS_SQLITE_MEMORY:
+    # aiosqlite defaults to NullPool (a new connection, and pragmas, per request)
+    async_engine = create_async_engine(ASYNC_DATABASE_URL, poolclass=AsyncAdaptedQueuePool, **_pool_options())
+else:
+    async_engine = create_async_engine(ASYNC_DATABASE_URL, **_pool_options())
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
 Base = declarative_base()
 
 
+def _sqlite_local_date(value, tz_name):
+    """SQLite UDF: calendar date (YYYY-MM-DD) of a naive-UTC timestamp in tz_name"""
+    if value is None:
+        return None
+    ts = datetime.fromisoformat(value)
+    if ts.tzinfo is None:
+        ts = ts.replace(tzinfo=timezone.utc)
+    return ts.astimezone(ZoneInfo(tz_name)).date().isoformat()
+
+
+if IS_SQLITE:
+    @event.listens_for(engine, "connect")
+    @event.listens_for(async_engine.sync_engine, "connect")
+    def _configure_sqlite_connection(dbapi_connection, connection_record):
+        dbapi_connection.create_function("local_date", 2, _sqlite_local_date, deterministic=True)
+        cursor = dbapi_connection.cursor()
+        try:
+            if not IS_SQLITE_MEMORY:
+                cursor.execute(f"PRAGMA journal_mode={SQLITE_JOURNAL_MODE}")
+            cursor.execute(f"PRAGMA synchronous={SQLITE_SYNCHRONOUS}")
+            cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+        finally:
+            cursor.close()
+
+
+# ---------- Pool metrics ----------
+class PoolStats:
+    """Checkout/connect counters for one engine's pool (process-local)"""
+    def __init__(self, name: str, pool) -> None:
+        self.name = name
+        self.pool = pool
+        self.checkouts = 0
+        self.connects = 0  # New DBAPI connections (pool growth, recycle, pre-ping reconnects)
+        self.peak_checked_out = 0
+
+    def as_dict(self) -> dict:
+        stats = {
+            "pool": type(self.pool).__name__,
+            "checkouts": self.checkouts,
+            "connects": self.connects,
+            "peak_checked_out": self.peak_checked_out,
+        }
+        if hasattr(self.pool, "overflow"):
+            stats.update({
+                "size": self.pool.size(),
+                "checked_out": self.pool.checkedout(),
+                "checked_in": self.pool.checkedin(),
+                # Connections opened beyond pool_size (negative while the pool is still filling)
+                "overflow": self.pool.overflow(),
+            })
+        return stats
+
+
+def _track_pool(name: str, sync_engine) -> PoolStats:
+    stats = PoolStats(name, sync_engine.pool)
+
+    @event.listens_for(sync_engine, "connect")
+    def _on_connect(dbapi_connection, connection_record):
+        stats.connects += 1
+
+    @event.listens_for(sync_engine, "checkout")
+    def _on_checkout(dbapi_connection, connection_record, connection_proxy):
+        stats.checkouts += 1
+        if hasattr(stats.pool, "checkedout"):
+            stats.peak_checked_out = max(stats.peak_checked_out, stats.pool.checkedout())
+
+    return stats
+
+
+_pool_stats = [_track_pool("sync", engine), _track_pool("async", async_engine.sync_engine)]
+
+
+def pool_stats() -> dict:
+    return {s.name: s.as_dict() for s in _pool_stats}
+
+
+def local_date(column, tz_name: str):
+    """SQL expression for the local calendar date of a UTC timestamp column"""
+    if IS_SQLITE:
+        return func.local_date(column, tz_name)
+    return func.date(func.timezone(tz_name, func.timezone("UTC", column)))
+
+
+class QueryCounter:
+    """SQL statements seen by count_queries"""
+    def __init__(self) -> None:
+        self.statements: list[str] = []
+
+    @property
+    def count(self) -> int:
+        return len(self.statements)
+
+
+@contextmanager
+def count_queries(*engines):
+    """
+    Record every statement the engines (default: both) execute inside the block.
+    Used to check an endpoint's query budget and catch N+1 lazy loads:
+
+        with count_queries() as queries:
+            client.get("/dreams")
+        assert queries.count <= 2, queries.statements
+    """
+    counter = QueryCounter()
+
+    def _record(conn, cursor, statement, parameters, context, executemany):
+        counter.statements.append(statement)
+
+    targets = engines or (engine, async_engine.sync_engine)
+    for target in targets:
+        event.listen(target, "before_cursor_execute", _record)
+    try:
+        yield counter
+    finally:
+        for target in targets:
+            event.remove(target, "before_cursor_execute", _record)
+
+
 def get_db():
     db = SessionLocal()
     try:
@@ -27,3 +201,7 @@ def get_db():
     finally:
         db.close()
 
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
@@ -0,0 +1,67 @@
+"""
+Normalized symbol/emotion rows for dream interpretations.
+
+DreamInterpretation keeps the free-text `symbols` / `emotions` blobs for
+display; the dream_symbols / dream_emotions tables hold one row per value so
+analytics can aggregate in SQL. Stored values are casefolded (see
+normalize_tag) so "Water" and "water" count as one symbol and lookups can
+compare with plain `==` against the (user_id, symbol) indexes.
+"""
+import json
+
+from sqlalchemy.orm import Session
+
+import models
+
+
+def normalize_tag(value: str) -> str:
+    """Canonical form of a symbol/emotion, for storage and for lookups"""
+    return " ".join(value.split()).casefold()
+
+
+def split_tags(text: str | None) -> list[str]:
+    """
+    Split an interpretation blob into distinct, normalized values.
+    Handles comma/newline-separated text as well as the JSON-dumped dict
+    (symbol -> meaning) or list that _process_dream stores for some answers.
+    """
+    if not text:
+        return []
+    stripped = text.strip()
+    candidates = None
+    if stripped[:1] in ("{", "["):
+        try:
+            parsed = json.loads(stripped)
+        except ValueError:
+            parsed = None
+        if isinstance(parsed, dict):
+            candidates = [str(key) for key in parsed]
+        elif isinstance(parsed, list):
+            candidates = [str(item) for item in parsed if isinstance(item, (str, int, float))]
+    if candidates is None:
+        candidates = text.replace("\n", ",").split(",")
+
+    values = []
+    for value in candidates:
+        value = normalize_tag(value)
+        if value and value not in values:
+            values.append(value)
+    return values
+
+
+def clear_tags(db: Session, dream_id: int) -> None:
+    db.query(models.DreamSymbol).filter(models.DreamSymbol.dream_id == dream_id).delete(synchronize_session=False)
+    db.query(models.DreamEmotion).filter(models.DreamEmotion.dream_id == dream_id).delete(synchronize_session=False)
+
+
+def replace_tags(db: Session, dream_id: int, user_id: int, symbols: str | None, emotions: str | None) -> None:
+    """Rewrite a dream's tag rows from its interpretation text (caller commits)"""
+    clear_tags(db, dream_id)
+    db.add_all(
+        models.DreamSymbol(dream_id=dream_id, user_id=user_id, symbol=symbol)
+        for symbol in split_tags(symbols)
+    )
+    db.add_all(
+        models.DreamEmotion(dream_id=dream_id, user_id=user_id, emotion=emotion)
+        for emotion in split_tags(emotions)
+    )
@@ -1,9 +1,35 @@
-import smtplib
+"""
+Outgoing email.
+
+Endpoints never talk to the mail provider: they add a row to the
+`email_outbox` table and return. A background sender on the app's event
+loop claims due messages in batches and delivers them over one reused,
+already-authenticated SMTP session (or the pooled SendGrid client),
+retrying failures with exponential backoff. Sent and failed rows are
+deleted once they are older than EMAIL_OUTBOX_RETENTION_HOURS.
+
+For local testing set SMTP_SECURITY=none and point SMTP_HOST/SMTP_PORT at a
+debug server such as `python -m aiosmtpd -n -l localhost:1025`: plain SMTP,
+no TLS, no login.
+"""
+import asyncio
+import json
 import os
-import requests
+import re
+import smtplib
+import textwrap
+import time
+from datetime import datetime, timedelta
+from html import escape as html_escape
+from typing import NamedTuple
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from dotenv import load_dotenv
+from sqlalchemy.orm import Session
+
+from database import SessionLocal
+import http_client
+import models
 
 load_dotenv()
 
@@ -12,6 +38,7 @@ load_dotenv()
 SENDGRID_API_KEY = os.getenv("SENDGRID_API_KEY", "")
 SENDGRID_FROM_EMAIL = os.getenv("SENDGRID_FROM_EMAIL", "")
 SENDGRID_FROM_NAME = os.getenv("SENDGRID_FROM_NAME", "Lucid Loom")
+SENDGRID_URL = "https://api.sendgrid.com/v3/mail/send"
 
 # SMTP fallback configuration
 SMTP_HOST = os.getenv("SMTP_HOST", "smtp.gmail.com")
@@ -20,222 +47,521 @@ SMTP_USER = os.getenv("SMTP_USER", "")
 SMTP_PASSWORD = os.getenv("SMTP_PASSWORD", "")
 SMTP_FROM_EMAIL = os.getenv("SMTP_FROM_EMAIL", SMTP_USER)
 SMTP_FROM_NAME = os.getenv("SMTP_FROM_NAME", "Lucid Loom")
+SMTP_SECURITY = os.getenv("SMTP_SECURITY", "ssl" if SMTP_PORT == 465 else "starttls").lower()  # starttls | ssl | none
+SMTP_TIMEOUT = float(os.getenv("SMTP_TIMEOUT", "10"))
+SMTP_IDLE_SECONDS = float(os.getenv("SMTP_IDLE_SECONDS", "30"))  # Close the reused session after this long unused
+
+# Outbox sender
+EMAIL_BATCH_SIZE = int(os.getenv("EMAIL_BATCH_SIZE", "20"))
+EMAIL_MAX_ATTEMPTS = int(os.getenv("EMAIL_MAX_ATTEMPTS", "5"))
+EMAIL_RETRY_BASE_DELAY = float(os.getenv("EMAIL_RETRY_BASE_DELAY", "10"))
+EMAIL_POLL_INTERVAL = float(os.getenv("EMAIL_POLL_INTERVAL", "5"))
+EMAIL_LEASE_SECONDS = int(os.getenv("EMAIL_LEASE_SECONDS", "300"))
+EMAIL_OUTBOX_RETENTION_HOURS = float(os.getenv("EMAIL_OUTBOX_RETENTION_HOURS", "168"))  # Keep sent/failed rows this long
+EMAIL_PRUNE_INTERVAL = 3600
+EMAIL_PRUNE_BATCH = 1000
+
+_task: asyncio.Task | None = None
+_wake: asyncio.Event | None = None
+_loop: asyncio.AbstractEventLoop | None = None
+
+
+def _use_sendgrid() -> bool:
+    return bool(SENDGRID_API_KEY and SENDGRID_FROM_EMAIL)
+
+
+def is_configured() -> bool:
+    """True if some transport can deliver mail"""
+    if SENDGRID_API_KEY and not SENDGRID_FROM_EMAIL:
+        print("❌ SENDGRID_FROM_EMAIL not set in .env file!")
+        print("   Please set SENDGRID_FROM_EMAIL to a verified sender email in SendGrid")
+    return _use_sendgrid() or bool(SMTP_USER and SMTP_PASSWORD) or SMTP_SECURITY == "none"
+
+
+# ---------- Queueing ----------
+def queue_email(db: Session, to_email: str, template: str, params: dict) -> models.EmailOutbox:
+    """Persist an email in the outbox and wake the sender"""
+    message = models.EmailOutbox(
+        to_email=to_email,
+        template=template,
+        params=json.dumps(params),
+        status="queued",
+        send_after=datetime.utcnow(),
+    )
+    db.add(message)
+    db.commit()
+    _notify()
+    return message
+
+
+def queue_bulk_email(db: Session, recipients: list[str], template: str, params: dict) -> int:
+    """
+    Queue the same email to many recipients (digests, announcements).
+    Identical content is rendered once per sender batch, and SendGrid gets
+    one request per batch instead of one per recipient.
+    """
+    TEMPLATES[template].render(params)  # Fail fast on a bad template or params
+    now = datetime.utcnow()
+    encoded = json.dumps(params)
+    db.add_all([
+        models.EmailOutbox(to_email=to_email, template=template, params=encoded, status="queued", send_after=now)
+        for to_email in recipients
+    ])
+    db.commit()
+    _notify()
+    return len(recipients)
 
 
-def send_otp_email(to_email: str, otp_code: str) -> bool:
+def queue_otp_email(db: Session, to_email: str, otp_code: str) -> bool:
     """
-    Send OTP email to user.
-    Uses SendGrid API if available, otherwise falls back to SMTP.
-    Returns True if successful, False otherwise.
+    Queue the OTP verification email.
+    Returns False (nothing queued) if no email transport is configured.
     """
-    print(f"🚀 send_otp_email() called for {to_email} with OTP {otp_code}")
-    print(f"🔍 Checking email configuration...")
-    print(f"   SENDGRID_API_KEY: {'Set' if SENDGRID_API_KEY else 'Not set'}")
-    print(f"   SMTP_USER: {'Set' if SMTP_USER else 'Not set'}")
-    print(f"   SMTP_PASSWORD: {'Set' if SMTP_PASSWORD else 'Not set'}")
-    
-    # Try SendGrid first (works better on Railway)
-    if SENDGRID_API_KEY:
-        print("📬 Using SendGrid API")
-        if not SENDGRID_FROM_EMAIL:
-            print("❌ SENDGRID_FROM_EMAIL not set in .env file!")
-            print("   Please set SENDGRID_FROM_EMAIL to a verified sender email in SendGrid")
-            return False
-        return _send_via_sendgrid(to_email, otp_code)
-    
-    # Fallback to SMTP
-    if not SMTP_USER or not SMTP_PASSWORD:
+    if not is_configured():
         print("⚠️ Email configuration missing. Set SENDGRID_API_KEY or SMTP_USER/SMTP_PASSWORD in .env")
         print(f"   Would send OTP {otp_code} to {to_email}")
         return False
-    
-    print("📧 Using SMTP fallback")
-    return _send_via_smtp(to_email, otp_code)
+    queue_email(db, to_email, "otp", {"otp_code": otp_code})
+    return True
 
 
-def _send_via_sendgrid(to_email: str, otp_code: str) -> bool:
-    """Send email using SendGrid API"""
+def _notify() -> None:
+    if _loop is None or _wake is None:
+        return  # Sender not running; it drains the outbox on startup
     try:
-        if not SENDGRID_FROM_EMAIL:
-            print("❌ SENDGRID_FROM_EMAIL not set in .env file")
-            print("   Please set SENDGRID_FROM_EMAIL to a verified sender email in SendGrid")
-            return False
-        
-        from_email = SENDGRID_FROM_EMAIL
-        from_name = SENDGRID_FROM_NAME or "Lucid Loom"
-        print(f"📧 SendGrid: Sending from {from_email} to {to_email}")
-        
-        html_body = f"""
-        <html>
-          <body style="font-family: Arial, sans-serif; line-height: 1.6; color: #333;">
-            <div style="max-width: 600px; margin: 0 auto; padding: 20px;">
-              <h2 style="color: #6366f1;">Welcome to Lucid Loom</h2>
-              <p>Thank you for signing up! Please use the following verification code to complete your registration:</p>
-              <div style="background-color: #f3f4f6; border-radius: 8px; padding: 20px; text-align: center; margin: 20px 0;">
-                <h1 style="color: #6366f1; font-size: 32px; letter-spacing: 4px; margin: 0;">{otp_code}</h1>
-              </div>
-              <p style="color: #6b7280; font-size: 14px;">This code will expire in 10 minutes.</p>
-              <p style="color: #6b7280; font-size: 14px;">If you didn't request this code, please ignore this email.</p>
-            </div>
-          </body>
-        </html>
-        """
-        
-        text_body = f"""
+        running = asyncio.get_running_loop()
+    except RuntimeError:
+        running = None
+    if running is _loop:
+        _wake.set()
+    else:
+        _loop.call_soon_threadsafe(_wake.set)
+
+
+# ---------- Templates ----------
+class RenderedEmail(NamedTuple):
+    subject: str
+    text: str
+    html: str
+
+
+class _CompiledText:
+    """
+    A $placeholder template split once into literal chunks and field names,
+    so rendering is a single join.
+    """
+    _FIELD = re.compile(r"\$(\w+)")
+
+    def __init__(self, source: str, escape=None) -> None:
+        pieces = self._FIELD.split(textwrap.dedent(source).strip("\n"))
+        self._literals = pieces[0::2]
+        self._fields = pieces[1::2]
+        self._escape = escape
+
+    @property
+    def fields(self) -> set[str]:
+        return set(self._fields)
+
+    def render(self, params: dict) -> str:
+        out = [self._literals[0]]
+        for field, literal in zip(self._fields, self._literals[1:]):
+            value = str(params[field])
+            out.append(self._escape(value) if self._escape else value)
+            out.append(literal)
+        return "".join(out)
+
+
+class EmailTemplate:
+    """Subject, plain-text and HTML bodies compiled once at registration"""
+    def __init__(self, subject: str, text: str, html: str) -> None:
+        self.subject = _CompiledText(subject)
+        self.text = _CompiledText(text)
+        self.html = _CompiledText(html, escape=html_escape)
+        self.fields = self.subject.fields | self.text.fields | self.html.fields
+
+    def render(self, params: dict) -> RenderedEmail:
+        missing = self.fields - params.keys()
+        if missing:
+            raise KeyError(f"Missing template params: {', '.join(sorted(missing))}")
+        return RenderedEmail(self.subject.render(params), self.text.render(params), self.html.render(params))
+
+
+TEMPLATES: dict[str, EmailTemplate] = {}
+
+
+def register_template(name: str, subject: str, text: str, html: str) -> None:
+    TEMPLATES[name] = EmailTemplate(subject, text, html)
+
+
+def render(template: str, params: dict) -> RenderedEmail:
+    """The one rendering path used by every transport"""
+    return TEMPLATES[template].render(params)
+
+
+register_template(
+    "otp",
+    subject="Your Lucid Loom Verification Code",
+    text="""
         Welcome to Lucid Loom!
-        
+
         Thank you for signing up! Please use the following verification code to complete your registration:
-        
-        {otp_code}
-        
-        This code will expire in 10 minutes.
-        
-        If you didn't request this code, please ignore this email.
-        """
-        
-        payload = {
-            "personalizations": [{
-                "to": [{"email": to_email}],
-                "subject": "Your Lucid Loom Verification Code"
-            }],
-            "from": {
-                "email": from_email,
-                "name": from_name
-            },
-            "content": [
-                {
-                    "type": "text/plain",
-                    "value": text_body
-                },
-                {
-                    "type": "text/html",
-                    "value": html_body
-                }
-            ]
-        }
-        
-        headers = {
-            "Authorization": f"Bearer {SENDGRID_API_KEY}",
-            "Content-Type": "application/json"
-        }
-        
-        print(f"📤 Sending email via SendGrid API...")
-        response = requests.post(
-            "https://api.sendgrid.com/v3/mail/send",
-            json=payload,
-            headers=headers,
-            timeout=10
-        )
-        
-        print(f"📬 SendGrid Response Status: {response.status_code}")
-        
-        if response.status_code == 202:
-            print(f"✅ OTP email sent to {to_email} via SendGrid")
-            return True
-        else:
-            error_text = response.text if response.text else "No error message"
-            print(f"❌ SendGrid API error: {response.status_code}")
-            print(f"   Error details: {error_text}")
-            try:
-                error_json = response.json()
-                if 'errors' in error_json:
-                    for error in error_json['errors']:
-                        print(f"   - {error.get('message', 'Unknown error')}")
-            except:
-                pass
-            return False
-            
-    except Exception as e:
-        print(f"❌ Failed to send OTP email via SendGrid to {to_email}: {e}")
-        return False
 
+        $otp_code
 
-def _send_via_smtp(to_email: str, otp_code: str) -> bool:
-    """Send email using SMTP (fallback)"""
-    print(f"🔧 Attempting SMTP connection to {SMTP_HOST}:{SMTP_PORT}")
-    try:
-        # Create message
-        msg = MIMEMultipart("alternative")
-        msg["Subject"] = "Your Lucid Loom Verification Code"
-        msg["From"] = f"{SMTP_FROM_NAME} <{SMTP_FROM_EMAIL}>"
-        msg["To"] = to_email
-        
-        # Create email body
-        html_body = f"""
+        This code will expire in 10 minutes.
+
+        If you didn't request this code, please ignore this email.
+    """,
+    html="""
         <html>
           <body style="font-family: Arial, sans-serif; line-height: 1.6; color: #333;">
             <div style="max-width: 600px; margin: 0 auto; padding: 20px;">
               <h2 style="color: #6366f1;">Welcome to Lucid Loom</h2>
               <p>Thank you for signing up! Please use the following verification code to complete your registration:</p>
               <div style="background-color: #f3f4f6; border-radius: 8px; padding: 20px; text-align: center; margin: 20px 0;">
-                <h1 style="color: #6366f1; font-size: 32px; letter-spacing: 4px; margin: 0;">{otp_code}</h1>
+                <h1 style="color: #6366f1; font-size: 32px; letter-spacing: 4px; margin: 0;">$otp_code</h1>
               </div>
               <p style="color: #6b7280; font-size: 14px;">This code will expire in 10 minutes.</p>
               <p style="color: #6b7280; font-size: 14px;">If you didn't request this code, please ignore this email.</p>
             </div>
           </body>
         </html>
-        """
-        
-        text_body = f"""
-        Welcome to Lucid Loom!
-        
-        Thank you for signing up! Please use the following verification code to complete your registration:
-        
-        {otp_code}
-        
-        This code will expire in 10 minutes.
-        
-        If you didn't request this code, please ignore this email.
-        """
-        
-        # Attach parts
-        part1 = MIMEText(text_body, "plain")
-        part2 = MIMEText(html_body, "html")
-        
-        msg.attach(part1)
-        msg.attach(part2)
-        
-        # Send email - support both STARTTLS (587) and SSL (465)
-        # Add timeout to prevent hanging on network issues
-        print(f"🔌 Connecting to SMTP server {SMTP_HOST}:{SMTP_PORT}...")
-        if SMTP_PORT == 465:
-            # Use SSL for port 465
-            print("🔐 Using SSL connection (port 465)")
-            with smtplib.SMTP_SSL(SMTP_HOST, SMTP_PORT, timeout=10) as server:
-                print("🔑 Attempting SMTP login...")
-                server.login(SMTP_USER, SMTP_PASSWORD)
-                print("📤 Sending email message...")
-                server.send_message(msg)
-                print("✅ Email sent successfully!")
+    """,
+)
+
+
+class _RenderCache:
+    """
+    Renders each distinct (template, params) once per batch, so a bulk send
+    of the same content (e.g. a digest) builds its bodies and MIME parts once.
+    """
+    def __init__(self) -> None:
+        self._rendered: dict[tuple, RenderedEmail] = {}
+        self._parts: dict[tuple, tuple[MIMEText, MIMEText]] = {}
+
+    @staticmethod
+    def key(message: dict) -> tuple:
+        return message["template"], json.dumps(message["params"], sort_keys=True)
+
+    def rendered(self, message: dict) -> RenderedEmail:
+        key = self.key(message)
+        if key not in self._rendered:
+            self._rendered[key] = render(message["template"], message["params"])
+        return self._rendered[key]
+
+    def mime_parts(self, message: dict) -> tuple[MIMEText, MIMEText]:
+        key = self.key(message)
+        if key not in self._parts:
+            rendered = self.rendered(message)
+            self._parts[key] = (MIMEText(rendered.text, "plain"), MIMEText(rendered.html, "html"))
+        return self._parts[key]
+
+
+# ---------- Transports ----------
+class _SMTPSession:
+    """
+    One SMTP connection, reused across messages and batches so the TLS
+    handshake and login happen once rather than per email.
+    Only used from the sender, one batch at a time.
+    """
+    def __init__(self) -> None:
+        self._server: smtplib.SMTP | None = None
+        self._last_used = 0.0
+
+    def _connect(self) -> smtplib.SMTP:
+        print(f"🔌 Connecting to SMTP server {SMTP_HOST}:{SMTP_PORT} ({SMTP_SECURITY})...")
+        if SMTP_SECURITY == "ssl":
+            server = smtplib.SMTP_SSL(SMTP_HOST, SMTP_PORT, timeout=SMTP_TIMEOUT)
         else:
-            # Use STARTTLS for port 587 (default)
-            print("🔐 Using STARTTLS connection (port 587)")
-            with smtplib.SMTP(SMTP_HOST, SMTP_PORT, timeout=10) as server:
-                print("🔒 Starting TLS...")
+            server = smtplib.SMTP(SMTP_HOST, SMTP_PORT, timeout=SMTP_TIMEOUT)
+            if SMTP_SECURITY == "starttls":
                 server.starttls()
-                print("🔑 Attempting SMTP login...")
-                server.login(SMTP_USER, SMTP_PASSWORD)
-                print("📤 Sending email message...")
-                server.send_message(msg)
-                print("✅ Email sent successfully!")
-        
-        print(f"✅ OTP email sent to {to_email} via SMTP")
-        return True
-        
-    except smtplib.SMTPException as e:
-        print(f"❌ SMTP error sending email to {to_email}: {e}")
-        import traceback
-        print(f"📋 Traceback: {traceback.format_exc()}")
-        return False
-    except OSError as e:
-        print(f"❌ Network error sending email to {to_email}: {e}")
-        import traceback
-        print(f"📋 Traceback: {traceback.format_exc()}")
-        return False
+        if SMTP_USER and SMTP_PASSWORD:
+            server.login(SMTP_USER, SMTP_PASSWORD)
+        return server
+
+    def send(self, msg: MIMEMultipart) -> None:
+        if self._server is not None and time.monotonic() - self._last_used > SMTP_IDLE_SECONDS:
+            self.close()
+        for attempt in range(2):
+            if self._server is None:
+                self._server = self._connect()
+            try:
+                self._server.send_message(msg)
+                self._last_used = time.monotonic()
+                return
+            except smtplib.SMTPServerDisconnected:
+                # Server dropped the idle session; reconnect once
+                self._server = None
+                if attempt:
+                    raise
+
+    def close_if_idle(self) -> None:
+        if self._server is not None and time.monotonic() - self._last_used > SMTP_IDLE_SECONDS:
+            self.close()
+
+    def close(self) -> None:
+        if self._server is None:
+            return
+        try:
+            self._server.quit()
+        except Exception:
+            pass
+        self._server = None
+
+
+_smtp = _SMTPSession()
+
+
+def _mime_message(message: dict, renders: _RenderCache) -> MIMEMultipart:
+    """Per-recipient envelope around body parts shared by identical messages"""
+    text_part, html_part = renders.mime_parts(message)
+    msg = MIMEMultipart("alternative")
+    msg["Subject"] = renders.rendered(message).subject
+    msg["From"] = f"{SMTP_FROM_NAME} <{SMTP_FROM_EMAIL}>"
+    msg["To"] = message["to_email"]
+    msg.attach(text_part)
+    msg.attach(html_part)
+    return msg
+
+
+def _send_batch_smtp(batch: list[dict]) -> list[str | None]:
+    """Send a batch over the shared session; one error (or None) per message"""
+    renders = _RenderCache()
+    errors = []
+    for message in batch:
+        try:
+            _smtp.send(_mime_message(message, renders))
+            errors.append(None)
+        except KeyError as e:
+            errors.append(f"Template error: {e}")
+        except (smtplib.SMTPException, OSError) as e:
+            # Connection state is unknown after a failure; start fresh next time
+            _smtp.close()
+            errors.append(f"SMTP error: {e}")
+    return errors
+
+
+async def _send_via_sendgrid(to_emails: list[str], rendered: RenderedEmail) -> str | None:
+    """
+    Send one rendered email using the SendGrid API; returns an error or None.
+    Each recipient gets its own personalization, so nobody sees the others.
+    """
+    payload = {
+        "personalizations": [
+            {"to": [{"email": to_email}], "subject": rendered.subject}
+            for to_email in to_emails
+        ],
+        "from": {
+            "email": SENDGRID_FROM_EMAIL,
+            "name": SENDGRID_FROM_NAME or "Lucid Loom",
+        },
+        "content": [
+            {"type": "text/plain", "value": rendered.text},
+            {"type": "text/html", "value": rendered.html},
+        ],
+    }
+    try:
+        async with http_client.client("sendgrid") as client:
+            response = await client.post(
+                SENDGRID_URL,
+                json=payload,
+                headers={"Authorization": f"Bearer {SENDGRID_API_KEY}"},
+            )
     except Exception as e:
-        print(f"❌ Unexpected error sending email to {to_email}: {e}")
-        import traceback
-        print(f"📋 Traceback: {traceback.format_exc()}")
-        return False
+        return f"SendGrid request failed: {e}"
+    if response.status_code == 202:
+        return None
+    return f"SendGrid API error {response.status_code}: {response.text or 'No error message'}"
+
+
+async def _deliver(batch: list[dict]) -> list[str | None]:
+    if not _use_sendgrid():
+        return await asyncio.to_thread(_send_batch_smtp, batch)
+    # One API call per distinct content; its result applies to every recipient
+    renders = _RenderCache()
+    groups: dict[tuple, list[int]] = {}
+    errors: list[str | None] = [None] * len(batch)
+    for i, message in enumerate(batch):
+        try:
+            renders.rendered(message)
+        except KeyError as e:
+            errors[i] = f"Template error: {e}"
+            continue
+        groups.setdefault(renders.key(message), []).append(i)
+    results = await asyncio.gather(*(
+        _send_via_sendgrid([batch[i]["to_email"] for i in indexes], renders.rendered(batch[indexes[0]]))
+        for indexes in groups.values()
+    ))
+    for indexes, error in zip(groups.values(), results):
+        for i in indexes:
+            errors[i] = error
+    return errors
+
+
+# ---------- Outbox sender ----------
+def _claim_batch() -> list[dict]:
+    """Requeue expired claims, then move up to EMAIL_BATCH_SIZE due messages to 'sending'"""
+    db = SessionLocal()
+    try:
+        now = datetime.utcnow()
+        (
+            db.query(models.EmailOutbox)
+            .filter(
+                models.EmailOutbox.status == "sending",
+                models.EmailOutbox.locked_at < now - timedelta(seconds=EMAIL_LEASE_SECONDS),
+            )
+            .update({"status": "queued", "locked_at": None}, synchronize_session=False)
+        )
+        ids = [
+            row.id
+            for row in db.query(models.EmailOutbox.id)
+            .filter(models.EmailOutbox.status == "queued", models.EmailOutbox.send_after <= now)
+            .order_by(models.EmailOutbox.send_after, models.EmailOutbox.id)
+            .limit(EMAIL_BATCH_SIZE)
+        ]
+        if not ids:
+            db.commit()
+            return []
+        # locked_at doubles as the claim token: a concurrent sender can't match it
+        (
+            db.query(models.EmailOutbox)
+            .filter(models.EmailOutbox.id.in_(ids), models.EmailOutbox.status == "queued")
+            .update(
+                {"status": "sending", "locked_at": now, "attempts": models.EmailOutbox.attempts + 1},
+                synchronize_session=False,
+            )
+        )
+        db.commit()
+        rows = (
+            db.query(models.EmailOutbox)
+            .filter(
+                models.EmailOutbox.id.in_(ids),
+                models.EmailOutbox.status == "sending",
+                models.EmailOutbox.locked_at == now,
+            )
+            .all()
+        )
+        return [
+            {
+                "id": row.id,
+                "to_email": row.to_email,
+                "template": row.template,
+                "params": json.loads(row.params or "{}"),
+                "attempts": row.attempts,
+            }
+            for row in rows
+        ]
+    finally:
+        db.close()
+
+
+def _record_results(batch: list[dict], errors: list[str | None]) -> None:
+    db = SessionLocal()
+    try:
+        now = datetime.utcnow()
+        for message, error in zip(batch, errors):
+            query = db.query(models.EmailOutbox).filter(models.EmailOutbox.id == message["id"])
+            if error is None:
+                # Sent messages drop their params (they may hold codes)
+                query.update(
+                    {"status": "sent", "sent_at": now, "locked_at": None, "last_error": None, "params": None},
+                    synchronize_session=False,
+                )
+                print(f"✅ {message['template']} email sent to {message['to_email']}")
+            elif message["attempts"] >= EMAIL_MAX_ATTEMPTS:
+                query.update(
+                    {"status": "failed", "locked_at": None, "last_error": error, "params": None},
+                    synchronize_session=False,
+                )
+                print(f"❌ Giving up on {message['template']} email to {message['to_email']} after {message['attempts']} attempts: {error}")
+            else:
+                delay = EMAIL_RETRY_BASE_DELAY * (2 ** (message["attempts"] - 1))
+                query.update(
+                    {
+                        "status": "queued",
+                        "locked_at": None,
+                        "last_error": error,
+                        "send_after": now + timedelta(seconds=delay),
+                    },
+                    synchronize_session=False,
+                )
+                print(f"🔁 Email to {message['to_email']} failed, retrying in {delay:.0f}s: {error}")
+        db.commit()
+    finally:
+        db.close()
+
+
+def _prune_outbox() -> int:
+    """Delete sent/failed messages older than EMAIL_OUTBOX_RETENTION_HOURS, in small batches"""
+    cutoff = datetime.utcnow() - timedelta(hours=EMAIL_OUTBOX_RETENTION_HOURS)
+    total = 0
+    while True:
+        db = SessionLocal()
+        try:
+            ids = [
+                row.id
+                for row in db.query(models.EmailOutbox.id)
+                .filter(models.EmailOutbox.status.in_(("sent", "failed")), models.EmailOutbox.created_at < cutoff)
+                .limit(EMAIL_PRUNE_BATCH)
+            ]
+            if ids:
+                db.query(models.EmailOutbox).filter(models.EmailOutbox.id.in_(ids)).delete(synchronize_session=False)
+                db.commit()
+        finally:
+            db.close()
+        total += len(ids)
+        if len(ids) < EMAIL_PRUNE_BATCH:
+            return total
+
+
+async def _sender() -> None:
+    next_prune = 0.0
+    while True:
+        _wake.clear()
+        try:
+            batch = await asyncio.to_thread(_claim_batch)
+        except Exception as e:
+            print(f"⚠️ Email sender failed to claim messages: {e}")
+            batch = []
+        if not batch:
+            await asyncio.to_thread(_smtp.close_if_idle)
+            if time.monotonic() >= next_prune:
+                next_prune = time.monotonic() + EMAIL_PRUNE_INTERVAL
+                try:
+                    count = await asyncio.to_thread(_prune_outbox)
+                    if count:
+                        print(f"🧹 Pruned {count} outbox message(s) older than {EMAIL_OUTBOX_RETENTION_HOURS:g}h")
+                except Exception as e:
+                    print(f"⚠️ Email outbox pruning failed: {e}")
+            try:
+                await asyncio.wait_for(_wake.wait(), timeout=EMAIL_POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            continue
+        errors = await _deliver(batch)
+        try:
+            await asyncio.to_thread(_record_results, batch, errors)
+        except Exception as e:
+            # Claims expire after EMAIL_LEASE_SECONDS and the messages are retried
+            print(f"⚠️ Email sender failed to record results: {e}")
+
+
+async def start() -> None:
+    """Start the outbox sender on the running loop. Called from the app lifespan."""
+    global _task, _wake, _loop
+    _loop = asyncio.get_running_loop()
+    _wake = asyncio.Event()
+    _task = asyncio.create_task(_sender())
+    print(f"📬 Email sender started ({'SendGrid' if _use_sendgrid() else f'SMTP {SMTP_HOST}:{SMTP_PORT}'})")
+
 
+async def stop() -> None:
+    global _task, _wake, _loop
+    if _task is not None:
+        _task.cancel()
+        await asyncio.gather(_task, return_exceptions=True)
+    _task = None
+    _wake = None
+    _loop = None
+    await asyncio.to_thread(_smtp.close)
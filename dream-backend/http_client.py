@@ -0,0 +1,83 @@
+import asyncio
+import os
+from contextlib import asynccontextmanager
+
+import httpx
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# HTTP/2 needs the optional `h2` package (pip install "httpx[http2]")
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+# Pool limits shared by every provider client
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "20"))
+HTTP_MAX_KEEPALIVE = int(os.getenv("HTTP_MAX_KEEPALIVE", "10"))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "30"))
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "10"))
+
+# Read timeouts per upstream provider (seconds)
+PROVIDER_TIMEOUTS = {
+    "groq": float(os.getenv("GROQ_TIMEOUT", "60")),
+    "openai": float(os.getenv("OPENAI_TIMEOUT", "90")),
+    "images": float(os.getenv("IMAGE_FETCH_TIMEOUT", "30")),  # Downloading generated images from blob storage
+    "sendgrid": float(os.getenv("SENDGRID_TIMEOUT", "10")),
+}
+
+_clients: dict[str, httpx.AsyncClient] = {}
+_loop: asyncio.AbstractEventLoop | None = None
+
+
+def _build_client(provider: str) -> httpx.AsyncClient:
+    timeout = PROVIDER_TIMEOUTS.get(provider, 30.0)
+    return httpx.AsyncClient(
+        http2=HTTP2_AVAILABLE,
+        limits=httpx.Limits(
+            max_connections=HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=HTTP_MAX_KEEPALIVE,
+            keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+        ),
+        timeout=httpx.Timeout(timeout, connect=HTTP_CONNECT_TIMEOUT),
+    )
+
+
+async def startup() -> None:
+    """Open one pooled client per provider. Called from the app lifespan."""
+    global _loop
+    _loop = asyncio.get_running_loop()
+    for provider in PROVIDER_TIMEOUTS:
+        if provider not in _clients:
+            _clients[provider] = _build_client(provider)
+    print(f"🌐 HTTP clients ready: {', '.join(_clients)} (http2={HTTP2_AVAILABLE})")
+
+
+async def shutdown() -> None:
+    """Close all pooled clients. Called from the app lifespan."""
+    global _loop
+    clients = list(_clients.values())
+    _clients.clear()
+    _loop = None
+    for client in clients:
+        await client.aclose()
+
+
+@asynccontextmanager
+async def client(provider: str):
+    """
+    Yield the shared client for a provider.
+    Connections belong to the loop they were opened on, so code running on a
+    different loop (or before startup) gets a short-lived client instead.
+    """
+    shared = _clients.get(provider)
+    if shared is not None and asyncio.get_running_loop() is _loop:
+        yield shared
+        return
+    temp = _build_client(provider)
+    try:
+        yield temp
+    finally:
+        await temp.aclose()
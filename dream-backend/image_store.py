@@ -0,0 +1,325 @@
+"""
+Content-addressed storage for generated images.
+
+DALL-E hands back blob URLs that expire after about an hour, so each image
+is downloaded once when it's generated and kept under the SHA-256 of its
+bytes. The key never changes for a given image, so it doubles as a strong
+ETag and responses can be cached forever.
+
+Backends: a local directory (default) or any S3-compatible bucket
+(AWS, MinIO, R2...) when IMAGE_STORE=s3.
+
+Smaller WebP/AVIF variants of each image are stored next to the original
+(<hash>_<width>.<format>). They are encoded with Pillow in a process pool;
+without Pillow only originals are served.
+"""
+import asyncio
+import hashlib
+import io
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterator, NamedTuple
+
+import http_client
+import cache
+
+IMAGE_STORE = os.getenv("IMAGE_STORE", "local").lower()
+IMAGE_STORE_DIR = os.getenv("IMAGE_STORE_DIR", "./images")
+IMAGE_S3_BUCKET = os.getenv("IMAGE_S3_BUCKET", "")
+IMAGE_S3_ENDPOINT = os.getenv("IMAGE_S3_ENDPOINT") or None  # e.g. http://localhost:9000 for MinIO
+IMAGE_S3_PREFIX = os.getenv("IMAGE_S3_PREFIX", "images/")
+IMAGE_MAX_BYTES = int(os.getenv("IMAGE_MAX_BYTES", str(20 * 1024 * 1024)))
+IMAGE_VARIANT_WIDTHS = tuple(sorted(int(w) for w in os.getenv("IMAGE_VARIANT_WIDTHS", "160,320,640").split(",") if w.strip()))
+IMAGE_WORKERS = int(os.getenv("IMAGE_WORKERS", str(min(2, os.cpu_count() or 1))))
+
+URL_PREFIX = "/api/images/"
+CHUNK_SIZE = 64 * 1024
+
+CONTENT_TYPES = {
+    "png": "image/png",
+    "jpg": "image/jpeg",
+    "webp": "image/webp",
+    "avif": "image/avif",
+}
+_EXTENSIONS = {content_type: ext for ext, content_type in CONTENT_TYPES.items()}
+_KEY_RE = re.compile(r"^[0-9a-f]{64}(_\d+)?\.(png|jpg|webp|avif)$")
+
+# Variant formats in order of preference (smallest first)
+VARIANT_QUALITY = {"avif": 50, "webp": 75}
+
+try:
+    from PIL import Image, features
+    PILLOW_AVAILABLE = True
+    VARIANT_FORMATS = tuple(fmt for fmt in VARIANT_QUALITY if features.check(fmt))
+except ImportError:
+    PILLOW_AVAILABLE = False
+    VARIANT_FORMATS = ()
+
+
+class ImageTooLarge(Exception):
+    pass
+
+
+class StoredImage(NamedTuple):
+    key: str
+    size: int
+    content_type: str
+
+    @property
+    def etag(self) -> str:
+        return f'"{self.key}"'
+
+
+class LocalImageStore:
+    """Images as files under root/ab/cd/<key>"""
+    def __init__(self, root: str) -> None:
+        self.root = root
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.root, key[:2], key[2:4], key)
+
+    def put(self, key: str, data: bytes) -> None:
+        path = self._path(key)
+        if os.path.exists(path):
+            return  # Same bytes already stored
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+
+    def size(self, key: str) -> int | None:
+        try:
+            return os.path.getsize(self._path(key))
+        except OSError:
+            return None
+
+    def read(self, key: str, start: int, end: int) -> Iterator[bytes]:
+        """Yield bytes start..end (inclusive)"""
+        with open(self._path(key), "rb") as f:
+            f.seek(start)
+            remaining = end - start + 1
+            while remaining > 0:
+                chunk = f.read(min(CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                yield chunk
+
+    def delete(self, key: str) -> None:
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+
+class S3ImageStore:
+    """Images as objects in an S3-compatible bucket (needs boto3)"""
+    def __init__(self, bucket: str, endpoint_url: str | None = None, prefix: str = "") -> None:
+        try:
+            import boto3
+        except ImportError:
+            raise RuntimeError("IMAGE_STORE=s3 requires boto3 (pip install boto3)")
+        self.bucket = bucket
+        self.prefix = prefix
+        self._s3 = boto3.client("s3", endpoint_url=endpoint_url)
+
+    def put(self, key: str, data: bytes) -> None:
+        ext = key.rsplit(".", 1)[-1]
+        self._s3.put_object(
+            Bucket=self.bucket,
+            Key=self.prefix + key,
+            Body=data,
+            ContentType=CONTENT_TYPES[ext],
+        )
+
+    def size(self, key: str) -> int | None:
+        from botocore.exceptions import ClientError
+        try:
+            head = self._s3.head_object(Bucket=self.bucket, Key=self.prefix + key)
+        except ClientError:
+            return None
+        return head["ContentLength"]
+
+    def read(self, key: str, start: int, end: int) -> Iterator[bytes]:
+        obj = self._s3.get_object(Bucket=self.bucket, Key=self.prefix + key, Range=f"bytes={start}-{end}")
+        yield from obj["Body"].iter_chunks(CHUNK_SIZE)
+
+    def delete(self, key: str) -> None:
+        self._s3.delete_object(Bucket=self.bucket, Key=self.prefix + key)
+
+
+def create_store():
+    """Pick the backend from IMAGE_STORE (local | s3)"""
+    if IMAGE_STORE == "s3":
+        return S3ImageStore(IMAGE_S3_BUCKET, IMAGE_S3_ENDPOINT, IMAGE_S3_PREFIX)
+    return LocalImageStore(IMAGE_STORE_DIR)
+
+
+store = create_store()
+
+
+# ---------- Keys and URLs ----------
+def key_for(data: bytes, content_type: str) -> str:
+    ext = _EXTENSIONS.get(content_type.split(";")[0].strip().lower(), "png")
+    return f"{hashlib.sha256(data).hexdigest()}.{ext}"
+
+
+def is_valid_key(key: str) -> bool:
+    return bool(_KEY_RE.match(key))
+
+
+def url_for(key: str) -> str:
+    """Path stored in DreamInterpretation.image_url (relative to the API)"""
+    return URL_PREFIX + key
+
+
+def key_from_url(url: str | None) -> str | None:
+    if not url or not url.startswith(URL_PREFIX):
+        return None
+    key = url[len(URL_PREFIX):]
+    return key if is_valid_key(key) else None
+
+
+def stat(key: str) -> StoredImage | None:
+    size = store.size(key)
+    if size is None:
+        return None
+    return StoredImage(key, size, CONTENT_TYPES[key.rsplit(".", 1)[-1]])
+
+
+# ---------- Saving ----------
+async def save_bytes(data: bytes, content_type: str = "image/png") -> str:
+    """Store image bytes and return their API URL"""
+    key = key_for(data, content_type)
+    await asyncio.to_thread(store.put, key, data)
+    return url_for(key)
+
+
+def delete(keys: list[str]) -> None:
+    """Remove stored images and their variants (blocking; callers on the event loop use a thread)"""
+    for key in keys:
+        digest = key.split(".")[0]
+        variants = [variant_key(digest, width, fmt) for width in IMAGE_VARIANT_WIDTHS for fmt in VARIANT_FORMATS]
+        for k in [key, *variants]:
+            try:
+                store.delete(k)
+            except Exception as e:
+                print(f"⚠️ Failed to delete stored image {k}: {e}")
+
+
+async def download(url: str) -> tuple[bytes, str]:
+    """Fetch an upstream image into memory, refusing anything over IMAGE_MAX_BYTES"""
+    async with http_client.client("images") as client:
+        async with client.stream("GET", url, follow_redirects=True) as resp:
+            resp.raise_for_status()
+            declared = int(resp.headers.get("content-length") or 0)
+            if declared > IMAGE_MAX_BYTES:
+                raise ImageTooLarge(f"Image is {declared} bytes (limit {IMAGE_MAX_BYTES})")
+            chunks = []
+            received = 0
+            async for chunk in resp.aiter_bytes():
+                received += len(chunk)
+                if received > IMAGE_MAX_BYTES:
+                    raise ImageTooLarge(f"Image exceeds {IMAGE_MAX_BYTES} bytes")
+                chunks.append(chunk)
+            return b"".join(chunks), resp.headers.get("content-type", "image/png")
+
+
+async def save_from_url(url: str) -> str:
+    """Download an upstream image once into the store and return its API URL"""
+    data, content_type = await download(url)
+    return await save_bytes(data, content_type)
+
+
+# ---------- Variants ----------
+_variant_executor: ProcessPoolExecutor | None = None
+_variant_builds = cache.SingleFlight()
+
+
+def variant_key(digest: str, width: int, fmt: str) -> str:
+    return f"{digest}_{width}.{fmt}"
+
+
+def pick_variant(key: str, size: int | None, accept: str | None) -> str | None:
+    """
+    Variant key for a requested display width and Accept header, or None to
+    serve the original. Picks the smallest width >= size, in the first
+    format the client accepts; wider than every variant gets the original
+    rather than an upscaled-looking thumbnail.
+    """
+    if not size or not VARIANT_FORMATS or "_" in key:
+        return None
+    accept = (accept or "").lower()
+    fmt = next((f for f in VARIANT_FORMATS if CONTENT_TYPES[f] in accept), None)
+    if fmt is None:
+        return None
+    width = next((w for w in IMAGE_VARIANT_WIDTHS if w >= size), None)
+    if width is None:
+        return None
+    return variant_key(key.split(".")[0], width, fmt)
+
+
+def encode_variants(data: bytes, widths: tuple, formats: tuple) -> dict[str, bytes]:
+    """Resize and encode one image (runs in the variant process pool)"""
+    source = Image.open(io.BytesIO(data))
+    source.load()
+    if source.mode not in ("RGB", "RGBA"):
+        source = source.convert("RGBA" if "transparency" in source.info else "RGB")
+    out = {}
+    for width in widths:
+        if width >= source.width:
+            resized = source
+        else:
+            height = round(source.height * width / source.width)
+            resized = source.resize((width, height), Image.LANCZOS)
+        for fmt in formats:
+            buf = io.BytesIO()
+            resized.save(buf, format=fmt.upper(), quality=VARIANT_QUALITY[fmt])
+            out[f"{width}.{fmt}"] = buf.getvalue()
+    return out
+
+
+def _variant_pool() -> ProcessPoolExecutor:
+    global _variant_executor
+    if _variant_executor is None:
+        _variant_executor = ProcessPoolExecutor(max_workers=IMAGE_WORKERS)
+    return _variant_executor
+
+
+def _read_all(key: str) -> bytes | None:
+    size = store.size(key)
+    if size is None:
+        return None
+    return b"".join(store.read(key, 0, size - 1))
+
+
+def _put_variants(digest: str, encoded: dict[str, bytes]) -> None:
+    for suffix, data in encoded.items():
+        store.put(f"{digest}_{suffix}", data)
+
+
+async def build_variants(key: str) -> None:
+    """Encode and store every variant of an original (concurrent calls share one build)"""
+    if not VARIANT_FORMATS or "_" in key:
+        return
+
+    async def build():
+        data = await asyncio.to_thread(_read_all, key)
+        if data is None:
+            return
+        loop = asyncio.get_running_loop()
+        encoded = await loop.run_in_executor(
+            _variant_pool(), encode_variants, data, IMAGE_VARIANT_WIDTHS, VARIANT_FORMATS
+        )
+        await asyncio.to_thread(_put_variants, key.split(".")[0], encoded)
+
+    await _variant_builds.do(key, build)
+
+
+def shutdown_variants() -> None:
+    global _variant_executor
+    if _variant_executor is not None:
+        _variant_executor.shutdown(wait=False, cancel_futures=True)
+        _variant_executor = None
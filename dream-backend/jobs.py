@@ -0,0 +1,293 @@
+"""
+Durable job queue backed by the `jobs` table.
+
+A fixed pool of async workers runs on the app's event loop and claims queued
+jobs from the database, so pending work survives restarts. Running jobs keep a
+lease alive with a heartbeat; jobs whose lease expires (process crashed or was
+killed mid-job) are put back in the queue. Finished jobs are deleted once
+they are older than JOB_RETENTION_HOURS.
+"""
+import asyncio
+import json
+import os
+import time
+import traceback
+from datetime import datetime, timedelta
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from database import SessionLocal
+import models
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "2"))
+JOB_LEASE_SECONDS = int(os.getenv("JOB_LEASE_SECONDS", "60"))
+JOB_RETRY_BASE_DELAY = float(os.getenv("JOB_RETRY_BASE_DELAY", "5"))
+JOB_RETENTION_HOURS = float(os.getenv("JOB_RETENTION_HOURS", "168"))  # Keep done/failed jobs this long
+JOB_PRUNE_INTERVAL = 3600
+JOB_PRUNE_BATCH = 1000
+
+# Max concurrent upstream calls per provider across all workers in this process
+PROVIDER_CONCURRENCY = {
+    "groq": int(os.getenv("GROQ_CONCURRENCY", "4")),
+    "openai": int(os.getenv("OPENAI_CONCURRENCY", "2")),
+}
+
+_handlers = {}
+_provider_slots: dict[str, asyncio.Semaphore] = {}
+_tasks: list[asyncio.Task] = []
+_wake: asyncio.Event | None = None
+_loop: asyncio.AbstractEventLoop | None = None
+
+
+def handler(kind: str):
+    """
+    Register an async handler for a job kind.
+    The handler is called as `await fn(payload, final_attempt=bool)`; raising
+    schedules a retry unless it was the final attempt.
+    """
+    def decorator(fn):
+        _handlers[kind] = fn
+        return fn
+    return decorator
+
+
+def enqueue(
+    db: Session, kind: str, payload: dict, max_attempts: int | None = None, commit: bool = True
+) -> models.Job:
+    """
+    Persist a new job and wake an idle worker.
+    With commit=False the job is only added to the caller's transaction, so it
+    exists exactly when the caller's own writes do; a worker is woken once
+    that transaction commits.
+    """
+    job = models.Job(
+        kind=kind,
+        payload=json.dumps(payload),
+        status="queued",
+        max_attempts=max_attempts or JOB_MAX_ATTEMPTS,
+        run_after=datetime.utcnow(),
+    )
+    db.add(job)
+    if not commit:
+        db.flush()
+        event.listen(db, "after_commit", lambda session: _notify(), once=True)
+        return job
+    db.commit()
+    db.refresh(job)
+    _notify()
+    return job
+
+
+def provider_slot(provider: str) -> asyncio.Semaphore:
+    """Semaphore bounding concurrent calls to an upstream provider"""
+    slot = _provider_slots.get(provider)
+    if slot is None:
+        slot = asyncio.Semaphore(PROVIDER_CONCURRENCY.get(provider, 4))
+        _provider_slots[provider] = slot
+    return slot
+
+
+def _notify() -> None:
+    if _loop is None or _wake is None:
+        return  # Workers not running; they'll pick the job up on startup
+    try:
+        running = asyncio.get_running_loop()
+    except RuntimeError:
+        running = None
+    if running is _loop:
+        _wake.set()
+    else:
+        _loop.call_soon_threadsafe(_wake.set)
+
+
+def _claim_next() -> dict | None:
+    """Atomically move one due job from queued to running"""
+    db = SessionLocal()
+    try:
+        now = datetime.utcnow()
+        candidates = (
+            db.query(models.Job.id)
+            .filter(models.Job.status == "queued", models.Job.run_after <= now)
+            .order_by(models.Job.run_after, models.Job.id)
+            .limit(5)
+            .all()
+        )
+        for (job_id,) in candidates:
+            claimed = (
+                db.query(models.Job)
+                .filter(models.Job.id == job_id, models.Job.status == "queued")
+                .update(
+                    {
+                        "status": "running",
+                        "locked_at": now,
+                        "attempts": models.Job.attempts + 1,
+                    },
+                    synchronize_session=False,
+                )
+            )
+            db.commit()
+            if claimed:
+                job = db.get(models.Job, job_id)
+                return {
+                    "id": job.id,
+                    "kind": job.kind,
+                    "payload": json.loads(job.payload or "{}"),
+                    "attempts": job.attempts,
+                    "max_attempts": job.max_attempts,
+                }
+        return None
+    finally:
+        db.close()
+
+
+def _update_job(job_id: int, **values) -> None:
+    db = SessionLocal()
+    try:
+        db.query(models.Job).filter(models.Job.id == job_id).update(values, synchronize_session=False)
+        db.commit()
+    finally:
+        db.close()
+
+
+def _requeue_stale() -> int:
+    """Requeue running jobs whose lease expired (their worker died)"""
+    db = SessionLocal()
+    try:
+        cutoff = datetime.utcnow() - timedelta(seconds=JOB_LEASE_SECONDS)
+        count = (
+            db.query(models.Job)
+            .filter(models.Job.status == "running", models.Job.locked_at < cutoff)
+            .update({"status": "queued", "locked_at": None}, synchronize_session=False)
+        )
+        db.commit()
+        return count
+    finally:
+        db.close()
+
+
+def _prune_finished() -> int:
+    """Delete done/failed jobs older than JOB_RETENTION_HOURS, in small batches"""
+    cutoff = datetime.utcnow() - timedelta(hours=JOB_RETENTION_HOURS)
+    total = 0
+    while True:
+        db = SessionLocal()
+        try:
+            ids = [
+                row.id
+                for row in db.query(models.Job.id)
+                .filter(models.Job.status.in_(("done", "failed")), models.Job.created_at < cutoff)
+                .limit(JOB_PRUNE_BATCH)
+            ]
+            if ids:
+                db.query(models.Job).filter(models.Job.id.in_(ids)).delete(synchronize_session=False)
+                db.commit()
+        finally:
+            db.close()
+        total += len(ids)
+        if len(ids) < JOB_PRUNE_BATCH:
+            return total
+
+
+async def _heartbeat(job_id: int) -> None:
+    while True:
+        await asyncio.sleep(JOB_LEASE_SECONDS / 3)
+        await asyncio.to_thread(_update_job, job_id, locked_at=datetime.utcnow())
+
+
+async def _run(job: dict) -> None:
+    fn = _handlers.get(job["kind"])
+    if fn is None:
+        print(f"❌ No handler registered for job kind '{job['kind']}' (job {job['id']})")
+        await asyncio.to_thread(_update_job, job["id"], status="failed", last_error="No handler registered")
+        return
+
+    final_attempt = job["attempts"] >= job["max_attempts"]
+    heartbeat = asyncio.create_task(_heartbeat(job["id"]))
+    try:
+        await fn(job["payload"], final_attempt=final_attempt)
+    except Exception as e:
+        traceback.print_exc()
+        if final_attempt:
+            print(f"❌ Job {job['id']} ({job['kind']}) failed after {job['attempts']} attempts: {e}")
+            await asyncio.to_thread(_update_job, job["id"], status="failed", locked_at=None, last_error=str(e))
+        else:
+            delay = JOB_RETRY_BASE_DELAY * (2 ** (job["attempts"] - 1))
+            print(f"🔁 Job {job['id']} ({job['kind']}) attempt {job['attempts']} failed, retrying in {delay:.0f}s: {e}")
+            await asyncio.to_thread(
+                _update_job,
+                job["id"],
+                status="queued",
+                locked_at=None,
+                last_error=str(e),
+                run_after=datetime.utcnow() + timedelta(seconds=delay),
+            )
+    else:
+        await asyncio.to_thread(_update_job, job["id"], status="done", locked_at=None, last_error=None)
+    finally:
+        heartbeat.cancel()
+
+
+async def _worker(number: int) -> None:
+    while True:
+        _wake.clear()
+        try:
+            job = await asyncio.to_thread(_claim_next)
+        except Exception as e:
+            print(f"⚠️ Job worker {number} failed to claim a job: {e}")
+            job = None
+        if job is None:
+            try:
+                await asyncio.wait_for(_wake.wait(), timeout=JOB_POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            continue
+        await _run(job)
+
+
+async def _reaper() -> None:
+    next_prune = 0.0
+    while True:
+        try:
+            count = await asyncio.to_thread(_requeue_stale)
+            if count:
+                print(f"♻️ Requeued {count} job(s) with an expired lease")
+        except Exception as e:
+            print(f"⚠️ Job reaper failed: {e}")
+        if time.monotonic() >= next_prune:
+            next_prune = time.monotonic() + JOB_PRUNE_INTERVAL
+            try:
+                count = await asyncio.to_thread(_prune_finished)
+                if count:
+                    print(f"🧹 Pruned {count} finished job(s) older than {JOB_RETENTION_HOURS:g}h")
+            except Exception as e:
+                print(f"⚠️ Job pruning failed: {e}")
+        await asyncio.sleep(JOB_LEASE_SECONDS)
+
+
+async def start() -> None:
+    """Start the worker pool on the running loop. Called from the app lifespan."""
+    global _wake, _loop
+    _loop = asyncio.get_running_loop()
+    _wake = asyncio.Event()
+    _tasks.append(asyncio.create_task(_reaper()))
+    for number in range(JOB_WORKERS):
+        _tasks.append(asyncio.create_task(_worker(number)))
+    print(f"🧵 Job queue started with {JOB_WORKERS} worker(s)")
+
+
+async def stop() -> None:
+    """
+    Cancel the workers. Jobs interrupted here stay 'running' and are
+    requeued by the next process once their lease expires.
+    """
+    global _wake, _loop
+    for task in _tasks:
+        task.cancel()
+    await asyncio.gather(*_tasks, return_exceptions=True)
+    _tasks.clear()
+    _provider_slots.clear()
+    _wake = None
+    _loop = None
@@ -1,21 +1,35 @@
 from fastapi import FastAPI, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordRequestForm
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi import BackgroundTasks, WebSocket, WebSocketDisconnect, Path
+from fastapi import WebSocket, WebSocketDisconnect, Path, Query, Request, Response, Header
 from fastapi.responses import StreamingResponse
-from sqlalchemy.orm import Session
-from typing import List
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, joinedload
+from typing import List, Optional, Union
+from contextlib import AsyncExitStack, asynccontextmanager
+from starlette.background import BackgroundTask
+from urllib.parse import urlparse
+import asyncio
 import httpx
 
-from database import Base, engine, get_db
+from database import Base, async_engine, engine, get_async_db, get_db, SessionLocal
+import database
 import models
 import schemas
 import auth
 import ai
+import cache
+import dream_tags
+import http_client
+import image_store
+import jobs
 from ws import manager
 import email_service
 from datetime import datetime, timedelta, timezone
 import secrets
+import os
 import re
 
 Base.metadata.create_all(bind=engine)
@@ -48,7 +62,26 @@ def generate_username(first_name: str, last_name: str, db: Session) -> str:
     
     return username
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Shared upstream HTTP clients live for the whole app lifetime
+    await http_client.startup()
+    await manager.start()
+    await jobs.start()
+    await email_service.start()
+    try:
+        yield
+    finally:
+        await email_service.stop()
+        await jobs.stop()
+        await manager.stop()
+        await http_client.shutdown()
+        auth.shutdown_hashing()
+        image_store.shutdown_variants()
+        await async_engine.dispose()
+
+
+app = FastAPI(lifespan=lifespan)
 
 # CORS middleware for frontend
 # Allow all Vercel domains (production and preview deployments)
@@ -69,6 +102,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
 
@@ -83,85 +117,252 @@ def health():
     return {"status": "healthy"}
 
 
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+
+
+def _metrics_access(
+    request: Request,
+    authorization: Optional[str] = Header(None),
+) -> None:
+    """
+    With METRICS_TOKEN set, /metrics needs "Authorization: Bearer <token>";
+    without it, only requests from this machine are answered.
+    """
+    if METRICS_TOKEN:
+        scheme, _, token = (authorization or "").partition(" ")
+        if scheme.lower() != "bearer" or not secrets.compare_digest(token.encode(), METRICS_TOKEN.encode()):
+            raise HTTPException(status_code=401, detail="Invalid metrics token")
+        return
+    host = request.client.host if request.client else ""
+    if host not in ("127.0.0.1", "::1", "localhost"):
+        raise HTTPException(status_code=403, detail="Metrics are only available locally (set METRICS_TOKEN)")
+
+
+@app.get("/metrics", dependencies=[Depends(_metrics_access)])
+def metrics():
+    """Process-local performance counters (see _metrics_access)"""
+    return {
+        "caches": cache.all_stats(),
+        "hashing": auth.hashing_stats(),
+        "websockets": manager.stats(),
+        "database": database.pool_stats(),
+    }
+
+
 # ---------- Image proxy endpoint ----------
+IMAGE_PROXY_ALLOWED_DOMAINS = (
+    "oaidalleapiprodscus.blob.core.windows.net",
+    "openai.com",
+    "dalleprodscus.blob.core.windows.net",
+    "blob.core.windows.net",
+)
+IMAGE_PROXY_FORWARD_HEADERS = ("content-length", "content-encoding", "etag", "last-modified")
+
+
+def _proxy_allowed(url: str) -> bool:
+    host = (urlparse(url).hostname or "").lower()
+    return any(host == domain or host.endswith("." + domain) for domain in IMAGE_PROXY_ALLOWED_DOMAINS)
+
+
 @app.get("/api/images/proxy")
 async def proxy_image(
     url: str,
+    if_none_match: Optional[str] = Header(None, alias="If-None-Match"),
     current_user: models.User = Depends(auth.get_current_user),
 ):
     """
     Proxy endpoint to fetch images from external sources (like Azure Blob Storage)
     with proper authentication. This solves 403 errors when frontend tries to load
-    images directly.
+    images directly. New images are served from /api/images/<key>; this is for
+    interpretations that still point at upstream URLs.
     
-    The endpoint requires authentication to prevent abuse, but the images themselves
-    are fetched server-side with proper headers.
+    The body is streamed through from the pooled "images" client chunk by
+    chunk, so memory stays flat however many viewers there are; bodies over
+    IMAGE_MAX_BYTES are cut off.
     """
     if not url:
         raise HTTPException(status_code=400, detail="URL parameter is required")
     
     # Validate that the URL is from a trusted source
-    allowed_domains = [
-        "oaidalleapiprodscus.blob.core.windows.net",
-        "openai.com",
-        "dalleprodscus.blob.core.windows.net",
-        "blob.core.windows.net",
-    ]
-    
-    if not any(domain in url for domain in allowed_domains):
+    if not _proxy_allowed(url):
         raise HTTPException(status_code=403, detail="URL not allowed")
     
+    # Closed when the body finishes streaming (or fails before that)
+    stack = AsyncExitStack()
     try:
-        async with httpx.AsyncClient(timeout=30.0, follow_redirects=True) as client:
-            # Fetch the image - Azure Blob Storage URLs from OpenAI should work without auth
-            # but we'll try with a user-agent to avoid blocking
-            headers = {
-                "User-Agent": "Mozilla/5.0 (compatible; LucidLoom/1.0)",
-            }
-            response = await client.get(url, headers=headers)
-            
-            if response.status_code != 200:
-                # If we get 403, the URL might have expired or need different handling
-                print(f"⚠️ Image proxy failed: {response.status_code} for {url[:100]}...")
-                raise HTTPException(
-                    status_code=response.status_code,
-                    detail=f"Failed to fetch image: {response.status_code}. The image URL may have expired."
-                )
-            
-            # Return the image with appropriate content type
-            content_type = response.headers.get("content-type", "image/png")
-            return StreamingResponse(
-                iter([response.content]),
-                media_type=content_type,
-                headers={
-                    "Cache-Control": "public, max-age=31536000",  # Cache for 1 year
-                    "Access-Control-Allow-Origin": "*",  # Allow CORS for images
-                }
+        client = await stack.enter_async_context(http_client.client("images"))
+        headers = {
+            "User-Agent": "Mozilla/5.0 (compatible; LucidLoom/1.0)",
+        }
+        if if_none_match:
+            headers["If-None-Match"] = if_none_match
+        response = await stack.enter_async_context(
+            client.stream("GET", url, headers=headers, follow_redirects=True)
+        )
+
+        if response.status_code == 304:
+            await stack.aclose()
+            return Response(status_code=304, headers={"ETag": response.headers.get("etag", "")})
+        if response.status_code != 200:
+            # If we get 403, the URL might have expired or need different handling
+            await stack.aclose()
+            print(f"⚠️ Image proxy failed: {response.status_code} for {url[:100]}...")
+            raise HTTPException(
+                status_code=response.status_code,
+                detail=f"Failed to fetch image: {response.status_code}. The image URL may have expired."
             )
+        declared = int(response.headers.get("content-length") or 0)
+        if declared > image_store.IMAGE_MAX_BYTES:
+            await stack.aclose()
+            raise HTTPException(status_code=502, detail="Upstream image is too large")
     except httpx.TimeoutException:
+        await stack.aclose()
         raise HTTPException(status_code=504, detail="Image fetch timeout")
     except HTTPException:
         raise  # Re-raise HTTP exceptions
     except Exception as e:
+        await stack.aclose()
         print(f"❌ Image proxy error: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Failed to proxy image: {str(e)}")
 
+    async def body():
+        received = 0
+        try:
+            # Raw bytes, so a forwarded Content-Length/Content-Encoding stays accurate
+            async for chunk in response.aiter_raw():
+                received += len(chunk)
+                if received > image_store.IMAGE_MAX_BYTES:
+                    print(f"⚠️ Image proxy aborted: body over {image_store.IMAGE_MAX_BYTES} bytes for {url[:100]}...")
+                    return
+                yield chunk
+        finally:
+            await stack.aclose()
 
-# ---------- Auth routes ----------
-@app.post("/auth/register", response_model=schemas.RegisterResponse)
-def register(
-    user_in: schemas.UserCreate,
-    db: Session = Depends(get_db)
+    forwarded = {
+        name: response.headers[name]
+        for name in IMAGE_PROXY_FORWARD_HEADERS
+        if name in response.headers
+    }
+    return StreamingResponse(
+        body(),
+        media_type=response.headers.get("content-type", "image/png"),
+        headers={
+            **forwarded,
+            "Cache-Control": "public, max-age=31536000",  # Cache for 1 year
+            "Access-Control-Allow-Origin": "*",  # Allow CORS for images
+        },
+        background=BackgroundTask(stack.aclose),
+    )
+
+
+# ---------- Stored images ----------
+def _unreferenced_image_keys(db: Session, image_urls: list) -> list[str]:
+    """Store keys among image_urls that no interpretation points at any more"""
+    keys = []
+    for url in set(image_urls):
+        key = image_store.key_from_url(url)
+        if key is None:
+            continue
+        # Rows orphaned by older deletes (dream_id NULL) don't keep an image alive
+        in_use = (
+            db.query(models.DreamInterpretation.id)
+            .filter(
+                models.DreamInterpretation.image_url == url,
+                models.DreamInterpretation.dream_id.isnot(None),
+            )
+            .first()
+        )
+        if in_use is None:
+            keys.append(key)
+    return keys
+
+
+def _parse_range(header: str, size: int) -> tuple[int, int] | None:
+    """Single `bytes=` range -> inclusive (start, end); None if unsatisfiable"""
+    match = re.fullmatch(r"bytes=(\d*)-(\d*)", header.strip())
+    if not match or match.groups() == ("", ""):
+        return None
+    first, last = match.groups()
+    if first == "":
+        # Suffix range: the last N bytes
+        length = int(last)
+        if length == 0:
+            return None
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        return None
+    return start, end
+
+
+@app.get("/api/images/{key}")
+async def get_stored_image(
+    key: str,
+    size: Optional[int] = Query(None, ge=1, le=4096, description="Display width in pixels; serves a WebP/AVIF thumbnail"),
+    accept: Optional[str] = Header(None),
+    range_header: Optional[str] = Header(None, alias="Range"),
+    if_none_match: Optional[str] = Header(None, alias="If-None-Match"),
+    current_user: models.User = Depends(auth.get_current_user),
 ):
-    """Register a new user - no OTP, user is logged in immediately"""
-    existing = auth.get_user_by_email(db, user_in.email)
-    if existing and existing.email_verified == "True":
-        raise HTTPException(status_code=400, detail="Email already registered. Please log in.")
-    
+    """
+    Serve a generated image from the content-addressed store.
+    Keys are content hashes, so responses are immutable: strong ETag,
+    If-None-Match -> 304, and single byte ranges -> 206.
+    With `size`, a resized variant in a format from the Accept header is
+    served instead (built on first request if missing); clients that accept
+    neither WebP nor AVIF get the original.
+    """
+    if not image_store.is_valid_key(key):
+        raise HTTPException(status_code=404, detail="Image not found")
+    image = None
+    variant = image_store.pick_variant(key, size, accept)
+    if variant is not None:
+        image = await asyncio.to_thread(image_store.stat, variant)
+        if image is None:
+            try:
+                await image_store.build_variants(key)
+                image = await asyncio.to_thread(image_store.stat, variant)
+            except Exception as e:
+                print(f"⚠️ Thumbnail build failed for {key}: {e}")
+    if image is None:
+        image = await asyncio.to_thread(image_store.stat, key)
+    if image is None:
+        raise HTTPException(status_code=404, detail="Image not found")
+
+    headers = {
+        "ETag": image.etag,
+        "Accept-Ranges": "bytes",
+        "Cache-Control": "private, max-age=31536000, immutable",
+        "Vary": "Accept",
+    }
+    if if_none_match and (if_none_match.strip() == "*" or image.etag in [t.strip() for t in if_none_match.split(",")]):
+        return Response(status_code=304, headers=headers)
+
+    start, end = 0, image.size - 1
+    status_code = 200
+    if range_header:
+        byte_range = _parse_range(range_header, image.size)
+        if byte_range is None:
+            return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{image.size}"})
+        start, end = byte_range
+        status_code = 206
+        headers["Content-Range"] = f"bytes {start}-{end}/{image.size}"
+    headers["Content-Length"] = str(end - start + 1)
+    return StreamingResponse(
+        image_store.store.read(image.key, start, end),
+        status_code=status_code,
+        media_type=image.content_type,
+        headers=headers,
+    )
+
+
+# ---------- Auth routes ----------
+def _save_registered_user(db: Session, existing: models.User | None, user_in: schemas.UserCreate, hashed: str) -> models.User:
+    """Activate an unverified account or create a new one (blocking DB work for register)"""
     if existing:
         # Update existing unverified user
         print(f"🔐 Register: User {user_in.email} exists but not verified, updating and activating")
-        hashed = auth.hash_password(user_in.password)
         existing.hashed_password = hashed
         existing.first_name = user_in.first_name
         existing.last_name = user_in.last_name
@@ -172,31 +373,48 @@ def register(
         existing.email_verified = "True"
         db.commit()
         db.refresh(existing)
-        user = existing
-    else:
-        # Create new user
-        hashed = auth.hash_password(user_in.password)
-        username = generate_username(user_in.first_name, user_in.last_name, db)
-        print(f"🔐 Register: Creating new user {user_in.email}")
-        print(f"   Username: {username}")
-        
-        new_user = models.User(
-            email=user_in.email,
-            username=username,
-            first_name=user_in.first_name,
-            last_name=user_in.last_name,
-            hashed_password=hashed,
-            otp_code=None,
-            otp_expires=None,
-            email_verified="True"
-        )
-        db.add(new_user)
-        db.commit()
-        db.refresh(new_user)
-        user = new_user
+        auth.invalidate_user(existing.id)
+        return existing
+
+    # Create new user
+    username = generate_username(user_in.first_name, user_in.last_name, db)
+    print(f"🔐 Register: Creating new user {user_in.email}")
+    print(f"   Username: {username}")
+    
+    new_user = models.User(
+        email=user_in.email,
+        username=username,
+        first_name=user_in.first_name,
+        last_name=user_in.last_name,
+        hashed_password=hashed,
+        otp_code=None,
+        otp_expires=None,
+        email_verified="True"
+    )
+    db.add(new_user)
+    db.commit()
+    db.refresh(new_user)
+    return new_user
+
+
+# The password routes are async so bcrypt can be awaited on the hashing pool
+# without holding a threadpool slot; their (sync) DB work goes to a thread
+# so it never blocks the event loop.
+@app.post("/auth/register", response_model=schemas.RegisterResponse)
+async def register(
+    user_in: schemas.UserCreate,
+    db: Session = Depends(get_db)
+):
+    """Register a new user - no OTP, user is logged in immediately"""
+    existing = await asyncio.to_thread(auth.get_user_by_email, db, user_in.email)
+    if existing and existing.email_verified == "True":
+        raise HTTPException(status_code=400, detail="Email already registered. Please log in.")
+    
+    hashed = await auth.hash_password_async(user_in.password)
+    user = await asyncio.to_thread(_save_registered_user, db, existing, user_in, hashed)
     
     # Generate access token - user is logged in immediately
-    access_token = auth.create_access_token(data={"sub": user.email})
+    access_token = auth.create_access_token(data={"sub": user.email, "uid": user.id})
     
     return {
         "message": "Account created successfully!",
@@ -232,9 +450,10 @@ def verify_otp(request: schemas.VerifyOTPRequest, db: Session = Depends(get_db))
     user.otp_expires = None
     db.commit()
     db.refresh(user)
+    auth.invalidate_user(user.id)
     
     # Generate access token
-    access_token = auth.create_access_token(data={"sub": user.email})
+    access_token = auth.create_access_token(data={"sub": user.email, "uid": user.id})
     
     return {
         "access_token": access_token,
@@ -281,19 +500,18 @@ def resend_otp(request: schemas.ResendOTPRequest, db: Session = Depends(get_db))
     user.otp_expires = otp_expires
     db.commit()
     
-    # Send OTP email
-    from email_service import send_otp_email
-    email_sent = send_otp_email(request.email, otp_code)
+    # Queue OTP email (delivered in the background by email_service)
+    email_queued = email_service.queue_otp_email(db, request.email, otp_code)
     
     # Log OTP for backend debugging only
     print(f"\n{'='*60}")
     print(f"🔐 OTP Resent for {request.email}")
     print(f"   OTP Code: {otp_code}")
     print(f"   Valid for: 10 minutes")
-    print(f"   Email sent: {email_sent}")
+    print(f"   Email queued: {email_queued}")
     print(f"{'='*60}\n")
     
-    if not email_sent:
+    if not email_queued:
         print(f"⚠️ Failed to resend OTP email to {request.email}")
         print(f"   Check email configuration in .env file")
         print(f"   SENDGRID_FROM_EMAIL must be a verified email in SendGrid")
@@ -307,32 +525,40 @@ def resend_otp(request: schemas.ResendOTPRequest, db: Session = Depends(get_db))
     return {
         "message": "A new verification code has been sent to your email. Please check your inbox and spam folder.",
         "email": request.email,
-        "otp_sent": email_sent
+        "otp_sent": email_queued
     }
 
 
+def _backfill_login_fields(db: Session, user: models.User) -> None:
+    """Fill in fields older accounts lack (blocking DB work for login)"""
+    # OTP verification is only required for signup, not for login
+    # Allow login regardless of email_verified status
+    # (For existing users without email_verified field, mark as verified for consistency)
+    if user.email_verified is None:
+        user.email_verified = "True"
+    
+    # Generate username for existing users who don't have one
+    if not user.username and (user.first_name or user.last_name):
+        user.username = generate_username(
+            user.first_name or "user",
+            user.last_name or "",
+            db
+        )
+        db.commit()
+        print(f"   Generated username for existing user: {user.username}")
+        auth.invalidate_user(user.id)
+
+
 @app.post("/auth/login")
-def login(
+async def login(
     form_data: OAuth2PasswordRequestForm = Depends(),
     db: Session = Depends(get_db),
 ):
-    # Try case-insensitive email lookup (SQLite compatible)
-    email_lower = form_data.username.lower().strip()
-    # Try exact match first
-    user = auth.get_user_by_email(db, form_data.username)
-    # If not found, try case-insensitive by checking all users
-    if not user:
-        all_users = db.query(models.User).all()
-        for u in all_users:
-            if u.email and u.email.lower() == email_lower:
-                user = u
-                break
+    # Case-insensitive email lookup (single indexed query)
+    user = await asyncio.to_thread(auth.get_user_by_email, db, form_data.username)
     
     if not user:
         print(f"❌ Login: User {form_data.username} not found")
-        # List all users for debugging (remove in production)
-        all_users = db.query(models.User).all()
-        print(f"   Available users: {[u.email for u in all_users]}")
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect email or password",
@@ -350,7 +576,7 @@ def login(
             detail="Incorrect email or password",
         )
     
-    password_valid = auth.verify_password(form_data.password, user.hashed_password)
+    password_valid = await auth.verify_password_async(form_data.password, user.hashed_password)
     print(f"   Password verification result: {password_valid}")
     print(f"   Input password length: {len(form_data.password)}")
     
@@ -361,24 +587,11 @@ def login(
             detail="Incorrect email or password",
         )
     
-    # OTP verification is only required for signup, not for login
-    # Allow login regardless of email_verified status
-    # (For existing users without email_verified field, mark as verified for consistency)
-    if user.email_verified is None:
-        user.email_verified = "True"
-    
-    # Generate username for existing users who don't have one
-    if not user.username and (user.first_name or user.last_name):
-        user.username = generate_username(
-            user.first_name or "user",
-            user.last_name or "",
-            db
-        )
-        db.commit()
-        print(f"   Generated username for existing user: {user.username}")
-        db.commit()
+    # Read before the backfill commits: expired attributes would reload on the event loop
+    email, user_id = user.email, user.id
+    await asyncio.to_thread(_backfill_login_fields, db, user)
 
-    token = auth.create_access_token({"sub": user.email})
+    token = auth.create_access_token(data={"sub": email, "uid": user_id})
     return {"access_token": token, "token_type": "bearer"}
 
 
@@ -402,19 +615,18 @@ def forgot_password(request: schemas.ForgotPasswordRequest, db: Session = Depend
     user.otp_expires = otp_expires
     db.commit()
     
-    # Send OTP email
-    from email_service import send_otp_email
-    email_sent = send_otp_email(user.email, otp_code)
+    # Queue OTP email (delivered in the background by email_service)
+    email_queued = email_service.queue_otp_email(db, user.email, otp_code)
     
     # Log OTP for backend debugging only
     print(f"\n{'='*60}")
     print(f"🔐 Password Reset OTP Generated for {user.email}")
     print(f"   OTP Code: {otp_code}")
     print(f"   Valid for: 10 minutes")
-    print(f"   Email sent: {email_sent}")
+    print(f"   Email queued: {email_queued}")
     print(f"{'='*60}\n")
     
-    if not email_sent:
+    if not email_queued:
         print(f"⚠️ Failed to send OTP email to {user.email}")
         return {
             "message": "Failed to send verification email. Please check your email configuration or try again later.",
@@ -458,11 +670,13 @@ def verify_reset_otp(request: schemas.VerifyResetOTPRequest, db: Session = Depen
 
 
 @app.post("/auth/reset-password")
-def reset_password(request: schemas.ResetPasswordRequest, db: Session = Depends(get_db)):
+async def reset_password(request: schemas.ResetPasswordRequest, db: Session = Depends(get_db)):
     """Reset password using token (after OTP verification)"""
     from datetime import datetime
     
-    user = db.query(models.User).filter(models.User.reset_token == request.token).first()
+    user = await asyncio.to_thread(
+        lambda: db.query(models.User).filter(models.User.reset_token == request.token).first()
+    )
     if not user:
         raise HTTPException(status_code=400, detail="Invalid or expired reset token")
     
@@ -470,26 +684,31 @@ def reset_password(request: schemas.ResetPasswordRequest, db: Session = Depends(
         raise HTTPException(status_code=400, detail="Reset token has expired")
     
     # Update password
-    user.hashed_password = auth.hash_password(request.new_password)
+    user.hashed_password = await auth.hash_password_async(request.new_password)
     user.reset_token = None
     user.reset_token_expires = None
-    db.commit()
+    user_id = user.id
+    await asyncio.to_thread(db.commit)
+    auth.invalidate_user(user_id)
     
     return {"message": "Password reset successfully"}
 
 
 @app.post("/auth/change-password")
-def change_password(
+async def change_password(
     request: schemas.ChangePasswordRequest,
     db: Session = Depends(get_db),
     current_user: models.User = Depends(auth.get_current_user),
 ):
     """Change password for logged-in user"""
-    if not auth.verify_password(request.current_password, current_user.hashed_password):
+    user = await asyncio.to_thread(auth.load_user_fresh, db, current_user.id)
+    if user is None or not await auth.verify_password_async(request.current_password, user.hashed_password):
         raise HTTPException(status_code=400, detail="Current password is incorrect")
     
-    current_user.hashed_password = auth.hash_password(request.new_password)
-    db.commit()
+    user.hashed_password = await auth.hash_password_async(request.new_password)
+    user_id = user.id
+    await asyncio.to_thread(db.commit)
+    auth.invalidate_user(user_id)
     
     return {"message": "Password changed successfully"}
 
@@ -511,29 +730,26 @@ def get_user_info(
 
 
 @app.get("/user/stats")
-def get_user_stats(
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(auth.get_current_user),
+async def get_user_stats(
+    db: AsyncSession = Depends(get_async_db),
+    current_user: models.User = Depends(auth.get_current_user_async),
 ):
     """Get user account statistics"""
-    dreams = (
-        db.query(models.Dream)
-        .filter(models.Dream.user_id == current_user.id)
-        .all()
+    from sqlalchemy import func
+
+    image_url = models.DreamInterpretation.image_url
+    result = await db.execute(
+        select(
+            func.count(models.Dream.id),
+            func.count(models.DreamInterpretation.id),
+            func.count(image_url).filter(image_url != ""),
+            func.min(models.Dream.created_at),
+            func.max(models.Dream.created_at),
+        )
+        .outerjoin(models.DreamInterpretation, models.DreamInterpretation.dream_id == models.Dream.id)
+        .where(models.Dream.user_id == current_user.id)
     )
-    
-    total_dreams = len(dreams)
-    dreams_with_images = sum(1 for d in dreams if d.interpretation and d.interpretation.image_url)
-    dreams_with_interpretation = sum(1 for d in dreams if d.interpretation)
-    
-    # Get oldest and newest dream dates
-    if dreams:
-        dates = [d.created_at for d in dreams if d.created_at]
-        oldest_dream = min(dates) if dates else None
-        newest_dream = max(dates) if dates else None
-    else:
-        oldest_dream = None
-        newest_dream = None
+    total_dreams, dreams_with_interpretation, dreams_with_images, oldest_dream, newest_dream = result.one()
     
     return {
         "total_dreams": total_dreams,
@@ -553,6 +769,7 @@ def export_user_data(
     """Export all user's dreams as JSON"""
     dreams = (
         db.query(models.Dream)
+        .options(joinedload(models.Dream.interpretation))
         .filter(models.Dream.user_id == current_user.id)
         .order_by(models.Dream.created_at.desc())
         .all()
@@ -587,59 +804,126 @@ def export_user_data(
     return export_data
 
 
-@app.delete("/user/account")
-def delete_account(
-    request: schemas.DeleteAccountRequest,
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(auth.get_current_user),
-):
-    """Delete user account and all associated data"""
-    # Verify password
-    if not auth.verify_password(request.password, current_user.hashed_password):
-        raise HTTPException(status_code=400, detail="Incorrect password")
-    
+def _delete_account_data(db: Session, user: models.User) -> None:
+    """Delete the user, their dreams and stored images (blocking; run in a thread)"""
     # Delete all user's dreams (cascade will delete interpretations)
     dreams = (
         db.query(models.Dream)
-        .filter(models.Dream.user_id == current_user.id)
+        .options(joinedload(models.Dream.interpretation))
+        .filter(models.Dream.user_id == user.id)
         .all()
     )
     
+    image_urls = []
     for dream in dreams:
         # Delete interpretation if exists
         if dream.interpretation:
+            image_urls.append(dream.interpretation.image_url)
             db.delete(dream.interpretation)
         db.delete(dream)
     
+    db.query(models.DreamSymbol).filter(models.DreamSymbol.user_id == user.id).delete()
+    db.query(models.DreamEmotion).filter(models.DreamEmotion.user_id == user.id).delete()
+    db.query(models.PatternProfile).filter(models.PatternProfile.user_id == user.id).delete()
+
     # Delete user account
-    db.delete(current_user)
+    user_id = user.id
+    db.delete(user)
     db.commit()
+    auth.invalidate_user(user_id)
+    image_store.delete(_unreferenced_image_keys(db, image_urls))
+
+
+@app.delete("/user/account")
+async def delete_account(
+    request: schemas.DeleteAccountRequest,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(auth.get_current_user),
+):
+    """Delete user account and all associated data"""
+    # Verify password
+    user = await asyncio.to_thread(auth.load_user_fresh, db, current_user.id)
+    if user is None or not await auth.verify_password_async(request.password, user.hashed_password):
+        raise HTTPException(status_code=400, detail="Incorrect password")
+    
+    await asyncio.to_thread(_delete_account_data, db, user)
     
     return {"message": "Account deleted successfully"}
 
 
-async def _process_dream(dream_id: int, db: Session, generate_image: bool = True) -> None:
-    # Load fresh copy in this DB session
-    dream = db.query(models.Dream).filter(models.Dream.id == dream_id).first()
+def _load_dream_for_processing(dream_id: int) -> dict | None:
+    """Fields _process_dream needs (blocking; run in a thread with its own session)"""
+    db = SessionLocal()
+    try:
+        dream = db.get(models.Dream, dream_id)
+        if dream is None:
+            return None
+        has_interpretation = (
+            db.query(models.DreamInterpretation.id)
+            .filter(models.DreamInterpretation.dream_id == dream_id)
+            .first()
+        ) is not None
+        return {
+            "id": dream.id,
+            "title": dream.title,
+            "raw_text": dream.raw_text,
+            "user_id": dream.user_id,
+            "has_interpretation": has_interpretation,
+        }
+    finally:
+        db.close()
+
+
+def _save_interpretation(dream: dict, values: dict, index_tags: bool) -> None:
+    """Store a dream's interpretation and its tag rows (blocking; run in a thread)"""
+    db = SessionLocal()
+    try:
+        db.add(models.DreamInterpretation(dream_id=dream["id"], **values))
+        if index_tags:
+            dream_tags.replace_tags(db, dream["id"], dream["user_id"], values["symbols"], values["emotions"])
+        try:
+            db.commit()
+        except IntegrityError:
+            # Another attempt saved this dream first (unique dream_id)
+            db.rollback()
+            print(f"ℹ️ Dream {dream['id']} already has an interpretation, keeping it")
+    finally:
+        db.close()
+
+
+async def _process_dream(
+    dream_id: int,
+    generate_image: bool = True,
+    final_attempt: bool = True,
+    bypass_cache: bool = False,
+) -> None:
+    # Database work runs in threads so a slow or locked write never blocks the loop
+    dream = await asyncio.to_thread(_load_dream_for_processing, dream_id)
     if not dream:
         print(f"❌ Dream {dream_id} not found in database")
         return
+    if dream["has_interpretation"]:
+        # A previous attempt already saved the result (e.g. job requeued after a crash)
+        print(f"ℹ️ Dream {dream_id} already has an interpretation, skipping")
+        await manager.send_to(dream_id, {"status": "done", "dreamId": dream_id})
+        return
     try:
-        print(f"🔄 Processing dream {dream_id}: {dream.title}")
+        print(f"🔄 Processing dream {dream_id}: {dream['title']}")
         # Notify: analyzing
         try:
             await manager.send_to(dream_id, {"status": "analyzing", "message": "Analyzing your dream..."})
         except Exception as ws_err:
             print(f"⚠️ WebSocket send failed (non-critical): {ws_err}")
         
-        print(f"📝 Analyzing dream text: {dream.raw_text[:50]}...")
+        print(f"📝 Analyzing dream text: {dream['raw_text'][:50]}...")
         # Check API key before attempting analysis
         import os
         groq_key = os.getenv("GROQ_API_KEY", "")
         if not groq_key or groq_key == "your_groq_api_key_here":
             raise ValueError("GROQ_API_KEY not configured. Please set GROQ_API_KEY in .env file.")
         
-        analysis = await ai.analyze_dream(dream.raw_text)
+        async with jobs.provider_slot("groq"):
+            analysis = await ai.analyze_dream(dream["raw_text"], bypass_cache=bypass_cache)
         print(f"✅ Analysis complete for dream {dream_id}")
         
         # Generate image only if requested (always uses paid DALL-E 3 for reliability)
@@ -651,7 +935,18 @@ async def _process_dream(dream_id: int, db: Session, generate_image: bool = True
             except Exception:
                 pass
             
-            image_url = await ai.generate_dream_image(analysis["image_prompt"], dream_text=dream.raw_text, use_free=False)
+            async with jobs.provider_slot("openai"):
+                image_url = await ai.generate_dream_image(analysis["image_prompt"], dream_text=dream["raw_text"], use_free=False)
+            # DALL-E URLs expire within hours; keep our own copy
+            try:
+                image_url = await image_store.save_from_url(image_url)
+            except Exception as e:
+                print(f"⚠️ Could not store image for dream {dream_id}, keeping upstream URL: {e}")
+            else:
+                try:
+                    await image_store.build_variants(image_store.key_from_url(image_url))
+                except Exception as e:
+                    print(f"⚠️ Could not build thumbnails for dream {dream_id}: {e}")
         
         # Convert symbols dict to string if needed
         symbols = analysis.get("symbols")
@@ -668,14 +963,14 @@ async def _process_dream(dream_id: int, db: Session, generate_image: bool = True
         elif emotions is None:
             emotions = None
         
-        interp = models.DreamInterpretation(
+        values = dict(
             poetic_narrative=analysis.get("poetic_narrative"),
             meaning=analysis.get("meaning"),
             symbols=symbols,
             emotions=emotions,
             image_url=image_url,
-            dream_id=dream.id,
         )
+        index_tags = True
     except ValueError as e:
         # API key not configured
         error_msg = str(e)
@@ -687,18 +982,25 @@ async def _process_dream(dream_id: int, db: Session, generate_image: bool = True
                 error_msg = "OpenAI API key not configured. Please set OPENAI_API_KEY in .env file (required for image generation)."
             else:
                 error_msg = "API key not configured. Please set GROQ_API_KEY (for text) and/or OPENAI_API_KEY (for images) in .env file."
-        interp = models.DreamInterpretation(
+        values = dict(
             poetic_narrative=None,
             meaning=f"⚠️ Configuration Error: {error_msg}",
             symbols=None,
             emotions=None,
             image_url=None,
-            dream_id=dream.id,
         )
+        index_tags = False
     except Exception as e:
         # Store error message as "meaning" so UI can display something helpful
         error_msg = str(e)
         print(f"❌ Exception for dream {dream_id}: {error_msg}")
+        if not final_attempt:
+            # Let the job queue retry with backoff before giving up
+            try:
+                await manager.send_to(dream_id, {"status": "retrying", "message": "Retrying interpretation..."})
+            except Exception:
+                pass
+            raise
         import traceback
         traceback.print_exc()
         if "API" in error_msg or "key" in error_msg.lower():
@@ -708,16 +1010,15 @@ async def _process_dream(dream_id: int, db: Session, generate_image: bool = True
                 error_msg = f"OpenAI API Error: {error_msg}. Please check your OPENAI_API_KEY configuration (required for image generation)."
             else:
                 error_msg = f"API Error: {error_msg}. Please check your API key configuration (GROQ_API_KEY for text, OPENAI_API_KEY for images)."
-        interp = models.DreamInterpretation(
+        values = dict(
             poetic_narrative=None,
             meaning=f"⚠️ AI interpretation unavailable: {error_msg}",
             symbols=None,
             emotions=None,
             image_url=None,
-            dream_id=dream.id,
         )
-    db.add(interp)
-    db.commit()
+        index_tags = False
+    await asyncio.to_thread(_save_interpretation, dream, values, index_tags)
     print(f"✅ Dream {dream_id} interpretation saved to database")
     # Notify any connected clients that this dream is ready
     try:
@@ -728,67 +1029,189 @@ async def _process_dream(dream_id: int, db: Session, generate_image: bool = True
         pass  # WebSocket might not be connected, that's okay
 
 
+@jobs.handler("process_dream")
+async def _process_dream_job(payload: dict, final_attempt: bool = True) -> None:
+    await _process_dream(
+        payload["dream_id"],
+        generate_image=payload.get("generate_image", True),
+        final_attempt=final_attempt,
+        bypass_cache=payload.get("bypass_cache", False),
+    )
+
+
+def _insert_dream(db: Session, dream_in: schemas.DreamCreate, user_id: int) -> models.Dream:
+    """Store a new dream and its processing job in one transaction, so a dream is never left without its job"""
+    dream = models.Dream(title=dream_in.title, raw_text=dream_in.raw_text, user_id=user_id)
+    db.add(dream)
+    db.flush()
+    jobs.enqueue(
+        db, "process_dream", {"dream_id": dream.id, "generate_image": dream_in.generate_image}, commit=False
+    )
+    db.commit()
+    db.refresh(dream)
+    dream.interpretation  # Load it here rather than during response serialization on the loop
+    return dream
+
+
 # ---------- Dream routes ----------
 @app.post("/dreams", response_model=schemas.DreamOut)
 async def create_dream(
     dream_in: schemas.DreamCreate,
-    background_tasks: BackgroundTasks,
     db: Session = Depends(get_db),
     current_user: models.User = Depends(auth.get_current_user),
 ):
-    # Create the base dream record first
-    dream = models.Dream(
-        title=dream_in.title,
-        raw_text=dream_in.raw_text,
-        user_id=current_user.id,
-    )
-    db.add(dream)
-    db.commit()
-    db.refresh(dream)
-    # Spawn background processing
-    # We pass a fresh session to the task
-    def runner(did: int, gen_img: bool):
-        # new session for background work
-        db_gen = get_db()
-        task_db = next(db_gen)
-        try:
-            import asyncio
-            asyncio.run(_process_dream(did, task_db, gen_img))
-        finally:
-            try:
-                next(db_gen, None)  # Close the generator
-            except StopIteration:
-                pass
-    background_tasks.add_task(runner, dream.id, dream_in.generate_image)
+    dream = await asyncio.to_thread(_insert_dream, db, dream_in, current_user.id)
+    await manager.send_to(dream.id, QUEUED_STATUS)
     # Return immediately without interpretation (WS will notify on completion)
     return dream
 
 
-@app.get("/dreams", response_model=List[schemas.DreamOut])
-def list_dreams(
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(auth.get_current_user),
+DREAM_SNIPPET_LENGTH = 200
+DREAM_PREVIEW_LENGTH = 120
+DREAM_MAX_TAG_FILTERS = 10
+
+
+def _encode_dream_cursor(created_at: datetime, dream_id: int) -> str:
+    import base64
+    raw = f"{created_at.isoformat()}|{dream_id}".encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii")
+
+
+def _like_pattern(text: str) -> str:
+    """Substring pattern for ilike(), with LIKE wildcards backslash-escaped"""
+    escaped = text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return f"%{escaped}%"
+
+
+def _decode_dream_cursor(cursor: str) -> tuple[datetime, int]:
+    import base64
+    try:
+        created_at, dream_id = base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8").split("|")
+        return datetime.fromisoformat(created_at), int(dream_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+@app.get("/dreams", response_model=Union[List[schemas.DreamOut], List[schemas.DreamSummaryOut]])
+async def list_dreams(
+    response: Response,
+    limit: Optional[int] = Query(None, ge=1, le=100),
+    cursor: Optional[str] = None,
+    view: str = Query("full", pattern="^(full|summary)$"),
+    q: Optional[str] = Query(None, max_length=200),
+    tag: List[str] = Query([]),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: models.User = Depends(auth.get_current_user_async),
 ):
-    dreams = (
-        db.query(models.Dream)
-        .filter(models.Dream.user_id == current_user.id)
-        .order_by(models.Dream.created_at.desc())
-        .all()
-    )
-    return dreams
+    """
+    List the user's dreams, newest first.
+    With `limit`, results are paginated by a keyset cursor on (created_at, id):
+    pass the `X-Next-Cursor` response header back as `cursor` for the next page.
+    `view=summary` returns DreamSummaryOut rows instead of full dreams.
+    `q` matches title, text and interpretation (case-insensitive); each `tag`
+    (repeatable) must be one of the dream's symbols or emotions.
+    Without `limit` the whole journal is returned (legacy behaviour).
+    """
+    from sqlalchemy import and_, exists, func, or_
+
+    if len(tag) > DREAM_MAX_TAG_FILTERS:
+        raise HTTPException(status_code=400, detail=f"At most {DREAM_MAX_TAG_FILTERS} tags")
+
+    if view == "summary":
+        image_url = models.DreamInterpretation.image_url
+        query = (
+            select(
+                models.Dream.id,
+                models.Dream.title,
+                models.Dream.created_at,
+                func.substr(models.Dream.raw_text, 1, DREAM_SNIPPET_LENGTH).label("snippet"),
+                models.DreamInterpretation.id.label("interpretation_id"),
+                image_url,
+                func.substr(models.DreamInterpretation.poetic_narrative, 1, DREAM_PREVIEW_LENGTH).label("preview"),
+            )
+            .outerjoin(models.DreamInterpretation, models.DreamInterpretation.dream_id == models.Dream.id)
+        )
+    else:
+        # Interpretations come in the same query: DreamOut serializes them, and
+        # lazy loads would be one SELECT per dream (and can't run on an AsyncSession)
+        query = select(models.Dream).options(joinedload(models.Dream.interpretation))
+
+    query = query.where(models.Dream.user_id == current_user.id)
+    if q and q.strip():
+        pattern = _like_pattern(q.strip())
+        interp = models.DreamInterpretation
+        query = query.where(or_(
+            models.Dream.title.ilike(pattern, escape="\\"),
+            models.Dream.raw_text.ilike(pattern, escape="\\"),
+            models.Dream.interpretation.has(or_(
+                interp.poetic_narrative.ilike(pattern, escape="\\"),
+                interp.meaning.ilike(pattern, escape="\\"),
+                interp.symbols.ilike(pattern, escape="\\"),
+                interp.emotions.ilike(pattern, escape="\\"),
+            )),
+        ))
+    for value in {dream_tags.normalize_tag(t) for t in tag if t.strip()}:
+        # Tags are stored normalized, so plain equality can use the (user_id, tag) indexes
+        query = query.where(or_(
+            exists().where(
+                models.DreamSymbol.dream_id == models.Dream.id,
+                models.DreamSymbol.user_id == current_user.id,
+                models.DreamSymbol.symbol == value,
+            ),
+            exists().where(
+                models.DreamEmotion.dream_id == models.Dream.id,
+                models.DreamEmotion.user_id == current_user.id,
+                models.DreamEmotion.emotion == value,
+            ),
+        ))
+    if cursor:
+        cursor_created_at, cursor_id = _decode_dream_cursor(cursor)
+        query = query.where(or_(
+            models.Dream.created_at < cursor_created_at,
+            and_(models.Dream.created_at == cursor_created_at, models.Dream.id < cursor_id),
+        ))
+    query = query.order_by(models.Dream.created_at.desc(), models.Dream.id.desc())
+
+    if limit is not None:
+        # Fetch one extra row to know whether another page exists
+        query = query.limit(limit + 1)
+    result = await db.execute(query)
+    rows = result.all() if view == "summary" else result.scalars().all()
+    if limit is not None and len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        if last.created_at is not None:
+            response.headers["X-Next-Cursor"] = _encode_dream_cursor(last.created_at, last.id)
+
+    if view == "summary":
+        return [
+            {
+                "id": row.id,
+                "title": row.title,
+                "created_at": row.created_at,
+                "has_image": bool(row.image_url),
+                "has_interpretation": row.interpretation_id is not None,
+                "snippet": row.snippet or "",
+                "image_url": row.image_url or None,
+                "preview": row.preview or None,
+            }
+            for row in rows
+        ]
+    return rows
 
 
 @app.get("/dreams/{dream_id}", response_model=schemas.DreamOut)
-def get_dream(
+async def get_dream(
     dream_id: int,
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(auth.get_current_user),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: models.User = Depends(auth.get_current_user_async),
 ):
-    dream = (
-        db.query(models.Dream)
-        .filter(models.Dream.id == dream_id, models.Dream.user_id == current_user.id)
-        .first()
+    result = await db.execute(
+        select(models.Dream)
+        .options(joinedload(models.Dream.interpretation))
+        .where(models.Dream.id == dream_id, models.Dream.user_id == current_user.id)
     )
+    dream = result.scalars().first()
     if not dream:
         raise HTTPException(status_code=404, detail="Dream not found")
     return dream
@@ -835,15 +1258,21 @@ def delete_dream(
     if not dream:
         raise HTTPException(status_code=404, detail="Dream not found")
     
+    image_url = None
+    if dream.interpretation:
+        image_url = dream.interpretation.image_url
+        _forget_folded_interpretation(db, dream.interpretation, current_user.id)
+        db.delete(dream.interpretation)
+    dream_tags.clear_tags(db, dream.id)
     db.delete(dream)
     db.commit()
+    image_store.delete(_unreferenced_image_keys(db, [image_url]))
     return {"message": "Dream deleted successfully"}
 
 
 @app.post("/dreams/{dream_id}/regenerate")
 async def regenerate_dream(
     dream_id: int,
-    background_tasks: BackgroundTasks,
     db: Session = Depends(get_db),
     current_user: models.User = Depends(auth.get_current_user),
 ):
@@ -858,23 +1287,21 @@ async def regenerate_dream(
     
     # Delete existing interpretation if it exists
     if dream.interpretation:
+        image_url = dream.interpretation.image_url
+        _forget_folded_interpretation(db, dream.interpretation, current_user.id)
         db.delete(dream.interpretation)
-        db.commit()
-    
-    # Spawn background processing (regenerate always includes image)
-    def runner(did: int):
-        db_gen = get_db()
-        task_db = next(db_gen)
-        try:
-            import asyncio
-            asyncio.run(_process_dream(did, task_db, generate_image=True))
-        finally:
-            try:
-                next(db_gen, None)  # Close the generator
-            except StopIteration:
-                pass
-    
-    background_tasks.add_task(runner, dream.id)
+        dream_tags.clear_tags(db, dream.id)
+    else:
+        image_url = None
+
+    # Queue background processing with the reset (regenerate always includes image and skips the analysis cache)
+    jobs.enqueue(
+        db, "process_dream", {"dream_id": dream.id, "generate_image": True, "bypass_cache": True}, commit=False
+    )
+    db.commit()
+    if image_url:
+        await asyncio.to_thread(image_store.delete, _unreferenced_image_keys(db, [image_url]))
+    await manager.send_to(dream.id, QUEUED_STATUS)
     return {"message": "Dream regeneration started", "dream_id": dream_id}
 
 
@@ -904,6 +1331,53 @@ async def rewrite_dream_style(
         raise HTTPException(status_code=500, detail=f"Failed to rewrite dream: {str(e)}")
 
 
+@app.post("/dreams/{dream_id}/rewrite/stream")
+async def rewrite_dream_style_stream(
+    dream_id: int,
+    rewrite_request: schemas.DreamRewriteRequest,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(auth.get_current_user),
+):
+    """
+    Streaming variant of /rewrite (text/event-stream).
+    Emits `token` events as Groq produces text, then a `done` event whose data
+    has the same shape as DreamRewriteResponse (or an `error` event).
+    """
+    import json
+
+    dream = (
+        db.query(models.Dream)
+        .filter(models.Dream.id == dream_id, models.Dream.user_id == current_user.id)
+        .first()
+    )
+    if not dream:
+        raise HTTPException(status_code=404, detail="Dream not found")
+    raw_text = dream.raw_text
+    style = rewrite_request.style
+
+    def sse(event: str, data: dict) -> str:
+        return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+    async def events():
+        parts = []
+        try:
+            async for text in ai.stream_rewrite_dream(raw_text, style):
+                parts.append(text)
+                yield sse("token", {"text": text})
+            yield sse("done", {"rewritten_narrative": "".join(parts).strip(), "style": style})
+        except Exception as e:
+            yield sse("error", {"detail": f"Failed to rewrite dream: {str(e)}"})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no",  # Disable proxy buffering so tokens flush immediately
+        },
+    )
+
+
 @app.get("/symbols/{symbol}/explain", response_model=schemas.SymbolExplanationResponse)
 async def explain_symbol_endpoint(
     symbol: str,
@@ -924,111 +1398,346 @@ async def explain_symbol_endpoint(
 
 
 # ---------- Analytics routes ----------
+ANALYTICS_TOP_N = 10
+ANALYTICS_MAX_DAYS = 366
+
+
 @app.get("/analytics/summary", response_model=schemas.AnalyticsSummary)
-def get_analytics(
+async def get_analytics(
+    tz: str = "UTC",
+    days: int = Query(30, ge=1, le=ANALYTICS_MAX_DAYS),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: models.User = Depends(auth.get_current_user_async),
+):
+    """
+    Dream counts, top symbols/emotions and a per-day histogram, aggregated in SQL.
+    `tz` is an IANA timezone name used for day buckets; `days` caps the
+    histogram to the most recent days that have dreams.
+    """
+    from sqlalchemy import func
+    from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+    from database import local_date
+
+    try:
+        ZoneInfo(tz)
+    except (ZoneInfoNotFoundError, ValueError):
+        raise HTTPException(status_code=400, detail=f"Unknown timezone: {tz}")
+
+    user_id = current_user.id
+    total_dreams = await db.scalar(
+        select(func.count(models.Dream.id))
+        .where(models.Dream.user_id == user_id)
+    )
+    dreams_with_images = await db.scalar(
+        select(func.count(models.DreamInterpretation.id))
+        .join(models.Dream, models.DreamInterpretation.dream_id == models.Dream.id)
+        .where(
+            models.Dream.user_id == user_id,
+            models.DreamInterpretation.image_url.isnot(None),
+            models.DreamInterpretation.image_url != "",
+        )
+    )
+
+    symbol_count = func.count(models.DreamSymbol.id).label("count")
+    top_symbols = (await db.execute(
+        select(models.DreamSymbol.symbol, symbol_count)
+        .where(models.DreamSymbol.user_id == user_id)
+        .group_by(models.DreamSymbol.symbol)
+        .order_by(symbol_count.desc(), models.DreamSymbol.symbol)
+        .limit(ANALYTICS_TOP_N)
+    )).all()
+    emotion_count = func.count(models.DreamEmotion.id).label("count")
+    top_emotions = (await db.execute(
+        select(models.DreamEmotion.emotion, emotion_count)
+        .where(models.DreamEmotion.user_id == user_id)
+        .group_by(models.DreamEmotion.emotion)
+        .order_by(emotion_count.desc(), models.DreamEmotion.emotion)
+        .limit(ANALYTICS_TOP_N)
+    )).all()
+
+    day = local_date(models.Dream.created_at, tz).label("day")
+    recent_days = (await db.execute(
+        select(day, func.count(models.Dream.id))
+        .where(models.Dream.user_id == user_id, models.Dream.created_at.isnot(None))
+        .group_by(day)
+        .order_by(day.desc())
+        .limit(days)
+    )).all()
+    dreams_by_day = [
+        {"day": d if isinstance(d, str) else d.isoformat(), "count": count}
+        for d, count in reversed(recent_days)
+    ]
+
+    return {
+        "total_dreams": total_dreams,
+        "dreams_with_images": dreams_with_images,
+        "top_symbols": [{"symbol": sym, "count": count} for sym, count in top_symbols],
+        "top_emotions": [{"emotion": emo, "count": count} for emo, count in top_emotions],
+        "dreams_by_day": dreams_by_day,
+    }
+
+
+@app.get("/analytics/symbols/{symbol}/dreams", response_model=schemas.SymbolDreamsResponse)
+def get_symbol_dreams(
+    symbol: str,
+    limit: int = Query(50, ge=1, le=500),
     db: Session = Depends(get_db),
     current_user: models.User = Depends(auth.get_current_user),
 ):
-    from collections import Counter
-    from datetime import datetime
-    
-    # Get all user's dreams with interpretations
+    """Dreams whose interpretation contains a symbol (index lookup on dream_symbols)"""
+    symbol = dream_tags.normalize_tag(symbol)
     dreams = (
-        db.query(models.Dream)
-        .filter(models.Dream.user_id == current_user.id)
+        db.query(models.Dream.id, models.Dream.title, models.Dream.created_at)
+        .join(models.DreamSymbol, models.DreamSymbol.dream_id == models.Dream.id)
+        .filter(models.DreamSymbol.user_id == current_user.id, models.DreamSymbol.symbol == symbol)
+        .order_by(models.Dream.created_at.desc(), models.Dream.id.desc())
+        .limit(limit)
         .all()
     )
-    
-    total_dreams = len(dreams)
-    dreams_with_images = sum(1 for d in dreams if d.interpretation and d.interpretation.image_url)
-    
-    # Extract symbols and emotions
-    all_symbols = []
-    all_emotions = []
-    # Store dreams with their full datetime for frontend timezone conversion
-    dreams_with_dates = []
-    
-    for dream in dreams:
-        if dream.interpretation:
-            # Parse symbols (comma-separated or newline-separated)
-            if dream.interpretation.symbols:
-                symbols = [s.strip() for s in dream.interpretation.symbols.replace('\n', ',').split(',') if s.strip()]
-                all_symbols.extend(symbols)
-            
-            # Parse emotions (comma-separated or newline-separated)
-            if dream.interpretation.emotions:
-                emotions = [e.strip() for e in dream.interpretation.emotions.replace('\n', ',').split(',') if e.strip()]
-                all_emotions.extend(emotions)
-        
-        # Store full datetime ISO string so frontend can convert to user's local timezone
-        if dream.created_at:
-            dreams_with_dates.append({
-                "created_at": dream.created_at.isoformat(),
-                "count": 1
-            })
-    
-    # Get top symbols and emotions
-    symbol_counts = Counter(all_symbols)
-    emotion_counts = Counter(all_emotions)
-    
-    top_symbols = [{"symbol": sym, "count": count} for sym, count in symbol_counts.most_common(10)]
-    top_emotions = [{"emotion": emo, "count": count} for emo, count in emotion_counts.most_common(10)]
-    
-    # Send full datetime info - frontend will group by local day
-    # Return dreams with their ISO timestamps so frontend can convert to local timezone
     return {
-        "total_dreams": total_dreams,
-        "dreams_with_images": dreams_with_images,
-        "top_symbols": top_symbols,
-        "top_emotions": top_emotions,
-        "dreams_with_dates": dreams_with_dates,  # Changed from dreams_by_day
+        "symbol": symbol,
+        "dreams": [
+            {"id": d.id, "title": d.title, "created_at": d.created_at.isoformat() if d.created_at else None}
+            for d in dreams
+        ],
     }
 
 
-@app.post("/analytics/patterns", response_model=schemas.PatternAnalysisResponse)
-async def analyze_patterns(
+@app.get("/analytics/symbols/{symbol}/co-occurrence", response_model=schemas.SymbolCooccurrenceResponse)
+def get_symbol_cooccurrence(
+    symbol: str,
     db: Session = Depends(get_db),
     current_user: models.User = Depends(auth.get_current_user),
 ):
-    """Analyze patterns across all user's dreams using AI"""
-    # Get all user's dreams with interpretations
-    dreams = (
-        db.query(models.Dream)
-        .filter(models.Dream.user_id == current_user.id)
-        .order_by(models.Dream.created_at.asc())
+    """Symbols and emotions that most often appear in the same dreams as a symbol"""
+    from sqlalchemy import func
+    from sqlalchemy.orm import aliased
+
+    symbol = dream_tags.normalize_tag(symbol)
+
+    anchor = aliased(models.DreamSymbol)
+    anchor_dreams = (
+        db.query(anchor.dream_id)
+        .filter(anchor.user_id == current_user.id, anchor.symbol == symbol)
+        .subquery()
+    )
+
+    symbol_count = func.count(models.DreamSymbol.id).label("count")
+    symbols = (
+        db.query(models.DreamSymbol.symbol, symbol_count)
+        .filter(models.DreamSymbol.dream_id.in_(anchor_dreams.select()), models.DreamSymbol.symbol != symbol)
+        .group_by(models.DreamSymbol.symbol)
+        .order_by(symbol_count.desc(), models.DreamSymbol.symbol)
+        .limit(ANALYTICS_TOP_N)
         .all()
     )
-    
-    if len(dreams) < 2:
+    emotion_count = func.count(models.DreamEmotion.id).label("count")
+    emotions = (
+        db.query(models.DreamEmotion.emotion, emotion_count)
+        .filter(models.DreamEmotion.dream_id.in_(anchor_dreams.select()))
+        .group_by(models.DreamEmotion.emotion)
+        .order_by(emotion_count.desc(), models.DreamEmotion.emotion)
+        .limit(ANALYTICS_TOP_N)
+        .all()
+    )
+    return {
+        "symbol": symbol,
+        "symbols": [{"symbol": sym, "count": count} for sym, count in symbols],
+        "emotions": [{"emotion": emo, "count": count} for emo, count in emotions],
+    }
+
+
+PATTERN_BATCH_SIZE = int(os.getenv("PATTERN_BATCH_SIZE", "25"))
+PATTERN_KEYS = ["recurring_themes", "emotional_patterns", "symbol_patterns", "temporal_insights", "personal_growth", "recommendations"]
+_pattern_updates = cache.SingleFlight()
+
+
+def _unfolded_interpretations(db: Session, user_id: int):
+    """Query for the user's interpretations not yet folded into their pattern profile"""
+    return (
+        db.query(models.Dream, models.DreamInterpretation)
+        .join(models.DreamInterpretation, models.DreamInterpretation.dream_id == models.Dream.id)
+        .filter(models.Dream.user_id == user_id, models.DreamInterpretation.pattern_folded_at.is_(None))
+    )
+
+
+def _forget_folded_interpretation(db: Session, interpretation: models.DreamInterpretation, user_id: int) -> None:
+    """
+    Call before deleting an interpretation (caller commits). The model can
+    add dreams to an analysis but not take them back out, and rebuilding
+    the whole profile on every delete or regenerate would re-send all of
+    the user's dreams; the profile is kept as is (slightly stale) and only
+    its count is corrected.
+    """
+    if interpretation.pattern_folded_at is not None:
+        (
+            db.query(models.PatternProfile)
+            .filter(models.PatternProfile.user_id == user_id, models.PatternProfile.dreams_analyzed > 0)
+            .update({"dreams_analyzed": models.PatternProfile.dreams_analyzed - 1}, synchronize_session=False)
+        )
+
+
+def _load_pattern_batch(user_id: int) -> tuple[dict | None, int, list[dict], list[int], bool]:
+    """
+    Blocking read for _fold_pattern_batch, in its own session: (stored
+    analysis, dreams it covers, dreams_data for the model, their
+    interpretation ids, whether more are waiting after this batch).
+    """
+    import json
+
+    db = SessionLocal()
+    try:
+        profile = db.query(models.PatternProfile).filter(models.PatternProfile.user_id == user_id).first()
+        batch = (
+            _unfolded_interpretations(db, user_id)
+            .order_by(models.DreamInterpretation.id.asc())
+            .limit(PATTERN_BATCH_SIZE + 1)
+            .all()
+        )
+        more = len(batch) > PATTERN_BATCH_SIZE
+        batch = batch[:PATTERN_BATCH_SIZE]
+        dreams_data = [
+            {
+                "title": dream.title,
+                "raw_text": dream.raw_text,
+                "created_at": dream.created_at.isoformat() if dream.created_at else None,
+                "symbols": interp.symbols or "",
+                "emotions": interp.emotions or "",
+            }
+            for dream, interp in batch
+        ]
+        return (
+            json.loads(profile.analysis) if profile else None,
+            profile.dreams_analyzed if profile else 0,
+            dreams_data,
+            [interp.id for _, interp in batch],
+            more,
+        )
+    finally:
+        db.close()
+
+
+def _store_pattern_batch(user_id: int, analysis: dict, interpretation_ids: list[int]) -> None:
+    """Blocking write for _fold_pattern_batch: save the analysis and mark the batch folded"""
+    import json
+
+    db = SessionLocal()
+    try:
+        now = datetime.utcnow()
+        (
+            db.query(models.DreamInterpretation)
+            .filter(models.DreamInterpretation.id.in_(interpretation_ids))
+            .update({"pattern_folded_at": now}, synchronize_session=False)
+        )
+        profile = db.query(models.PatternProfile).filter(models.PatternProfile.user_id == user_id).first()
+        if profile is None:
+            profile = models.PatternProfile(user_id=user_id)
+            db.add(profile)
+        profile.analysis = json.dumps(analysis)
+        db.flush()
+        profile.dreams_analyzed = (
+            db.query(models.DreamInterpretation.id)
+            .join(models.Dream, models.DreamInterpretation.dream_id == models.Dream.id)
+            .filter(models.Dream.user_id == user_id, models.DreamInterpretation.pattern_folded_at.isnot(None))
+            .count()
+        )
+        profile.updated_at = now
+        db.commit()
+    finally:
+        db.close()
+
+
+async def _fold_pattern_batch(user_id: int) -> tuple[dict | None, bool]:
+    """
+    Fold up to PATTERN_BATCH_SIZE unfolded interpretations into the stored
+    analysis with one LLM call. Returns (current analysis or None, whether
+    more interpretations are still waiting). Runs under SingleFlight, which
+    may outlive the request that started it, so it uses its own sessions
+    rather than the request's.
+    """
+    previous, previous_count, dreams_data, interpretation_ids, more = await asyncio.to_thread(
+        _load_pattern_batch, user_id
+    )
+    if not dreams_data:
+        return previous, False
+
+    analysis = await ai.analyze_dream_patterns(
+        dreams_data,
+        previous_analysis=previous,
+        previous_count=previous_count,
+    )
+    analysis = {key: analysis.get(key, "") for key in PATTERN_KEYS}
+    # Commit per batch so a failure later on keeps the progress made so far
+    await asyncio.to_thread(_store_pattern_batch, user_id, analysis, interpretation_ids)
+    print(f"✅ Pattern profile for user {user_id} updated with {len(dreams_data)} dream(s)")
+    return analysis, more
+
+
+def _fold_patterns_once(user_id: int):
+    # One batch in flight per user: the request path and the backfill job share it
+    return _pattern_updates.do(str(user_id), lambda: _fold_pattern_batch(user_id))
+
+
+def _enqueue_pattern_backfill(db: Session, user_id: int) -> None:
+    import json
+
+    payload = json.dumps({"user_id": user_id})
+    pending = (
+        db.query(models.Job.id)
+        .filter(
+            models.Job.kind == "pattern_backfill",
+            models.Job.status.in_(("queued", "running")),
+            models.Job.payload == payload,
+        )
+        .first()
+    )
+    if pending is None:
+        jobs.enqueue(db, "pattern_backfill", {"user_id": user_id})
+
+
+def _pattern_state(db: Session, user_id: int) -> tuple[int, models.PatternProfile | None, int]:
+    """(dream count, stored profile, interpretations waiting to be folded in)"""
+    dream_count = db.query(models.Dream).filter(models.Dream.user_id == user_id).count()
+    profile = db.query(models.PatternProfile).filter(models.PatternProfile.user_id == user_id).first()
+    pending = _unfolded_interpretations(db, user_id).count()
+    return dream_count, profile, pending
+
+
+@jobs.handler("pattern_backfill")
+async def _pattern_backfill_job(payload: dict, final_attempt: bool = True) -> None:
+    """Fold a large backlog of interpretations into a profile, one batch at a time"""
+    more = True
+    while more:
+        _, more = await _fold_patterns_once(payload["user_id"])
+
+
+@app.post("/analytics/patterns", response_model=schemas.PatternAnalysisResponse)
+async def analyze_patterns(
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(auth.get_current_user),
+):
+    """
+    Analyze patterns across all user's dreams using AI.
+    The analysis is persisted per user and only interpretations it hasn't
+    seen are sent to the model, at most one batch per request; a larger
+    backlog is folded in by a background job while the current profile
+    is returned.
+    """
+    import json
+
+    user_id = current_user.id
+    dream_count, profile, pending = await asyncio.to_thread(_pattern_state, db, user_id)
+    if dream_count < 2:
         raise HTTPException(
             status_code=400,
             detail="Need at least 2 dreams to analyze patterns. Keep logging your dreams!"
         )
-    
-    # Prepare dreams data for AI analysis
-    dreams_data = []
-    for dream in dreams:
-        dream_dict = {
-            "title": dream.title,
-            "raw_text": dream.raw_text,
-            "created_at": dream.created_at.isoformat() if dream.created_at else None,
-        }
-        if dream.interpretation:
-            dream_dict["symbols"] = dream.interpretation.symbols or ""
-            dream_dict["emotions"] = dream.interpretation.emotions or ""
-        dreams_data.append(dream_dict)
-    
+
+    analysis = json.loads(profile.analysis) if profile else None
+    backlog = pending > PATTERN_BATCH_SIZE
     try:
-        analysis = await ai.analyze_dream_patterns(dreams_data)
-        print(f"✅ Pattern analysis successful. Keys received: {list(analysis.keys())}")
-        return {
-            "recurring_themes": analysis.get("recurring_themes", ""),
-            "emotional_patterns": analysis.get("emotional_patterns", ""),
-            "symbol_patterns": analysis.get("symbol_patterns", ""),
-            "temporal_insights": analysis.get("temporal_insights", ""),
-            "personal_growth": analysis.get("personal_growth", ""),
-            "recommendations": analysis.get("recommendations", ""),
-        }
+        if pending and (profile is None or not backlog):
+            analysis, backlog = await _fold_patterns_once(user_id)
     except ValueError as e:
         # API key or configuration errors
         print(f"❌ Configuration error in pattern analysis: {str(e)}")
@@ -1040,15 +1749,196 @@ async def analyze_patterns(
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=f"Failed to analyze patterns: {str(e)}")
 
+    if backlog:
+        await asyncio.to_thread(_enqueue_pattern_backfill, db, user_id)
+
+    if analysis is None:
+        raise HTTPException(
+            status_code=400,
+            detail="Your dreams are still being interpreted. Try again in a moment."
+        )
+    return analysis
+
 
 # ---------- WebSocket for dream status ----------
+QUEUED_STATUS = {"status": "queued", "message": "Waiting to be interpreted..."}
+
+
+def _current_status(db: Session, dream_ids: list[int], user_id: int | None = None) -> dict[int, dict]:
+    """
+    Status to replay for dreams with no event in memory, keyed by dream id.
+    With user_id, dreams the user doesn't own are left out.
+    """
+    query = (
+        db.query(models.Dream.id, models.DreamInterpretation.id)
+        .outerjoin(models.DreamInterpretation, models.DreamInterpretation.dream_id == models.Dream.id)
+        .filter(models.Dream.id.in_(dream_ids))
+    )
+    if user_id is not None:
+        query = query.filter(models.Dream.user_id == user_id)
+    return {
+        dream_id: {"status": "done", "dreamId": dream_id} if interp_id else {**QUEUED_STATUS, "dreamId": dream_id}
+        for dream_id, interp_id in query.all()
+    }
+
+
+def _load_current_status(dream_ids: list[int], user_id: int | None = None) -> dict[int, dict]:
+    """_current_status in its own session, for sockets (run with asyncio.to_thread)"""
+    db = SessionLocal()
+    try:
+        return _current_status(db, dream_ids, user_id)
+    finally:
+        db.close()
+
+
 @app.websocket("/ws/dream-status/{dream_id}")
 async def dream_status_ws(websocket: WebSocket, dream_id: int = Path(..., ge=1)):
-    await manager.connect(dream_id, websocket)
+    """Single-dream status socket (kept for older clients; prefer /ws/status)"""
+    conn = await manager.connect(websocket)
+    current = await asyncio.to_thread(_load_current_status, [dream_id])
+    manager.subscribe(conn, dream_id, current.get(dream_id))
     try:
         while True:
             # We don't expect messages from client; keep the socket open
             await websocket.receive_text()
     except WebSocketDisconnect:
-        manager.disconnect(dream_id, websocket)
+        pass
+    finally:
+        manager.disconnect(websocket)
+
+
+def _ws_user_id(token: str) -> int | None:
+    """Blocking token check for sockets (run with asyncio.to_thread)"""
+    db = SessionLocal()
+    try:
+        return auth.user_from_token(token, db).id
+    except HTTPException:
+        return None
+    finally:
+        db.close()
+
+
+def _ws_dream_ids(value) -> list[int]:
+    if not isinstance(value, list):
+        raise ValueError("dreamIds must be a list")
+    return [int(dream_id) for dream_id in value]
+
+
+@app.websocket("/ws/status")
+async def user_status_ws(websocket: WebSocket, token: str = Query(...)):
+    """
+    One authenticated socket per user carrying status events for any number
+    of their dreams. Browsers can't set headers on a WebSocket, so the access
+    token comes in the query string.
+
+    Client messages:
+      {"action": "subscribe", "dreamIds": [1, 2]}   -> replays each dream's latest status
+      {"action": "unsubscribe", "dreamIds": [1]}
+    Every event carries "dreamId".
+    """
+    user_id = await asyncio.to_thread(_ws_user_id, token)
+    if user_id is None:
+        await websocket.close(code=1008)
+        return
+    conn = await manager.connect(websocket, user_id=user_id)
+    try:
+        while True:
+            data = await websocket.receive_json()
+            try:
+                action = data.get("action")
+                dream_ids = _ws_dream_ids(data.get("dreamIds"))
+            except (AttributeError, TypeError, ValueError):
+                conn.offer("error", {"type": "error", "message": "Expected {action, dreamIds: [...]}"})
+                continue
+            if action == "subscribe":
+                current = await asyncio.to_thread(_load_current_status, dream_ids, user_id)
+                for dream_id in dream_ids:
+                    if dream_id not in current:
+                        conn.offer("error", {"type": "error", "message": f"Dream {dream_id} not found", "dreamId": dream_id})
+                    elif not manager.subscribe(conn, dream_id, current[dream_id]):
+                        conn.offer("error", {"type": "error", "message": "Too many subscriptions", "dreamId": dream_id})
+                        break
+            elif action == "unsubscribe":
+                for dream_id in dream_ids:
+                    manager.unsubscribe(conn, dream_id)
+            else:
+                conn.offer("error", {"type": "error", "message": f"Unknown action {action!r}"})
+    except (WebSocketDisconnect, ValueError):
+        # ValueError: client sent a frame that isn't JSON
+        pass
+    finally:
+        manager.disconnect(websocket)
+
+
+# ---------- Server-Sent Events for dream status ----------
+SSE_HEARTBEAT_SECONDS = float(os.getenv("SSE_HEARTBEAT_SECONDS", "15"))
+SSE_RETRY_MS = 3000
+
+
+@app.get("/dreams/{dream_id}/status/stream")
+async def dream_status_stream(
+    dream_id: int,
+    last_event_id: Optional[str] = Header(None, alias="Last-Event-ID"),
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(auth.get_stream_user),
+):
+    """
+    Dream status as text/event-stream, fed by the same events as the
+    WebSockets. Works with a plain EventSource (pass ?token=) and through
+    proxies that block WebSocket upgrades.
+
+    Sends the latest status first, then each change, with `: ping` comments
+    every SSE_HEARTBEAT_SECONDS. The stream ends after "done"; reconnecting
+    with a Last-Event-ID at or past that event gets 204, which tells
+    EventSource to stop.
+    """
+    import json
+
+    current = await asyncio.to_thread(_current_status, db, [dream_id], current_user.id)
+    # Don't hold a pooled connection for the life of the stream
+    await asyncio.to_thread(db.close)
+    if dream_id not in current:
+        raise HTTPException(status_code=404, detail="Dream not found")
+
+    try:
+        resume_from = int(last_event_id) if last_event_id else None
+    except ValueError:
+        resume_from = None
+    state = manager.last_state(dream_id) or current[dream_id]
+    if resume_from is not None and state["status"] == "done" and state.get("eventId", 0) <= resume_from:
+        return Response(status_code=204)
+    # Skip the replay if the client already saw this event (database-derived states count as id 0)
+    replay = resume_from is None or state.get("eventId", 0) > resume_from
+
+    stream = manager.open_stream(user_id=current_user.id)
+    manager.subscribe(stream, dream_id, current[dream_id], replay=replay)
+
+    def sse(message: dict) -> str:
+        return f"id: {message.get('eventId', 0)}\ndata: {json.dumps(message)}\n\n"
+
+    async def events():
+        try:
+            yield f"retry: {SSE_RETRY_MS}\n\n"
+            while True:
+                messages = await stream.get(timeout=SSE_HEARTBEAT_SECONDS)
+                if stream.closed:
+                    return  # Dropped as a slow consumer
+                if not messages:
+                    yield ": ping\n\n"
+                    continue
+                for message in messages:
+                    yield sse(message)
+                if any(m.get("status") == "done" for m in messages):
+                    return
+        finally:
+            manager.close_stream(stream)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no",
+        },
+    )
 
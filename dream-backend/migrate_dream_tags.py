@@ -0,0 +1,52 @@
+"""
+Backfill script for the dream_symbols / dream_emotions tables.
+Run this once after upgrading (and again any time tag parsing changes) to
+rebuild the normalized rows and their indexes from existing interpretations.
+"""
+from database import Base, engine, SessionLocal
+import models
+import dream_tags
+
+BATCH_SIZE = 500
+
+
+def migrate():
+    """Create the tag tables/indexes if needed and rebuild rows for every interpretation"""
+    Base.metadata.create_all(bind=engine)
+    # create_all skips indexes on tables that already exist
+    for table in (models.DreamSymbol.__table__, models.DreamEmotion.__table__):
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
+    db = SessionLocal()
+    try:
+        last_id = 0
+        total = 0
+        while True:
+            rows = (
+                db.query(models.DreamInterpretation, models.Dream.user_id)
+                .join(models.Dream, models.DreamInterpretation.dream_id == models.Dream.id)
+                .filter(models.DreamInterpretation.id > last_id)
+                .order_by(models.DreamInterpretation.id.asc())
+                .limit(BATCH_SIZE)
+                .all()
+            )
+            if not rows:
+                break
+            for interp, user_id in rows:
+                dream_tags.replace_tags(db, interp.dream_id, user_id, interp.symbols, interp.emotions)
+            db.commit()
+            last_id = rows[-1][0].id
+            total += len(rows)
+            print(f"Processed {total} interpretations...")
+
+        print(f"\n✅ Backfill complete! {total} interpretations indexed")
+
+    except Exception as e:
+        print(f"❌ Backfill failed: {e}")
+        db.rollback()
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    migrate()
@@ -0,0 +1,23 @@
+"""
+Migration script to add the case-insensitive email index to the users table.
+Run this once on existing databases; new databases get it from create_all.
+"""
+from database import engine
+import models
+
+
+def migrate():
+    """Create ix_users_email_lower (lower(email)) if it doesn't exist"""
+    try:
+        for index in models.User.__table__.indexes:
+            if index.name == "ix_users_email_lower":
+                print("Adding lower(email) index...")
+                index.create(bind=engine, checkfirst=True)
+                print("✅ Added ix_users_email_lower")
+        print("\n✅ Migration complete!")
+    except Exception as e:
+        print(f"❌ Migration failed: {e}")
+
+
+if __name__ == "__main__":
+    migrate()
@@ -0,0 +1,48 @@
+"""
+Migration script to copy existing DALL-E images into the image store.
+Older interpretations point straight at OpenAI blob URLs, which expire; any
+that can still be downloaded are stored and rewritten to /api/images/<key>.
+Expired URLs are reported and left as they are.
+"""
+import asyncio
+
+from database import SessionLocal
+import http_client
+import image_store
+import models
+
+
+async def migrate():
+    """Download every still-reachable external image_url into the store"""
+    db = SessionLocal()
+    await http_client.startup()
+    try:
+        interps = (
+            db.query(models.DreamInterpretation)
+            .filter(
+                models.DreamInterpretation.image_url.isnot(None),
+                models.DreamInterpretation.image_url.like("http%"),
+            )
+            .all()
+        )
+        print(f"Found {len(interps)} interpretation(s) with external image URLs")
+        stored = failed = 0
+        for interp in interps:
+            try:
+                interp.image_url = await image_store.save_from_url(interp.image_url)
+                db.commit()
+                stored += 1
+            except Exception as e:
+                db.rollback()
+                failed += 1
+                print(f"⚠️ Dream {interp.dream_id}: could not download image ({e})")
+        print(f"\n✅ Migration complete! Stored {stored}, skipped {failed} (expired or unreachable)")
+    except Exception as e:
+        print(f"❌ Migration failed: {e}")
+    finally:
+        await http_client.shutdown()
+        db.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(migrate())
@@ -0,0 +1,112 @@
+"""
+Migration script for the dreams / dream_interpretations indexes.
+Removes duplicate interpretations (keeping the newest per dream), then adds:
+- ix_dreams_user_created on dreams (user_id, created_at)
+- unique ix_dream_interpretations_dream_id on dream_interpretations (dream_id)
+
+Run with --check to EXPLAIN the hot endpoint queries and exit non-zero if any
+of them would fall back to a sequential scan (suitable for CI).
+"""
+import sys
+
+from sqlalchemy import func, text
+
+from database import Base, engine, SessionLocal, IS_SQLITE
+import models
+
+
+def dedupe_interpretations(db):
+    """Delete all but the newest interpretation of each dream"""
+    newest = (
+        db.query(func.max(models.DreamInterpretation.id))
+        .group_by(models.DreamInterpretation.dream_id)
+        .subquery()
+    )
+    removed = (
+        db.query(models.DreamInterpretation)
+        .filter(models.DreamInterpretation.id.notin_(newest.select()))
+        .delete(synchronize_session=False)
+    )
+    db.commit()
+    return removed
+
+
+def migrate():
+    """Create missing tables/indexes after cleaning up duplicate interpretations"""
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        removed = dedupe_interpretations(db)
+        if removed:
+            print(f"🧹 Removed {removed} duplicate interpretation(s)")
+    finally:
+        db.close()
+
+    try:
+        for table in (models.Dream.__table__, models.DreamInterpretation.__table__):
+            for index in table.indexes:
+                print(f"Ensuring index {index.name}...")
+                index.create(bind=engine, checkfirst=True)
+        print("\n✅ Migration complete!")
+    except Exception as e:
+        print(f"❌ Migration failed: {e}")
+        raise
+
+
+def hot_queries(db):
+    """(name, query) pairs for the queries behind the busiest endpoints"""
+    return [
+        ("list_dreams", db.query(models.Dream)
+            .filter(models.Dream.user_id == 1)
+            .order_by(models.Dream.created_at.desc())),
+        ("interpretation_by_dream", db.query(models.DreamInterpretation)
+            .filter(models.DreamInterpretation.dream_id == 1)),
+        ("dream_by_id_and_owner", db.query(models.Dream)
+            .filter(models.Dream.id == 1, models.Dream.user_id == 1)),
+        ("analytics_top_symbols", db.query(models.DreamSymbol.symbol, func.count(models.DreamSymbol.id))
+            .filter(models.DreamSymbol.user_id == 1)
+            .group_by(models.DreamSymbol.symbol)),
+        ("user_by_email", db.query(models.User)
+            .filter(func.lower(models.User.email) == "someone@example.com")),
+    ]
+
+
+def _plan_uses_seq_scan(conn, sql: str) -> tuple[bool, str]:
+    if IS_SQLITE:
+        rows = conn.execute(text(f"EXPLAIN QUERY PLAN {sql}")).fetchall()
+        details = [row[-1] for row in rows]
+        # "SCAN dreams" = full table scan; "SEARCH ... USING INDEX" / "SCAN ... USING COVERING INDEX" are fine
+        bad = any(d.startswith("SCAN") and "INDEX" not in d for d in details)
+        return bad, "\n".join(details)
+    # Small tables make Postgres prefer seq scans; disable them to check an index plan exists at all
+    conn.execute(text("SET LOCAL enable_seqscan = off"))
+    rows = conn.execute(text(f"EXPLAIN {sql}")).fetchall()
+    plan = "\n".join(row[0] for row in rows)
+    return "Seq Scan" in plan, plan
+
+
+def check() -> bool:
+    """EXPLAIN every hot query; return False if any uses a sequential scan"""
+    db = SessionLocal()
+    ok = True
+    try:
+        with engine.begin() as conn:
+            for name, query in hot_queries(db):
+                sql = str(query.statement.compile(engine, compile_kwargs={"literal_binds": True}))
+                try:
+                    bad, plan = _plan_uses_seq_scan(conn, sql)
+                except Exception as e:
+                    bad, plan = True, f"EXPLAIN failed (run the migrations first?): {e}"
+                print(f"{'❌' if bad else '✅'} {name}")
+                if bad:
+                    ok = False
+                    print(f"   {plan.replace(chr(10), chr(10) + '   ')}")
+    finally:
+        db.close()
+    return ok
+
+
+if __name__ == "__main__":
+    if "--check" in sys.argv:
+        sys.exit(0 if check() else 1)
+    migrate()
@@ -0,0 +1,65 @@
+"""
+Migration script for per-interpretation pattern profile coverage.
+Adds dream_interpretations.pattern_folded_at and converts the old
+pattern_profiles.last_interpretation_id watermark into it, then drops the
+watermark column. Interpretation ids are not a reliable watermark:
+regenerating a dream deletes its interpretation and inserts a new one.
+"""
+from sqlalchemy import inspect, text
+
+from database import engine
+
+
+def migrate():
+    """Add pattern_folded_at, mark already-folded interpretations, drop the watermark"""
+    inspector = inspect(engine)
+    interpretation_columns = {c["name"] for c in inspector.get_columns("dream_interpretations")}
+    profile_columns = (
+        {c["name"] for c in inspector.get_columns("pattern_profiles")}
+        if inspector.has_table("pattern_profiles") else set()
+    )
+
+    with engine.connect() as conn:
+        try:
+            if "pattern_folded_at" not in interpretation_columns:
+                print("Adding pattern_folded_at column...")
+                conn.execute(text("ALTER TABLE dream_interpretations ADD COLUMN pattern_folded_at TIMESTAMP"))
+                conn.commit()
+                print("✅ Added pattern_folded_at column")
+
+            if "last_interpretation_id" in profile_columns:
+                print("Converting pattern profile watermarks...")
+                marked = conn.execute(text("""
+                    UPDATE dream_interpretations
+                    SET pattern_folded_at = (
+                        SELECT p.updated_at FROM pattern_profiles p
+                        JOIN dreams d ON d.user_id = p.user_id
+                        WHERE d.id = dream_interpretations.dream_id
+                    )
+                    WHERE pattern_folded_at IS NULL AND id <= (
+                        SELECT p.last_interpretation_id FROM pattern_profiles p
+                        JOIN dreams d ON d.user_id = p.user_id
+                        WHERE d.id = dream_interpretations.dream_id
+                    )
+                """)).rowcount
+                # Recount: regenerated dreams were counted once per interpretation
+                conn.execute(text("""
+                    UPDATE pattern_profiles SET dreams_analyzed = (
+                        SELECT COUNT(i.id) FROM dream_interpretations i
+                        JOIN dreams d ON d.id = i.dream_id
+                        WHERE d.user_id = pattern_profiles.user_id AND i.pattern_folded_at IS NOT NULL
+                    )
+                """))
+                conn.execute(text("ALTER TABLE pattern_profiles DROP COLUMN last_interpretation_id"))
+                conn.commit()
+                print(f"✅ Marked {marked} interpretation(s) as folded and dropped last_interpretation_id")
+
+            print("\n✅ Migration complete!")
+
+        except Exception as e:
+            print(f"❌ Migration failed: {e}")
+            conn.rollback()
+
+
+if __name__ == "__main__":
+    migrate()
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Text, ForeignKey, DateTime
+from sqlalchemy import Column, Integer, String, Text, ForeignKey, DateTime, Index, func
 from sqlalchemy.orm import relationship
 from datetime import datetime, timezone
 from database import Base
@@ -21,6 +21,11 @@ class User(Base):
 
     dreams = relationship("Dream", back_populates="user")
 
+    __table_args__ = (
+        # Case-insensitive email lookups (auth.get_user_by_email)
+        Index("ix_users_email_lower", func.lower(email)),
+    )
+
 
 class Dream(Base):
     __tablename__ = "dreams"
@@ -37,6 +42,11 @@ class Dream(Base):
         "DreamInterpretation", back_populates="dream", uselist=False
     )
 
+    __table_args__ = (
+        # Every per-user listing filters by user_id and orders by created_at
+        Index("ix_dreams_user_created", "user_id", "created_at"),
+    )
+
 
 class DreamInterpretation(Base):
     __tablename__ = "dream_interpretations"
@@ -47,7 +57,110 @@ class DreamInterpretation(Base):
     symbols = Column(Text)
     emotions = Column(Text)
     image_url = Column(String)
+    pattern_folded_at = Column(DateTime, nullable=True)  # When this was folded into the user's PatternProfile
 
-    dream_id = Column(Integer, ForeignKey("dreams.id"))
+    dream_id = Column(Integer, ForeignKey("dreams.id"), unique=True, index=True)  # One interpretation per dream
     dream = relationship("Dream", back_populates="interpretation")
 
+
+
+class Job(Base):
+    """Durable background job (see jobs.py)"""
+    __tablename__ = "jobs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    kind = Column(String, nullable=False)
+    payload = Column(Text, nullable=False, default="{}")  # JSON-encoded handler arguments
+    status = Column(String, nullable=False, default="queued")  # queued | running | done | failed
+    attempts = Column(Integer, nullable=False, default=0)
+    max_attempts = Column(Integer, nullable=False, default=3)
+    run_after = Column(DateTime, nullable=False, default=datetime.utcnow)
+    locked_at = Column(DateTime, nullable=True)  # Lease heartbeat while running
+    last_error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        Index("ix_jobs_status_run_after", "status", "run_after"),
+    )
+
+
+class EmailOutbox(Base):
+    """Queued outgoing email, delivered by the sender in email_service.py"""
+    __tablename__ = "email_outbox"
+
+    id = Column(Integer, primary_key=True, index=True)
+    to_email = Column(String, nullable=False)
+    template = Column(String, nullable=False)  # e.g. "otp"
+    params = Column(Text, nullable=True)  # JSON template parameters; cleared once sent
+    status = Column(String, nullable=False, default="queued")  # queued | sending | sent | failed
+    attempts = Column(Integer, nullable=False, default=0)
+    send_after = Column(DateTime, nullable=False, default=datetime.utcnow)
+    locked_at = Column(DateTime, nullable=True)
+    last_error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    sent_at = Column(DateTime, nullable=True)
+
+    __table_args__ = (
+        Index("ix_email_outbox_status_send_after", "status", "send_after"),
+    )
+
+
+class AnalysisCache(Base):
+    """Cached ai.analyze_dream results keyed by a hash of text, model and prompt version"""
+    __tablename__ = "analysis_cache"
+
+    key = Column(String, primary_key=True)
+    result = Column(Text, nullable=False)  # JSON-encoded analysis dict
+    created_at = Column(DateTime, default=datetime.utcnow)
+    expires_at = Column(DateTime, nullable=False, index=True)
+    last_accessed = Column(DateTime, default=datetime.utcnow, index=True)
+
+
+class SymbolExplanation(Base):
+    """Shared (user-independent) explanation of a dream symbol"""
+    __tablename__ = "symbol_explanations"
+
+    symbol = Column(String, primary_key=True)  # Normalized, see cache.normalize_symbol
+    explanation = Column(Text, nullable=False)  # JSON-encoded ai.explain_symbol result
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+
+class PatternProfile(Base):
+    """Persisted pattern analysis per user, updated incrementally as interpretations land"""
+    __tablename__ = "pattern_profiles"
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), unique=True, index=True, nullable=False)
+    analysis = Column(Text, nullable=False)  # JSON-encoded PatternAnalysisResponse fields
+    dreams_analyzed = Column(Integer, nullable=False, default=0)  # Interpretations folded in (see DreamInterpretation.pattern_folded_at)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+
+class DreamSymbol(Base):
+    """One symbol of a dream's interpretation (normalized from DreamInterpretation.symbols)"""
+    __tablename__ = "dream_symbols"
+
+    id = Column(Integer, primary_key=True, index=True)
+    dream_id = Column(Integer, ForeignKey("dreams.id"), nullable=False)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    symbol = Column(String, nullable=False)
+
+    __table_args__ = (
+        Index("ix_dream_symbols_user_symbol", "user_id", "symbol"),
+        Index("ix_dream_symbols_dream_id", "dream_id"),
+    )
+
+
+class DreamEmotion(Base):
+    """One emotion of a dream's interpretation (normalized from DreamInterpretation.emotions)"""
+    __tablename__ = "dream_emotions"
+
+    id = Column(Integer, primary_key=True, index=True)
+    dream_id = Column(Integer, ForeignKey("dreams.id"), nullable=False)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    emotion = Column(String, nullable=False)
+
+    __table_args__ = (
+        Index("ix_dream_emotions_user_emotion", "user_id", "emotion"),
+        Index("ix_dream_emotions_dream_id", "dream_id"),
+    )
@@ -101,6 +101,18 @@ class DreamOut(BaseModel):
         from_attributes = True
 
 
+class DreamSummaryOut(BaseModel):
+    """Lightweight projection for list views (GET /dreams?view=summary)"""
+    id: int
+    title: str
+    created_at: Optional[datetime]
+    has_image: bool
+    has_interpretation: bool
+    snippet: str
+    image_url: Optional[str] = None
+    preview: Optional[str] = None  # Start of the poetic narrative
+
+
 class DreamRewriteRequest(BaseModel):
     style: str
 
@@ -124,7 +136,19 @@ class AnalyticsSummary(BaseModel):
     dreams_with_images: int
     top_symbols: List[dict]
     top_emotions: List[dict]
-    dreams_with_dates: List[dict]  # Changed from dreams_by_day - contains created_at ISO strings
+    dreams_by_day: List[dict] = []  # [{day: YYYY-MM-DD in the requested timezone, count}]
+    dreams_with_dates: List[dict] = []  # Deprecated: per-dream timestamps, no longer populated
+
+
+class SymbolDreamsResponse(BaseModel):
+    symbol: str
+    dreams: List[dict]  # [{id, title, created_at}], newest first
+
+
+class SymbolCooccurrenceResponse(BaseModel):
+    symbol: str
+    symbols: List[dict]  # [{symbol, count}] other symbols in the same dreams
+    emotions: List[dict]  # [{emotion, count}] emotions in the same dreams
 
 
 class PatternAnalysisResponse(BaseModel):
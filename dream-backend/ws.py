@@ -1,39 +1,372 @@
-from typing import Dict, Set
+import asyncio
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Set
 from fastapi import WebSocket
 
+import cache
+
+Deliver = Callable[[int, dict], Awaitable[None]]
+
+# Per-socket outbound limits
+WS_MAX_PENDING = int(os.getenv("WS_MAX_PENDING", "32"))  # Queued (coalesced) messages before a client counts as slow
+WS_SEND_TIMEOUT = float(os.getenv("WS_SEND_TIMEOUT", "10"))
+WS_PING_INTERVAL = float(os.getenv("WS_PING_INTERVAL", "20"))  # Idle keepalive for proxies that drop quiet sockets
+WS_MAX_SUBSCRIPTIONS = int(os.getenv("WS_MAX_SUBSCRIPTIONS", "100"))  # Dreams one socket may watch
+WS_STATE_CACHE_SIZE = int(os.getenv("WS_STATE_CACHE_SIZE", "10000"))
+WS_STATE_TTL_SECONDS = float(os.getenv("WS_STATE_TTL_SECONDS", "3600"))
+
+
+class LocalBroker:
+    """
+    Default pub/sub backend: messages only reach sockets held by this process.
+    Fine for a single uvicorn worker.
+    """
+    async def start(self, deliver: Deliver) -> None:
+        self._deliver = deliver
+
+    async def stop(self) -> None:
+        pass
+
+    async def publish(self, dream_id: int, message: dict) -> None:
+        await self._deliver(dream_id, message)
+
+
+class PostgresBroker:
+    """
+    Cross-process pub/sub over Postgres LISTEN/NOTIFY.
+    Every worker LISTENs on one channel and delivers each notification to the
+    sockets it holds, so status events reach the client whichever worker ran
+    the job.
+    """
+    CHANNEL = "dream_status"
+    RECONNECT_DELAY = 2.0
+
+    def __init__(self, dsn: str) -> None:
+        self.dsn = dsn
+        self._listen_conn = None
+        self._notify_conn = None
+        self._notify_lock = threading.Lock()
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._reconnect_task: asyncio.Task | None = None
+
+    def _connect(self):
+        import psycopg2
+        import psycopg2.extensions
+        conn = psycopg2.connect(self.dsn)
+        conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+        return conn
+
+    async def start(self, deliver: Deliver) -> None:
+        self._deliver = deliver
+        self._loop = asyncio.get_running_loop()
+        await self._listen()
+
+    async def _listen(self) -> None:
+        conn = await asyncio.to_thread(self._connect)
+        conn.cursor().execute(f"LISTEN {self.CHANNEL}")
+        self._listen_conn = conn
+        self._loop.add_reader(conn.fileno(), self._on_readable)
+        print(f"📡 WebSocket broker listening on Postgres channel '{self.CHANNEL}'")
+
+    def _on_readable(self) -> None:
+        conn = self._listen_conn
+        try:
+            conn.poll()
+        except Exception as e:
+            print(f"⚠️ WebSocket broker connection lost: {e}")
+            self._drop_listener()
+            self._reconnect_task = self._loop.create_task(self._reconnect())
+            return
+        while conn.notifies:
+            notify = conn.notifies.pop(0)
+            try:
+                data = json.loads(notify.payload)
+            except ValueError:
+                continue
+            self._loop.create_task(self._deliver(data["dream_id"], data["message"]))
+
+    def _drop_listener(self) -> None:
+        if self._listen_conn is None:
+            return
+        try:
+            self._loop.remove_reader(self._listen_conn.fileno())
+        except Exception:
+            pass
+        try:
+            self._listen_conn.close()
+        except Exception:
+            pass
+        self._listen_conn = None
+
+    async def _reconnect(self) -> None:
+        while True:
+            await asyncio.sleep(self.RECONNECT_DELAY)
+            try:
+                await self._listen()
+                return
+            except Exception as e:
+                print(f"⚠️ WebSocket broker reconnect failed: {e}")
+
+    async def stop(self) -> None:
+        if self._reconnect_task is not None:
+            self._reconnect_task.cancel()
+        self._drop_listener()
+        with self._notify_lock:
+            if self._notify_conn is not None:
+                self._notify_conn.close()
+                self._notify_conn = None
+
+    def _notify(self, payload: str) -> None:
+        with self._notify_lock:
+            for attempt in range(2):
+                if self._notify_conn is None or self._notify_conn.closed:
+                    self._notify_conn = self._connect()
+                try:
+                    self._notify_conn.cursor().execute("SELECT pg_notify(%s, %s)", (self.CHANNEL, payload))
+                    return
+                except Exception:
+                    self._notify_conn = None
+                    if attempt:
+                        raise
+
+    async def publish(self, dream_id: int, message: dict) -> None:
+        payload = json.dumps({"dream_id": dream_id, "message": message})
+        await asyncio.to_thread(self._notify, payload)
+
+
+def create_broker():
+    """Pick the pub/sub backend from WS_BROKER (local | postgres)"""
+    kind = os.getenv("WS_BROKER", "local").lower()
+    if kind == "postgres":
+        from database import DATABASE_URL
+        dsn = os.getenv("WS_BROKER_URL") or DATABASE_URL
+        # psycopg2 wants a plain libpq URL, not SQLAlchemy's postgresql+driver:// form
+        return PostgresBroker(re.sub(r"^postgresql\+\w+://", "postgresql://", dsn))
+    return LocalBroker()
+
+
+_last_event_id = 0
+
+
+def _next_event_id() -> int:
+    """Increasing event id (microseconds since the epoch) so SSE clients can resume"""
+    global _last_event_id
+    _last_event_id = max(_last_event_id + 1, time.time_ns() // 1000)
+    return _last_event_id
+
+
+class _Subscriber:
+    """
+    Bounded outbound queue for one client.
+    Queued messages are keyed by dream id: only the latest status matters, so
+    a newer one replaces a still-queued older one.
+    """
+    def __init__(self, on_close: Callable[["_Subscriber"], None], user_id: int | None = None) -> None:
+        self.user_id = user_id
+        self.dream_ids: Set[int] = set()
+        self._on_close = on_close
+        self._pending: OrderedDict = OrderedDict()
+        self._ready = asyncio.Event()
+        self._closed = False
+
+    @property
+    def closed(self) -> bool:
+        return self._closed
+
+    def offer(self, key, message: dict) -> bool:
+        """Queue a message; False means the client is too far behind"""
+        if self._closed:
+            return False
+        if key not in self._pending and len(self._pending) >= WS_MAX_PENDING:
+            return False
+        self._pending[key] = message
+        self._ready.set()
+        return True
+
+    def detach(self) -> bool:
+        """Stop accepting messages and leave the manager; False if already closed"""
+        if self._closed:
+            return False
+        self._closed = True
+        self._pending.clear()
+        self._ready.set()
+        self._on_close(self)
+        return True
+
+    async def close(self, code: int = 1000) -> None:
+        self.detach()
+
+
+class _EventStream(_Subscriber):
+    """Subscriber drained by an SSE response generator instead of a writer task"""
+    async def get(self, timeout: float) -> list[dict]:
+        """Wait up to `timeout` for queued messages; [] on timeout or once closed"""
+        if not self._pending and not self._closed:
+            try:
+                await asyncio.wait_for(self._ready.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                return []
+        self._ready.clear()
+        messages = list(self._pending.values())
+        self._pending.clear()
+        return messages
+
+
+class _Connection(_Subscriber):
+    """
+    One client socket whose queue is drained by its own writer task, so a
+    slow client never delays delivery to anyone else.
+    """
+    def __init__(self, websocket: WebSocket, on_close: Callable[[_Subscriber], None], user_id: int | None = None) -> None:
+        super().__init__(on_close, user_id)
+        self.websocket = websocket
+        self._writer = asyncio.create_task(self._write_loop())
+
+    async def _send(self, message: dict) -> None:
+        await asyncio.wait_for(self.websocket.send_json(message), timeout=WS_SEND_TIMEOUT)
+
+    async def _write_loop(self) -> None:
+        try:
+            while True:
+                try:
+                    await asyncio.wait_for(self._ready.wait(), timeout=WS_PING_INTERVAL)
+                except asyncio.TimeoutError:
+                    await self._send({"type": "ping"})
+                    continue
+                self._ready.clear()
+                while self._pending:
+                    _, message = self._pending.popitem(last=False)
+                    await self._send(message)
+        except asyncio.CancelledError:
+            raise
+        except asyncio.TimeoutError:
+            print("⚠️ WebSocket send timed out, dropping slow client")
+            await self.close(code=1013)
+        except Exception:
+            # Client went away
+            await self.close()
+
+    async def close(self, code: int = 1000) -> None:
+        if not self.detach():
+            return
+        if self._writer is not asyncio.current_task():
+            self._writer.cancel()
+        try:
+            await self.websocket.close(code=code)
+        except Exception:
+            pass
+
 
 class ConnectionManager:
     """
-    Simple in-process WebSocket connection manager.
-    Tracks connections by dream_id so we can push targeted updates.
+    WebSocket connection manager.
+    Tracks subscriptions by dream_id so we can push targeted updates; one
+    connection may watch many dreams. Updates are published through a broker
+    so any worker process can deliver them, and every worker remembers the
+    latest status per dream to replay to late subscribers.
     """
-    def __init__(self) -> None:
-        self._connections: Dict[int, Set[WebSocket]] = {}
+    def __init__(self, broker=None) -> None:
+        self._connections: Dict[int, Set[_Subscriber]] = {}
+        self._sockets: Dict[WebSocket, _Connection] = {}
+        self._streams: Set[_EventStream] = set()
+        self._last_state = cache.LRUCache(WS_STATE_CACHE_SIZE, ttl_seconds=WS_STATE_TTL_SECONDS)
+        self._broker = broker or LocalBroker()
+        self._started = False
+
+    async def start(self) -> None:
+        await self._broker.start(self._deliver)
+        self._started = True
 
-    async def connect(self, dream_id: int, websocket: WebSocket) -> None:
+    async def stop(self) -> None:
+        self._started = False
+        await self._broker.stop()
+
+    async def connect(self, websocket: WebSocket, user_id: int | None = None) -> _Connection:
         await websocket.accept()
-        self._connections.setdefault(dream_id, set()).add(websocket)
+        conn = _Connection(websocket, on_close=self._remove, user_id=user_id)
+        self._sockets[websocket] = conn
+        return conn
+
+    def disconnect(self, websocket: WebSocket) -> None:
+        conn = self._sockets.get(websocket)
+        if conn is None:
+            return
+        self._remove(conn)
+        asyncio.ensure_future(conn.close())
+
+    def open_stream(self, user_id: int | None = None) -> _EventStream:
+        """Subscriber for an SSE response; release it with close_stream"""
+        stream = _EventStream(on_close=self._remove, user_id=user_id)
+        self._streams.add(stream)
+        return stream
 
-    def disconnect(self, dream_id: int, websocket: WebSocket) -> None:
+    def close_stream(self, stream: _EventStream) -> None:
+        stream.detach()
+
+    def _remove(self, conn: _Subscriber) -> None:
+        if isinstance(conn, _Connection):
+            self._sockets.pop(conn.websocket, None)
+        else:
+            self._streams.discard(conn)
+        for dream_id in list(conn.dream_ids):
+            self.unsubscribe(conn, dream_id)
+
+    def last_state(self, dream_id: int) -> dict | None:
+        """Latest status event this worker has seen for a dream"""
+        return self._last_state.get(dream_id)
+
+    def subscribe(self, conn: _Subscriber, dream_id: int, current: dict | None = None, replay: bool = True) -> bool:
+        """
+        Watch a dream on this connection and replay its latest status
+        (the last event seen, else `current`). False if the socket is full.
+        """
+        if dream_id not in conn.dream_ids and len(conn.dream_ids) >= WS_MAX_SUBSCRIPTIONS:
+            return False
+        conn.dream_ids.add(dream_id)
+        self._connections.setdefault(dream_id, set()).add(conn)
+        state = self._last_state.get(dream_id) or current
+        if replay and state is not None:
+            conn.offer(dream_id, state)
+        return True
+
+    def unsubscribe(self, conn: _Subscriber, dream_id: int) -> None:
+        conn.dream_ids.discard(dream_id)
         conns = self._connections.get(dream_id)
         if not conns:
             return
-        if websocket in conns:
-            conns.remove(websocket)
+        conns.discard(conn)
         if not conns:
             self._connections.pop(dream_id, None)
 
-    async def send_to(self, dream_id: int, message: dict) -> None:
-        conns = list(self._connections.get(dream_id, []))
-        for ws in conns:
-            try:
-                await ws.send_json(message)
-            except Exception:
-                # Drop broken connection
-                self.disconnect(dream_id, ws)
+    def stats(self) -> dict:
+        return {
+            "connections": len(self._sockets),
+            "user_connections": sum(1 for c in self._sockets.values() if c.user_id is not None),
+            "event_streams": len(self._streams),
+            "dreams_watched": len(self._connections),
+        }
 
+    async def send_to(self, dream_id: int, message: dict) -> None:
+        """Publish a status update for a dream to every worker's subscribers"""
+        message = {**message, "dreamId": dream_id, "eventId": _next_event_id()}
+        if not self._started:
+            await self._deliver(dream_id, message)
+            return
+        await self._broker.publish(dream_id, message)
 
-# Global manager instance (process-local)
-manager = ConnectionManager()
+    async def _deliver(self, dream_id: int, message: dict) -> None:
+        # Only enqueues; each connection's writer task does the actual send
+        self._last_state.set(dream_id, message)
+        for conn in list(self._connections.get(dream_id, [])):
+            if not conn.offer(dream_id, message):
+                print(f"⚠️ Status subscriber for dream {dream_id} is too slow, disconnecting")
+                asyncio.ensure_future(conn.close(code=1013))
 
 
+# Global manager instance (one per process; see create_broker for fan-out)
+manager = ConnectionManager(create_broker())
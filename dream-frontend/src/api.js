@@ -149,8 +149,11 @@ export function createDream(title, raw_text, generate_image = false) {
   return api.post("/dreams", { title, raw_text, generate_image });
 }
 
-export function fetchDreams() {
-  return api.get("/dreams");
+// params: { limit, cursor, view: "summary" | "full", q, tag: [...] } - next page
+// cursor is in the X-Next-Cursor response header; no params returns the whole journal
+export function fetchDreams(params = {}) {
+  // Repeated tags go out as tag=a&tag=b (FastAPI list query), not tag[]=a
+  return api.get("/dreams", { params, paramsSerializer: { indexes: null } });
 }
 
 export function fetchDream(id) {
@@ -173,13 +176,72 @@ export function rewriteDream(id, style) {
   return api.post(`/dreams/${id}/rewrite`, { style });
 }
 
+// Streaming rewrite: calls onToken(text) as tokens arrive, resolves with
+// the same shape as rewriteDream's response data ({ rewritten_narrative, style })
+export async function streamRewriteDream(id, style, onToken) {
+  const token = getToken();
+  const response = await fetch(`${API_URL}/dreams/${id}/rewrite/stream`, {
+    method: "POST",
+    headers: {
+      "Content-Type": "application/json",
+      ...(token ? { Authorization: `Bearer ${token}` } : {}),
+    },
+    body: JSON.stringify({ style }),
+  });
+  if (!response.ok || !response.body) {
+    let detail = `HTTP ${response.status}`;
+    try {
+      detail = (await response.json()).detail || detail;
+    } catch {
+      // Non-JSON error body
+    }
+    throw new Error(detail);
+  }
+
+  const reader = response.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = "";
+  while (true) {
+    const { value, done } = await reader.read();
+    if (done) break;
+    buffer += decoder.decode(value, { stream: true });
+    let boundary;
+    while ((boundary = buffer.indexOf("\n\n")) !== -1) {
+      const frame = buffer.slice(0, boundary);
+      buffer = buffer.slice(boundary + 2);
+      let event = "message";
+      let data = "";
+      frame.split("\n").forEach((line) => {
+        if (line.startsWith("event:")) event = line.slice(6).trim();
+        else if (line.startsWith("data:")) data += line.slice(5).trim();
+      });
+      if (!data) continue;
+      const payload = JSON.parse(data);
+      if (event === "token") onToken?.(payload.text);
+      else if (event === "done") return payload;
+      else if (event === "error") throw new Error(payload.detail);
+    }
+  }
+  throw new Error("Rewrite stream ended unexpectedly");
+}
+
+// Server-Sent Events fallback for dream status (for networks that block WebSockets).
+// EventSource can't send headers, so the token goes in the query string;
+// it reconnects and resumes on its own via Last-Event-ID.
+export function openDreamStatusStream(id) {
+  const token = getToken();
+  return new EventSource(`${API_URL}/dreams/${id}/status/stream?token=${encodeURIComponent(token || "")}`);
+}
+
 export function explainSymbol(symbol) {
   return api.get(`/symbols/${encodeURIComponent(symbol)}/explain`);
 }
 
 // Analytics
-export function fetchAnalytics() {
-  return api.get("/analytics/summary");
+export function fetchAnalytics(params = {}) {
+  // Day histogram is bucketed server-side in the browser's timezone
+  const tz = Intl.DateTimeFormat().resolvedOptions().timeZone || "UTC";
+  return api.get("/analytics/summary", { params: { tz, ...params } });
 }
 
 export function analyzePatterns() {
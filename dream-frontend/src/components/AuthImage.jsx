@@ -0,0 +1,40 @@
+// src/components/AuthImage.jsx
+import { useEffect, useState } from "react";
+import { getToken } from "../api";
+
+const API_URL = import.meta.env.VITE_API_URL || "http://localhost:8000";
+
+// <img> for dream images. Stored images (/api/images/<key>) need the bearer
+// token, which <img src> can't send, so they're fetched and shown as blob URLs.
+export default function AuthImage({ src, ...props }) {
+  const [blobUrl, setBlobUrl] = useState(null);
+  const isStored = src?.startsWith("/api/images/");
+
+  useEffect(() => {
+    if (!isStored) return;
+    let objectUrl = null;
+    let cancelled = false;
+    const token = getToken();
+    fetch(`${API_URL}${src}`, {
+      headers: token ? { Authorization: `Bearer ${token}` } : {},
+    })
+      .then((response) => {
+        if (!response.ok) throw new Error(`HTTP ${response.status}`);
+        return response.blob();
+      })
+      .then((blob) => {
+        if (cancelled) return;
+        objectUrl = URL.createObjectURL(blob);
+        setBlobUrl(objectUrl);
+      })
+      .catch((error) => console.error("Image failed to load:", error));
+    return () => {
+      cancelled = true;
+      if (objectUrl) URL.revokeObjectURL(objectUrl);
+    };
+  }, [src, isStored]);
+
+  if (!src) return null;
+  if (isStored && !blobUrl) return null;
+  return <img src={isStored ? blobUrl : src} {...props} />;
+}
@@ -1,6 +1,7 @@
 import { useEffect, useState } from "react";
-import { fetchDream, rewriteDream, explainSymbol, updateDream, deleteDream, regenerateDream } from "../api";
+import { fetchDream, rewriteDream, streamRewriteDream, explainSymbol, updateDream, deleteDream, regenerateDream } from "../api";
 import { useParams, useNavigate } from "react-router-dom";
+import AuthImage from "../components/AuthImage";
 
 const STYLES = [
   { value: "horror", label: "Horror", icon: "👻" },
@@ -104,8 +105,19 @@ export default function DreamDetail() {
     setRewriteError("");
     setRewritten(null);
     try {
-      const res = await rewriteDream(id, style);
-      setRewritten(res.data);
+      let streamed = "";
+      try {
+        const result = await streamRewriteDream(id, style, (text) => {
+          streamed += text;
+          setRewritten({ rewritten_narrative: streamed, style });
+        });
+        setRewritten(result);
+      } catch (streamErr) {
+        if (streamed) throw streamErr;
+        // Streaming unavailable (e.g. proxy buffering) - fall back to the regular endpoint
+        const res = await rewriteDream(id, style);
+        setRewritten(res.data);
+      }
     } catch (e) {
       const errorMsg = e.response?.data?.detail || e.message || "Failed to rewrite dream";
       // Provide helpful message for API key errors
@@ -624,7 +636,7 @@ export default function DreamDetail() {
                 <h4>Dream Image</h4>
               </div>
               <div className="dream-image-wrapper-creative">
-                <img
+                <AuthImage
                   src={dream.interpretation.image_url}
                   alt="Dream interpretation"
                   className="dream-image-creative"
@@ -662,7 +674,7 @@ export default function DreamDetail() {
           ))}
         </div>
 
-        {rewriting && (
+        {rewriting && !rewritten && (
           <div className="rewrite-loading">
             <p>Rewriting your dream as {STYLES.find(s => s.value === selectedStyle)?.label}...</p>
           </div>
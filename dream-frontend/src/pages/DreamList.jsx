@@ -1,7 +1,15 @@
 import { useEffect, useMemo, useState } from "react";
-import { fetchDreams, regenerateDream, getToken, setAuthToken } from "../api";
+import { fetchDreams, fetchAnalytics, regenerateDream, getToken, setAuthToken } from "../api";
 import { Link, useNavigate } from "react-router-dom";
 
+// Thumbnail width requested for dream cards (the server picks the nearest variant, ~2x for retina)
+const THUMB_WIDTH = 640;
+// Dreams per page (summary rows, keyset-paginated by the API)
+const PAGE_SIZE = 24;
+const SEARCH_DEBOUNCE_MS = 300;
+// Timeline and tag chips come from /analytics/summary instead of the loaded pages
+const TIMELINE_DAYS = 366;
+
 // Component to handle image loading with error state
 function DreamImage({ imageUrl, dreamId, fallbackEmoji = '💭' }) {
   const [imageError, setImageError] = useState(false);
@@ -24,17 +32,20 @@ function DreamImage({ imageUrl, dreamId, fallbackEmoji = '💭' }) {
       return;
     }
     
-    // If the URL is from Azure Blob Storage, fetch through proxy with auth
-    if (imageUrl.includes('blob.core.windows.net') || imageUrl.includes('oaidalle')) {
+    // Stored images (/api/images/<key>) and Azure Blob Storage URLs are fetched from the API with auth
+    const isStored = imageUrl.startsWith('/api/images/');
+    if (isStored || imageUrl.includes('blob.core.windows.net') || imageUrl.includes('oaidalle')) {
       const apiUrl = import.meta.env.VITE_API_URL || 'http://localhost:8000';
-      const encodedUrl = encodeURIComponent(imageUrl);
-      const proxyUrl = `${apiUrl}/api/images/proxy?url=${encodedUrl}`;
+      // Cards are ~300px wide: ask for a small WebP/AVIF thumbnail instead of the 1024px PNG
+      const proxyUrl = isStored
+        ? `${apiUrl}${imageUrl}?size=${THUMB_WIDTH}`
+        : `${apiUrl}/api/images/proxy?url=${encodeURIComponent(imageUrl)}`;
       
       // Fetch image as blob with authentication
       const token = getToken();
-      fetch(proxyUrl, {
-        headers: token ? { 'Authorization': `Bearer ${token}` } : {},
-      })
+      const headers = token ? { 'Authorization': `Bearer ${token}` } : {};
+      if (isStored) headers['Accept'] = 'image/avif,image/webp,*/*';
+      fetch(proxyUrl, { headers })
         .then(response => {
           if (!response.ok) {
             throw new Error(`HTTP ${response.status}`);
@@ -101,139 +112,125 @@ function DreamImage({ imageUrl, dreamId, fallbackEmoji = '💭' }) {
 
 export default function DreamList() {
   const [dreams, setDreams] = useState([]);
+  const [nextCursor, setNextCursor] = useState(null);
+  const [summary, setSummary] = useState(null);
   const [loading, setLoading] = useState(true);
+  const [loadingMore, setLoadingMore] = useState(false);
   const [search, setSearch] = useState("");
+  const [query, setQuery] = useState("");
   const [activeTags, setActiveTags] = useState(new Set());
   const [regenerating, setRegenerating] = useState(new Set());
   const navigate = useNavigate();
 
+  function handleLoadError(e) {
+    console.error("❌ Error loading dreams:", e);
+    console.error("❌ Error details:", e.response?.data);
+    if (e.response?.status === 401 || e.response?.status === 403) {
+      console.error("⚠️ Unauthorized - clearing token and redirecting to login");
+      // Clear tokens and redirect to login
+      setAuthToken(null);
+      localStorage.clear();
+      sessionStorage.clear();
+      window.location.href = "/login";
+      return true;
+    }
+    return false;
+  }
+
+  // One page of summary rows matching the current search and tags
+  async function loadPage(cursor = null) {
+    const params = { view: "summary", limit: PAGE_SIZE };
+    if (query) params.q = query;
+    if (activeTags.size > 0) params.tag = Array.from(activeTags);
+    if (cursor) params.cursor = cursor;
+    const res = await fetchDreams(params);
+    return { rows: res.data || [], next: res.headers["x-next-cursor"] || null };
+  }
+
+  async function loadSummary() {
+    try {
+      const res = await fetchAnalytics({ days: TIMELINE_DAYS });
+      setSummary(res.data);
+    } catch (e) {
+      console.error("Failed to load dream summary:", e);
+    }
+  }
+
+  useEffect(() => {
+    loadSummary();
+  }, []);
+
+  // Search is sent to the server once typing pauses
+  useEffect(() => {
+    const timer = setTimeout(() => setQuery(search.trim()), SEARCH_DEBOUNCE_MS);
+    return () => clearTimeout(timer);
+  }, [search]);
+
   useEffect(() => {
+    let cancelled = false;
     async function load() {
       try {
         console.log("📋 Loading dreams...");
-        const res = await fetchDreams();
-        console.log("✅ Dreams loaded:", res.data?.length || 0, "dreams");
-        setDreams(res.data || []);
+        const { rows, next } = await loadPage();
+        if (cancelled) return;
+        console.log("✅ Dreams loaded:", rows.length, "dreams");
+        setDreams(rows);
+        setNextCursor(next);
       } catch (e) {
-        console.error("❌ Error loading dreams:", e);
-        console.error("❌ Error details:", e.response?.data);
-        if (e.response?.status === 401 || e.response?.status === 403) {
-          console.error("⚠️ Unauthorized - clearing token and redirecting to login");
-          // Clear tokens and redirect to login
-          setAuthToken(null);
-          localStorage.clear();
-          sessionStorage.clear();
-          window.location.href = "/login";
-          return;
-        }
+        if (cancelled || handleLoadError(e)) return;
         setDreams([]); // Set empty array on error
+        setNextCursor(null);
       } finally {
-        setLoading(false);
+        if (!cancelled) setLoading(false);
       }
     }
     load();
-  }, []);
+    return () => {
+      cancelled = true;
+    };
+  }, [query, activeTags]);
 
-  function extractTags(d) {
-    const tags = new Set();
-    const sym = d?.interpretation?.symbols || "";
-    const emo = d?.interpretation?.emotions || "";
-    
-    // Handle symbols - could be JSON string or plain text
-    if (sym) {
-      try {
-        // Try to parse as JSON first
-        const parsed = JSON.parse(sym);
-        if (typeof parsed === 'object' && parsed !== null) {
-          // It's a JSON object, extract keys (symbol names)
-          Object.keys(parsed).forEach(key => {
-            const cleanKey = key.trim().toLowerCase();
-            if (cleanKey.length > 1) {
-              tags.add(cleanKey);
-            }
-          });
-        } else {
-          // Not an object, treat as string
-          throw new Error('Not an object');
-        }
-      } catch (e) {
-        // Not JSON, treat as plain text
-        sym
-          .split(/[,/|;]+|\n/g)
-          .map((s) => s.trim().toLowerCase())
-          .filter(Boolean)
-          .forEach((t) => {
-            if (t.length > 1) tags.add(t);
-          });
-      }
-    }
-    
-    // Handle emotions - should be comma-separated string
-    if (emo) {
-      emo
-        .split(/[,/|;]+|\n/g)
-        .map((s) => s.trim().toLowerCase())
-        .filter(Boolean)
-        .forEach((t) => {
-          if (t.length > 1) tags.add(t);
-        });
+  async function loadMore() {
+    if (!nextCursor || loadingMore) return;
+    setLoadingMore(true);
+    try {
+      const { rows, next } = await loadPage(nextCursor);
+      setDreams((prev) => [...prev, ...rows]);
+      setNextCursor(next);
+    } catch (e) {
+      handleLoadError(e);
+    } finally {
+      setLoadingMore(false);
     }
-    
-    return Array.from(tags);
   }
 
   const allTags = useMemo(() => {
-    const set = new HashSetShim();
-    dreams.forEach((d) => {
-      extractTags(d).forEach((t) => set.add(t));
-    });
-    return set.toArray().slice(0, 12).sort(); // Limit to 12 tags for better UI
-  }, [dreams]);
-
-  const filtered = useMemo(() => {
-    const q = search.trim().toLowerCase();
-    const required = Array.from(activeTags);
-    return dreams.filter((d) => {
-      const titleMatch = d.title.toLowerCase().includes(q);
-      const textMatch = d.raw_text?.toLowerCase().includes(q);
-      const narrative = (d?.interpretation?.poetic_narrative || "").toLowerCase();
-      const meaning = (d?.interpretation?.meaning || "").toLowerCase();
-      const symbols = (d?.interpretation?.symbols || "").toLowerCase();
-      const emotions = (d?.interpretation?.emotions || "").toLowerCase();
-      const anyText =
-        (q ? (titleMatch || textMatch || narrative.includes(q) || meaning.includes(q) || symbols.includes(q) || emotions.includes(q)) : true);
-      if (!anyText) return false;
-      if (required.length === 0) return true;
-      const tags = new Set(extractTags(d));
-      return required.every((t) => tags.has(t));
+    const tags = new Set();
+    const symbols = (summary?.top_symbols || []).map((s) => s.symbol);
+    const emotions = (summary?.top_emotions || []).map((e) => e.emotion);
+    [...symbols, ...emotions].forEach((t) => {
+      const tag = (t || "").trim().toLowerCase();
+      if (tag.length > 1) tags.add(tag);
     });
-  }, [dreams, search, activeTags]);
+    return Array.from(tags).slice(0, 12).sort(); // Limit to 12 tags for better UI
+  }, [summary]);
+
+  const totalDreams = summary?.total_dreams ?? dreams.length;
+  const isFiltered = query !== "" || activeTags.size > 0;
 
   // Calculate timeline data - MUST be before any early returns (React hooks rule)
   const timelineData = useMemo(() => {
-    if (!dreams || dreams.length === 0) return [];
+    const days = summary?.dreams_by_day || [];
     const months = {};
-    dreams.forEach(d => {
-      if (!d || !d.created_at) return;
-      try {
-        const date = new Date(d.created_at);
-        if (isNaN(date.getTime())) {
-          console.warn("Invalid date:", d.created_at);
-          return;
-        }
-        // Use UTC methods to avoid timezone issues
-        const year = date.getUTCFullYear();
-        const month = date.getUTCMonth() + 1; // getUTCMonth() returns 0-11
-        const monthKey = `${year}-${String(month).padStart(2, '0')}`;
-        months[monthKey] = (months[monthKey] || 0) + 1;
-      } catch (e) {
-        console.error("Error processing date:", e, d.created_at);
-      }
+    days.forEach(({ day, count }) => {
+      if (!day) return;
+      const monthKey = day.slice(0, 7); // YYYY-MM of a local YYYY-MM-DD day
+      months[monthKey] = (months[monthKey] || 0) + count;
     });
     return Object.entries(months)
       .sort()
       .map(([month, count]) => ({ month, count }));
-  }, [dreams]);
+  }, [summary]);
 
   function toggleTag(tag) {
     const next = new Set(activeTags);
@@ -366,30 +363,10 @@ export default function DreamList() {
     // Combine all text from the dream to find the best matching emoji
     const allText = [
       dream.title || '',
-      dream.raw_text || '',
-      dream?.interpretation?.symbols || '',
-      dream?.interpretation?.emotions || '',
-      dream?.interpretation?.poetic_narrative || '',
+      dream.snippet || '',
+      dream.preview || '',
     ].join(' ').toLowerCase();
 
-    // Extract tags from the dream
-    const tags = extractTags(dream);
-    
-    // Try to find emoji from tags first (most specific)
-    // Check all tags, not just the first one
-    // Only use moon if tag explicitly contains moon-related words
-    for (const tag of tags) {
-      const tagLower = tag.toLowerCase();
-      // Skip moon-related tags unless they're explicitly about moon
-      if (tagLower.includes('moon') || tagLower.includes('lunar') || tagLower.includes('night')) {
-        return '🌙';
-      }
-      const tagEmoji = getTagEmoji(tag);
-      if (tagEmoji !== '✨' && tagEmoji !== '🌙') {
-        return tagEmoji; // Return first non-default, non-moon emoji
-      }
-    }
-
     // Search for keywords in the combined text (prioritize more specific matches)
     const keywordMap = {
       // Water & Ocean
@@ -498,8 +475,9 @@ export default function DreamList() {
       await regenerateDream(dreamId);
       setTimeout(async () => {
         try {
-          const res = await fetchDreams();
-          setDreams(res.data);
+          const { rows, next } = await loadPage();
+          setDreams(rows);
+          setNextCursor(next);
         } catch (e) {
           console.error("Failed to reload dreams:", e);
         }
@@ -521,7 +499,7 @@ export default function DreamList() {
 
   if (loading) return <p>Loading your dreams...</p>;
 
-  if (dreams.length === 0)
+  if (dreams.length === 0 && !isFiltered && totalDreams === 0)
     return (
       <div className="dream-list-page">
         <div className="empty-state-creative">
@@ -601,7 +579,7 @@ export default function DreamList() {
             <span className="title-text">My Dreams</span>
           </h2>
           <p className="dream-list-subtitle">
-            {dreams.length} {dreams.length === 1 ? 'dream' : 'dreams'} captured in your journal
+            {totalDreams} {totalDreams === 1 ? 'dream' : 'dreams'} captured in your journal
           </p>
         </div>
       </div>
@@ -616,7 +594,7 @@ export default function DreamList() {
             <div className="timeline-header-text-new">
               <h3 className="timeline-title-new">Dream Timeline</h3>
               <span className="timeline-summary-new">
-                {dreams.length} {dreams.length === 1 ? 'dream' : 'dreams'} across {timelineData.length} {timelineData.length === 1 ? 'month' : 'months'}
+                {totalDreams} {totalDreams === 1 ? 'dream' : 'dreams'} across {timelineData.length} {timelineData.length === 1 ? 'month' : 'months'}
               </span>
             </div>
           </div>
@@ -713,7 +691,7 @@ export default function DreamList() {
         </div>
       )}
 
-      {filtered.length === 0 ? (
+      {dreams.length === 0 ? (
         <div className="no-dreams-creative">
           <div className="no-dreams-icon">🌌</div>
           <h3>No dreams match your filters</h3>
@@ -721,18 +699,17 @@ export default function DreamList() {
         </div>
       ) : (
         <div className="dream-grid-creative">
-          {filtered.map((d, idx) => {
-            const thumb = d?.interpretation?.image_url;
-            const preview = d?.interpretation?.poetic_narrative?.slice(0, 120);
-            const needsRegen = !d.interpretation || !thumb;
+          {dreams.map((d, idx) => {
+            const thumb = d.image_url;
+            const preview = d.preview;
+            const needsRegen = !d.has_interpretation || !thumb;
             const isRegenerating = regenerating.has(d.id);
             const dreamEmoji = getDreamEmoji(d);
             
             // Debug logging
             if (d.id && !thumb) {
               console.log('Dream', d.id, 'has no image_url:', {
-                hasInterpretation: !!d.interpretation,
-                interpretation: d.interpretation
+                hasInterpretation: d.has_interpretation,
               });
             }
             
@@ -740,7 +717,7 @@ export default function DreamList() {
               <div 
                 key={d.id} 
                 className="dream-card-wrapper-creative"
-                style={{ animationDelay: `${idx * 0.1}s` }}
+                style={{ animationDelay: `${(idx % PAGE_SIZE) * 0.1}s` }}
               >
                 <Link to={`/dreams/${d.id}`} className="dream-card-creative">
                   <div className="dream-card-image-wrapper">
@@ -766,16 +743,14 @@ export default function DreamList() {
           })}
         </div>
       )}
+
+      {nextCursor && dreams.length > 0 && (
+        <div className="load-more-creative">
+          <button className="load-more-button-creative" onClick={loadMore} disabled={loadingMore}>
+            {loadingMore ? "Loading…" : "Load more dreams"}
+          </button>
+        </div>
+      )}
     </div>
   );
 }
-
-// Small helper to use Set but keep stable array yield for memoization
-class HashSetShim {
-  constructor() {
-    this._set = new Set();
-  }
-  add(v) { this._set.add(v); }
-  toArray() { return Array.from(this._set); }
-}
-
@@ -1,6 +1,7 @@
 import { useEffect, useRef, useState } from "react";
-import { createDream, fetchDream } from "../api";
+import { createDream, fetchDream, getToken, openDreamStatusStream } from "../api";
 import { useNavigate } from "react-router-dom";
+import AuthImage from "../components/AuthImage";
 
 export default function NewDream() {
   const [title, setTitle] = useState("");
@@ -10,6 +11,7 @@ export default function NewDream() {
   const [loading, setLoading] = useState(false);
   const [status, setStatus] = useState("");
   const wsRef = useRef(null);
+  const sseRef = useRef(null);
   const navigate = useNavigate();
 
   async function handleSubmit(e) {
@@ -50,68 +52,68 @@ export default function NewDream() {
         wsHost = wsHost.replace(/:80$/, "").replace(/:443$/, "");
       }
       
-      const wsUrl = `${wsProtocol}//${wsHost}/ws/dream-status/${created.id}`;
-      console.log("🔌 Connecting to WebSocket:", wsUrl);
+      // One authenticated socket per user; subscribe to the dream we just created
+      const wsUrl = `${wsProtocol}//${wsHost}/ws/status?token=${encodeURIComponent(getToken() || "")}`;
+      console.log("🔌 Connecting to WebSocket:", `${wsProtocol}//${wsHost}/ws/status`);
       console.log("🔍 API URL:", apiUrl);
       console.log("🔍 Page protocol:", window.location.protocol);
       console.log("🔍 Using protocol:", wsProtocol);
       
-      try {
-        wsRef.current = new WebSocket(wsUrl);
-      } catch (error) {
-        console.error("❌ WebSocket connection error:", error);
-        // Continue with polling fallback
-      }
-      
-      // Fallback: poll for completion if WebSocket fails
-      let pollCount = 0;
-      const maxPolls = 20; // 20 * 3 seconds = 60 seconds max
-      const pollInterval = setInterval(async () => {
-        pollCount++;
-        if (pollCount > maxPolls) {
-          clearInterval(pollInterval);
-          setStatus("Taking longer than expected... Please refresh the page.");
-          return;
+      let finished = false;
+      const handleStatus = async (payload) => {
+        if (finished || payload?.dreamId !== created.id) return;
+        if (payload?.message) {
+          setStatus(payload.message);
         }
-        try {
-          const fresh = await fetchDream(created.id);
-          if (fresh.data?.interpretation) {
-            setResult(fresh.data);
-            setStatus("");
-            setLoading(false);
-            clearInterval(pollInterval);
-            // Check if there's an error message in the interpretation
-            if (fresh.data.interpretation.meaning && fresh.data.interpretation.meaning.includes("⚠️")) {
-              setStatus("⚠️ " + fresh.data.interpretation.meaning);
-            }
+        if (payload?.status === "done") {
+          finished = true;
+          if (wsRef.current) {
+            try { wsRef.current.close(); } catch {}
           }
-        } catch (e) {
-          console.error("Polling error:", e);
-          // Keep polling
-        }
-      }, 3000); // Poll every 3 seconds
-      
-      wsRef.current.onmessage = async (msg) => {
-        try {
-          const payload = JSON.parse(msg.data);
-          if (payload?.message) {
-            setStatus(payload.message);
+          if (sseRef.current) {
+            sseRef.current.close();
+            sseRef.current = null;
           }
-          if (payload?.status === "done") {
-            clearInterval(pollInterval);
-            const fresh = await fetchDream(created.id);
-            setResult(fresh.data);
-            setStatus("");
-            setLoading(false);
+          const fresh = await fetchDream(created.id);
+          setResult(fresh.data);
+          setStatus("");
+          setLoading(false);
+          // Check if there's an error message in the interpretation
+          const meaning = fresh.data?.interpretation?.meaning;
+          if (meaning && meaning.includes("⚠️")) {
+            setStatus("⚠️ " + meaning);
           }
-        } catch {}
-      };
-      wsRef.current.onclose = () => {
-        // Polling will continue as fallback
+        }
       };
-      wsRef.current.onerror = () => {
-        // Polling will continue as fallback
+
+      // Fallback: Server-Sent Events if the WebSocket can't connect or drops
+      const startEventStream = () => {
+        if (finished || sseRef.current) return;
+        console.log("📡 Falling back to status event stream");
+        sseRef.current = openDreamStatusStream(created.id);
+        sseRef.current.onmessage = (msg) => {
+          try {
+            handleStatus(JSON.parse(msg.data));
+          } catch {}
+        };
       };
+
+      try {
+        wsRef.current = new WebSocket(wsUrl);
+        wsRef.current.onopen = () => {
+          wsRef.current.send(JSON.stringify({ action: "subscribe", dreamIds: [created.id] }));
+        };
+        wsRef.current.onmessage = (msg) => {
+          try {
+            handleStatus(JSON.parse(msg.data));
+          } catch {}
+        };
+        wsRef.current.onclose = startEventStream;
+        wsRef.current.onerror = startEventStream;
+      } catch (error) {
+        console.error("❌ WebSocket connection error:", error);
+        startEventStream();
+      }
     } catch (e) {
       console.error("Dream creation error:", e);
       const errorMessage = e.response?.data?.detail || e.message || "Something went wrong. Try again.";
@@ -133,6 +135,7 @@ export default function NewDream() {
       if (wsRef.current) {
         try { wsRef.current.close(); } catch {}
       }
+      if (sseRef.current) sseRef.current.close();
     };
   }, []);
 
@@ -250,7 +253,7 @@ export default function NewDream() {
           {result.interpretation.image_url && (
             <>
               <h4>Dream image</h4>
-              <img
+              <AuthImage
                 src={result.interpretation.image_url}
                 alt="Dream interpretation"
                 className="dream-image"